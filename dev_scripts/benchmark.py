@@ -0,0 +1,427 @@
+"""
+Benchmarks the parse → resolve → fix → validate → post_transform pipeline of the SQL
+Bifrosts, on a corpus of queries that ranges from trivial to heavy, in every dialect.
+
+For each query and dialect, it reports the median time of each stage, the peak memory
+that each stage allocates, and the throughput of whole traversals through
+``Bifrost.validation_only``. The results are compared against a stored baseline, so
+that regressions in traversal latency show up in review:
+
+    python dev_scripts/benchmark.py                   # compare with the baseline
+    python dev_scripts/benchmark.py --save-baseline   # record a new baseline
+    python dev_scripts/benchmark.py --max-regression 25 --filter joins
+
+Timings depend on the machine, so only compare against a baseline that was recorded
+on the same one. The stages are timed by running the steps of
+``Bifrost._validate_llm_output`` and of the dialect's tree producer one at a time, so
+keep them in step with those if they change.
+"""
+
+import argparse
+import gc
+import json
+import logging
+import platform
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Optional, Sequence
+
+import structlog
+from lark import ParseTree
+from lark.exceptions import UnexpectedInput, VisitError
+
+from heimdallm.bifrosts.sql.bifrost import Bifrost
+from heimdallm.bifrosts.sql.common import (
+    ANY_JOIN,
+    FqColumn,
+    JoinCondition,
+    ParameterizedConstraint,
+)
+from heimdallm.bifrosts.sql.exc import BaseException as SQLException
+from heimdallm.bifrosts.sql.mysql.select.bifrost import Bifrost as MySQLBifrost
+from heimdallm.bifrosts.sql.postgres.select.bifrost import Bifrost as PostgresBifrost
+from heimdallm.bifrosts.sql.sqlite.select.bifrost import Bifrost as SQLiteBifrost
+from heimdallm.bifrosts.sql.validator import ConstraintValidator
+from heimdallm.bifrosts.sql.visitors.ambiguity import AmbiguityResolver
+from heimdallm.bifrosts.sql.visitors.index import TreeIndex
+from heimdallm.bifrosts.sql.visitors import lalr
+from heimdallm.bifrosts.sql.visitors.lalr import DeferToEarley, LALRNormalizer
+from heimdallm.context import TraverseContext
+
+THIS_DIR = Path(__file__).parent
+BASELINE = THIS_DIR / "benchmark_baseline.json"
+QUERY_DIR = THIS_DIR.parent / "heimdallm/bifrosts/sql/tests/sql/select/queries"
+
+DIALECTS: dict[str, type[Bifrost]] = {
+    "sqlite": SQLiteBifrost,
+    "mysql": MySQLBifrost,
+    "postgres": PostgresBifrost,
+}
+STAGES = ("parse", "resolve", "fix", "validate", "post_transform")
+
+
+class BenchmarkConstraints(ConstraintValidator):
+    """allows any table, column, join and function, but requires a limit, so that the
+    autofix has something to do"""
+
+    def requester_identities(self) -> Sequence[ParameterizedConstraint]:
+        return []
+
+    def parameterized_constraints(self) -> Sequence[ParameterizedConstraint]:
+        return []
+
+    def select_column_allowed(self, column: FqColumn) -> bool:
+        return True
+
+    def allowed_joins(self) -> Sequence[JoinCondition]:
+        return [ANY_JOIN]
+
+    def max_limit(self) -> Optional[int]:
+        return 100
+
+    def can_use_function(self, function: str) -> bool:
+        return True
+
+
+def _joins(n: int) -> str:
+    joins = "\n".join(
+        f"JOIN t{i} ON t{i - 1}.id = t{i}.parent_id" for i in range(1, n + 1)
+    )
+    return f"SELECT t0.id, t{n}.title\nFROM t0\n{joins}\nWHERE t0.id = :id\nLIMIT 20"
+
+
+def _ctes(n: int) -> str:
+    ctes = ",\n".join(
+        f"c{i} AS (SELECT p.id, p.total FROM {'t0' if i == 0 else f'c{i - 1}'} AS p "
+        f"WHERE p.total > {i})"
+        for i in range(n)
+    )
+    return f"WITH {ctes}\nSELECT c.id FROM c{n - 1} AS c ORDER BY c.total DESC LIMIT 10"
+
+
+def _subqueries(depth: int) -> str:
+    query = "SELECT s0.id FROM t0 AS s0 WHERE s0.enabled = 1"
+    for i in range(1, depth + 1):
+        query = (
+            f"SELECT s{i}.id FROM t{i} AS s{i} WHERE s{i}.score > 2 "
+            f"AND s{i}.ref_id IN ({query})"
+        )
+    return query + " LIMIT 10"
+
+
+def _in_list(n: int) -> str:
+    values = ", ".join(str(i * 7) for i in range(n))
+    return f"SELECT t.id, t.title FROM t WHERE t.id IN ({values}) LIMIT 50"
+
+
+def _sample(name: str) -> str:
+    """a sample query from the test suite, without its results hash"""
+    sql = (QUERY_DIR / name).read_text()
+    return re.sub(r"^/\*.*?\*/\s*", "", sql)
+
+
+def corpus() -> dict[str, str]:
+    """The queries to benchmark, by name, from the lightest to the heaviest."""
+    queries = {
+        "simple": "SELECT t.id FROM t WHERE t.id = :id LIMIT 10",
+        "aggregate": (
+            "SELECT t.kind, COUNT(*) AS n, MAX(t.total) AS top FROM t "
+            "WHERE t.created > '2023-01-01' GROUP BY t.kind HAVING COUNT(t.id) > 2 "
+            "ORDER BY n DESC"
+        ),
+        # multi-operator arithmetic is left to the Earley parser
+        "arithmetic": (
+            "SELECT t.id, t.price * t.quantity - t.discount AS net FROM t "
+            "WHERE t.id = :id LIMIT 10"
+        ),
+    }
+    for path in sorted(QUERY_DIR.glob("q*.sql")):
+        queries[path.stem] = _sample(path.name)
+    queries.update(
+        {
+            "joins_4": _joins(4),
+            "joins_12": _joins(12),
+            "ctes_3": _ctes(3),
+            "ctes_8": _ctes(8),
+            "subqueries_3": _subqueries(3),
+            "subqueries_8": _subqueries(8),
+            "in_list_100": _in_list(100),
+            "in_list_1000": _in_list(1000),
+        }
+    )
+    return queries
+
+
+class Stages:
+    """The stages of one validation of a query, which can be run one at a time."""
+
+    def __init__(self, bifrost: Bifrost, validator: ConstraintValidator, query: str):
+        self.bifrost = bifrost
+        self.validator = validator
+        self.query = query
+        self.ctx = TraverseContext()
+        self.ctx.untrusted_llm_output = query
+        self.lalr = _fast_path_accepts(bifrost, query)
+
+    def parse(self) -> Any:
+        if self.lalr:
+            assert self.bifrost.fast_grammar is not None
+            return lalr.parse(self.bifrost.fast_grammar, self.query)
+        return self.bifrost.grammar.parse(self.query)
+
+    def resolve(self, tree: Any) -> ParseTree:
+        keywords = self.bifrost.reserved_keywords()
+        if self.lalr:
+            tree = LALRNormalizer(reserved_keywords=keywords).transform(tree)
+        else:
+            try:
+                tree = AmbiguityResolver(
+                    ctx=self.ctx, reserved_keywords=keywords
+                ).transform(tree)
+            except VisitError as e:
+                if isinstance(e.orig_exc, SQLException):
+                    raise e.orig_exc
+                raise e
+        TreeIndex(tree)
+        return tree
+
+    def fix(self, tree: ParseTree) -> tuple[str, ParseTree]:
+        return self.validator.fix_tree(
+            bifrost=self.bifrost,
+            grammar=self.bifrost.grammar,
+            ctx=self.ctx,
+            tree=tree,
+        )
+
+    def validate(self, tree: ParseTree) -> None:
+        self.validator.validate(bifrost=self.bifrost, ctx=self.ctx, tree=tree)
+
+    def post_transform(self, query: str, tree: ParseTree) -> str:
+        return self.bifrost.post_transform(query, tree)
+
+    def run(self, measure: Callable[[str, Callable[[], Any]], Any]) -> None:
+        """Runs every stage once, through ``measure``, which is given the name of the
+        stage and a function that runs it, and returns what the function returns."""
+        raw = measure("parse", self.parse)
+        tree = measure("resolve", lambda: self.resolve(raw))
+        query, tree = measure("fix", lambda: self.fix(tree))
+        measure("validate", lambda: self.validate(tree))
+        measure("post_transform", lambda: self.post_transform(query, tree))
+
+    def timings(self) -> dict[str, int]:
+        """The nanoseconds that each stage takes."""
+        timings = {}
+
+        def measure(stage: str, run: Callable[[], Any]) -> Any:
+            start = time.perf_counter_ns()
+            result = run()
+            timings[stage] = time.perf_counter_ns() - start
+            return result
+
+        self.run(measure)
+        return timings
+
+    def allocations(self) -> dict[str, int]:
+        """The peak bytes that each stage allocates, over what was already allocated
+        when it started."""
+        peaks = {}
+
+        def measure(stage: str, run: Callable[[], Any]) -> Any:
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            result = run()
+            _, peak = tracemalloc.get_traced_memory()
+            peaks[stage] = peak - before
+            return result
+
+        tracemalloc.start()
+        try:
+            self.run(measure)
+        finally:
+            tracemalloc.stop()
+        return peaks
+
+
+def _fast_path_accepts(bifrost: Bifrost, query: str) -> bool:
+    """whether the bifrost's LALR fast path parses the query, or defers to Earley"""
+    if bifrost.fast_grammar is None:
+        return False
+    try:
+        tree = lalr.parse(bifrost.fast_grammar, query)
+        LALRNormalizer(reserved_keywords=bifrost.reserved_keywords()).transform(tree)
+    except (UnexpectedInput, DeferToEarley):
+        return False
+    except VisitError as e:
+        if isinstance(e.orig_exc, DeferToEarley):
+            return False
+        raise e
+    return True
+
+
+def bench(
+    dialect: str, name: str, query: str, repeat: int, warmup: int
+) -> Optional[dict[str, Any]]:
+    """Benchmarks one query in one dialect, or returns None if the dialect doesn't
+    accept the query."""
+    validator = BenchmarkConstraints()
+    bifrost = DIALECTS[dialect].validation_only(validator)
+    try:
+        bifrost.traverse(query)
+    except SQLException:
+        return None
+
+    stages = Stages(bifrost, validator, query)
+    for _ in range(warmup):
+        stages.timings()
+
+    samples: dict[str, list[int]] = {stage: [] for stage in STAGES}
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            for stage, ns in stages.timings().items():
+                samples[stage].append(ns)
+
+        # whole traversals, including unwrapping and the bifrost's own bookkeeping
+        traversals = []
+        for _ in range(repeat):
+            start = time.perf_counter_ns()
+            bifrost.traverse(query)
+            traversals.append(time.perf_counter_ns() - start)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    ms = {stage: statistics.median(ns) / 1e6 for stage, ns in samples.items()}
+    traverse_ms = statistics.median(traversals) / 1e6
+    return {
+        "lalr": stages.lalr,
+        "ms": ms,
+        "traverse_ms": traverse_ms,
+        "per_second": 1000 / traverse_ms,
+        "peak_kib": {
+            stage: peak / 1024 for stage, peak in stages.allocations().items()
+        },
+    }
+
+
+def _compare(current: float, baseline: Optional[float]) -> str:
+    if not baseline:
+        return ""
+    return f"{(current - baseline) / baseline * 100:+.0f}%"
+
+
+def report(
+    results: dict[str, dict[str, Any]],
+    baseline: dict[str, dict[str, Any]],
+    max_regression: Optional[float],
+) -> list[str]:
+    """Prints the results, and returns the keys of those that regressed by more than
+    ``max_regression`` percent."""
+    header = (
+        f"{'query':<24}{'path':<7}"
+        + "".join(f"{stage:>15}" for stage in STAGES)
+        + f"{'traverse':>11}{'/s':>8}{'peak KiB':>10}{'vs base':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+
+    regressions = []
+    for key, result in results.items():
+        if result is None:
+            print(f"{key:<24}  not accepted by the dialect's grammar")
+            continue
+        base = baseline.get(key)
+        base_ms = base["traverse_ms"] if base else None
+        delta = _compare(result["traverse_ms"], base_ms)
+        peak = max(result["peak_kib"].values())
+        print(
+            f"{key:<24}{'lalr' if result['lalr'] else 'earley':<7}"
+            + "".join(f"{result['ms'][stage]:>13.3f}ms" for stage in STAGES)
+            + f"{result['traverse_ms']:>9.2f}ms{result['per_second']:>8.0f}"
+            + f"{peak:>10.0f}{delta:>9}"
+        )
+        if (
+            max_regression is not None
+            and base_ms
+            and result["traverse_ms"] > base_ms * (1 + max_regression / 100)
+        ):
+            regressions.append(key)
+    return regressions
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--dialect", choices=list(DIALECTS), action="append")
+    parser.add_argument("--filter", help="only the queries whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store the results as the new baseline",
+    )
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        help="exit with an error if a traversal is this many percent slower than the "
+        "baseline",
+    )
+    parser.add_argument("--json", type=Path, help="also write the results here")
+    args = parser.parse_args(argv)
+
+    # logging every stage of every traversal would dominate the timings
+    structlog.configure(
+        wrapper_class=structlog.make_filtering_bound_logger(logging.CRITICAL)
+    )
+
+    queries = {
+        name: query
+        for name, query in corpus().items()
+        if args.filter is None or args.filter in name
+    }
+    results: dict[str, Any] = {}
+    for dialect in args.dialect or list(DIALECTS):
+        for name, query in queries.items():
+            results[f"{dialect}/{name}"] = bench(
+                dialect, name, query, repeat=args.repeat, warmup=args.warmup
+            )
+
+    baseline: dict[str, Any] = {}
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())["results"]
+
+    regressions = report(results, baseline, args.max_regression)
+
+    document = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "repeat": args.repeat,
+        },
+        "results": {key: result for key, result in results.items() if result},
+    }
+    if args.json:
+        args.json.write_text(json.dumps(document, indent=2, sort_keys=True) + "\n")
+    if args.save_baseline:
+        if args.filter or args.dialect:
+            # keep the baseline of everything that wasn't run
+            document["results"] = {**baseline, **document["results"]}
+        args.baseline.write_text(json.dumps(document, indent=2, sort_keys=True) + "\n")
+        print(f"\nsaved the baseline to {args.baseline}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regressed by more than {args.max_regression}%:")
+        for key in regressions:
+            print(f"  {key}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,34 @@
-from typing import TYPE_CHECKING, Any, Callable, Sequence, Union
+import asyncio
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextlib import ExitStack, contextmanager, nullcontext
+from functools import partial
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    ContextManager,
+    Generator,
+    Iterable,
+    Iterator,
+    Mapping,
+    Optional,
+    Sequence,
+    Union,
+)
 
 import structlog
 from lark import Lark, ParseTree
 
+from heimdallm.cache import LRUCache
 from heimdallm.context import TraverseContext
+from heimdallm.instrumentation import Instrumentation, Stage
+from heimdallm.llm import AsyncLLMIntegration
 
 if TYPE_CHECKING:
     import heimdallm.constraints
@@ -12,6 +37,22 @@ if TYPE_CHECKING:
 
 LOG = structlog.get_logger(__name__)
 
+# the stage of an uninstrumented Bifrost, which is reusable
+_UNINSTRUMENTED = nullcontext()
+
+
+def _rebind_exception(e: Exception, ctx: Optional[TraverseContext]) -> Exception:
+    """Copies an exception for reuse in a different traversal. The copy has the same
+    type and attributes, but carries the new traversal context and none of the old
+    traceback. We can't use :func:`copy.copy`, because our exceptions take keyword-only
+    arguments in their constructors."""
+    clone = e.__class__.__new__(e.__class__)
+    clone.__dict__.update(e.__dict__)
+    clone.args = e.args
+    if hasattr(clone, "ctx"):
+        setattr(clone, "ctx", ctx)
+    return clone
+
 
 class Bifrost:
     """The Bifrost is the bridge from the outside world to your secure systems. It is
@@ -25,28 +66,61 @@ class Bifrost:
         and unwrap the untrusted LLM output.
     :param grammar: The grammar that defines the structured output that we expect from
         the LLM.
-    :param tree_producer: A callable that takes a grammar and the untrusted input and
-        returns a parse tree. Using a callback allows us to do Bifrost-specific parsing,
-        for example, to collapse ambiguous parse trees into a single parse tree.
+    :param tree_producer: A callable that takes a grammar, the untrusted input, and the
+        traversal context, and returns a parse tree. Using a callback allows us to do
+        Bifrost-specific parsing, for example, to collapse ambiguous parse trees into a
+        single parse tree.
     :param constraint_validators: A sequence of constraint validators that will be used
         to validate the parse tree returned by the ``tree_producer``. Only one validator
         needs to succeed for validation to pass.
+    :param validation_cache: An optional cache of validation results, keyed on the
+        unwrapped LLM output and the :meth:`fingerprints
+        <heimdallm.constraints.ConstraintValidator.fingerprint>` of the constraint
+        validators. A hit skips parsing and validation entirely, returning the trusted
+        output or re-raising the original exception. The cache may be shared between
+        Bifrosts. Caching is opt-in for each validator: if any of the validators has
+        no fingerprint, nothing is cached.
+    :param instrumentation: An optional :class:`Instrumentation
+        <heimdallm.instrumentation.Instrumentation>`, or sequence of them, to time and
+        observe each :class:`stage <heimdallm.instrumentation.Stage>` of every
+        traversal.
+
+    Every traversal gets its own :class:`TraverseContext
+    <heimdallm.context.TraverseContext>`, which is passed explicitly through each step
+    of the traversal, so a single Bifrost can be shared by many threads at once without
+    any locking.
     """
 
+    #: The name of the Bifrost's output format, like the SQL dialect, which labels the
+    #: stages of its traversals for :attr:`instrumentation`.
+    dialect = "generic"
+
     def __init__(
         self,
         *,
         llm: "LLMIntegration",
         prompt_envelope: "heimdallm.envelope.PromptEnvelope",
         grammar: Lark,
-        tree_producer: Callable[[Lark, str], ParseTree],
+        tree_producer: Callable[[Lark, str, TraverseContext], ParseTree],
         constraint_validators: Sequence["heimdallm.constraints.ConstraintValidator"],
+        validation_cache: Optional[LRUCache] = None,
+        instrumentation: Union[Instrumentation, Sequence[Instrumentation], None] = None,
     ):
         self.llm = llm
         self.prompt_envelope = prompt_envelope
         self.grammar = grammar
         self.tree_producer = tree_producer
         self.constraint_validators = constraint_validators
+        self.validation_cache = validation_cache
+        if instrumentation is None:
+            instrumentation = ()
+        elif isinstance(instrumentation, Instrumentation):
+            instrumentation = (instrumentation,)
+        self.instrumentation = tuple(instrumentation)
+        self._validator_fingerprints: Optional[tuple[Optional[str], ...]] = None
+        # the context of the most recent traversal. this is only a convenience for
+        # debugging single-threaded usage. with concurrent traversals, use the `ctx`
+        # attached to the raised exception instead.
         self.ctx = TraverseContext()
 
     @classmethod
@@ -81,36 +155,429 @@ class Bifrost:
         :return: The trusted LLM output.
         """
 
-        self.ctx.untrusted_human_input = untrusted_human_input
+        ctx, log = self._start_traversal(untrusted_human_input, autofix)
+        untrusted_llm_input = self._wrap(log, ctx, untrusted_human_input)
+
+        # talk to our LLM. the output is streamed, so that we can stop reading it as
+        # soon as the envelope has everything that it needs
+        log.info("Sending envelope to LLM")
+        untrusted_llm_output = self._unwrap(
+            log=log,
+            ctx=ctx,
+            untrusted_llm_output=self._stream(ctx, untrusted_llm_input),
+        )
+
+        return self._traverse_unwrapped(
+            log=log,
+            ctx=ctx,
+            untrusted_llm_output=untrusted_llm_output,
+            autofix=autofix,
+        )
+
+    async def atraverse(
+        self,
+        untrusted_human_input: str,
+        autofix: bool = True,
+        executor: Optional[Executor] = None,
+    ) -> str:
+        """The asyncio equivalent of :meth:`traverse`. The LLM is awaited, so it does
+        not hold a thread while the completion is in flight, and the CPU-bound parsing
+        and validation run in an executor, so they do not block the event loop. This
+        lets a single event loop multiplex many concurrent traversals.
+
+        If the LLM integration is an :class:`AsyncLLMIntegration
+        <heimdallm.llm.AsyncLLMIntegration>`, its ``acomplete`` method is awaited
+        directly. Otherwise, its blocking ``complete`` method is run in the executor.
+
+        :param untrusted_human_input: The untrusted input from the user.
+        :param autofix: Whether or not to attempt to :doc:`reconstruct
+            </reconstruction>` the input to satisfy the constraint validator.
+        :param executor: The executor to run the blocking steps in. If omitted, the
+            event loop's default executor is used.
+
+        :return: The trusted LLM output.
+        """
+        loop = asyncio.get_running_loop()
+        ctx, log = self._start_traversal(untrusted_human_input, autofix)
+        untrusted_llm_input = self._wrap(log, ctx, untrusted_human_input)
+
+        # talk to our LLM
+        log.info("Sending envelope to LLM")
+        with self.instrument(Stage.LLM, ctx):
+            if isinstance(self.llm, AsyncLLMIntegration):
+                untrusted_llm_output = await self.llm.acomplete(untrusted_llm_input)
+            else:
+                untrusted_llm_output = await loop.run_in_executor(
+                    executor,
+                    self.llm.complete,
+                    untrusted_llm_input,
+                )
+        log.info("Received raw result from LLM")
+
+        return await loop.run_in_executor(
+            executor,
+            partial(
+                self._traverse_llm_output,
+                log=log,
+                ctx=ctx,
+                untrusted_llm_output=untrusted_llm_output,
+                autofix=autofix,
+            ),
+        )
+
+    def traverse_many(
+        self,
+        untrusted_human_inputs: Iterable[str],
+        autofix: bool = True,
+        concurrency: int = 8,
+    ) -> list[Union[str, Exception]]:
+        """Traverse many untrusted inputs at once. The LLM completions are dispatched
+        concurrently, and each response is parsed and validated on the same worker pool
+        as soon as it arrives, so the total latency is close to that of the slowest
+        single traversal, rather than the sum of all of them.
+
+        A failed traversal does not affect the others. Its exception is returned in
+        place of its trusted output.
+
+        :param untrusted_human_inputs: The untrusted inputs from the users.
+        :param autofix: Whether or not to attempt to :doc:`reconstruct
+            </reconstruction>` the inputs to satisfy the constraint validator.
+        :param concurrency: The maximum number of traversals in flight at once.
+
+        :return: The trusted LLM output, or the exception raised, for each input, in
+            the same order as the inputs.
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+
+        def traverse(untrusted_human_input: str) -> Union[str, Exception]:
+            try:
+                return self.traverse(untrusted_human_input, autofix=autofix)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return list(pool.map(traverse, untrusted_human_inputs))
+
+    def traverse_speculative(
+        self,
+        untrusted_human_input: str,
+        autofix: bool = True,
+        candidates: int = 3,
+    ) -> str:
+        """Traverse the Bifrost with several candidate LLM outputs at once, instead of
+        retrying after a rejection. The LLM is asked for ``candidates`` completions of
+        the same input, with :meth:`LLMIntegration.complete_many
+        <heimdallm.llm.LLMIntegration.complete_many>`, and each candidate is submitted
+        to a worker pool as soon as it arrives, where it's unwrapped and validated
+        while the other candidates are still being generated and validated. The first
+        trusted output is returned, and the rest are cancelled: candidates that haven't
+        started validating are dropped, and the LLM's outputs are closed.
+
+        This trades tokens for latency, because a rejected candidate no longer costs a
+        whole extra round trip to the LLM.
+
+        .. note::
+
+            A candidate that is already being validated when another one wins can't be
+            interrupted, so it runs to completion in the background, and its result is
+            discarded.
+
+        :param untrusted_human_input: The untrusted input from the user.
+        :param autofix: Whether or not to attempt to :doc:`reconstruct
+            </reconstruction>` the input to satisfy the constraint validator.
+        :param candidates: The number of candidate completions to ask the LLM for.
+
+        :raises Exception: The exception of the last candidate, if every candidate
+            failed.
+        :return: The trusted LLM output of the first candidate to be validated.
+        """
+        if candidates < 1:
+            raise ValueError("candidates must be at least 1")
+
+        ctx, log = self._start_traversal(untrusted_human_input, autofix)
+        untrusted_llm_input = self._wrap(log, ctx, untrusted_human_input)
+
+        log.info("Sending envelope to LLM", candidates=candidates)
+        outputs = self._instrument_llm(
+            ctx, self.llm.complete_many(untrusted_llm_input, candidates)
+        )
+
+        def validate(i: int, ctx: TraverseContext, untrusted_llm_output: str) -> str:
+            return self._traverse_llm_output(
+                log=LOG.bind(autofix=autofix, candidate=i),
+                ctx=ctx,
+                untrusted_llm_output=untrusted_llm_output,
+                autofix=autofix,
+            )
+
+        # the LLM's outputs are read on a single thread of their own, because the
+        # LLM stage must start and end on the same thread, and the validation pool
+        # must be free to validate the candidates that have already arrived
+        reader = ThreadPoolExecutor(max_workers=1)
+        pool = ThreadPoolExecutor(max_workers=candidates)
+
+        def read() -> Optional[str]:
+            return next(outputs, None)
+
+        reading: "Future[Any]" = reader.submit(read)
+        pending: set["Future[Any]"] = {reading}
+        candidate: dict["Future[Any]", int] = {}
+        contexts: list[TraverseContext] = []
+        # the errors by candidate, so that we raise the last candidate's error no
+        # matter which order the candidates failed in
+        errors: dict[int, Exception] = {}
+        received = 0
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future is not reading:
+                        try:
+                            trusted_llm_output = future.result()
+                        except Exception as e:
+                            errors[candidate[future]] = e
+                            continue
+                        self.ctx = contexts[candidate[future]]
+                        return trusted_llm_output
+
+                    try:
+                        untrusted_llm_output = future.result()
+                    except Exception as e:
+                        # the LLM failed, but the candidates that already arrived
+                        # might still be validated
+                        errors[received] = e
+                        continue
+                    if untrusted_llm_output is None:
+                        continue
+
+                    log.info("Received raw result from LLM", candidate=received)
+                    # each candidate gets its own context, so that an exception refers
+                    # to the candidate that raised it
+                    if received > 0:
+                        ctx = TraverseContext()
+                        ctx.untrusted_human_input = untrusted_human_input
+                    validation = pool.submit(
+                        validate, received, ctx, untrusted_llm_output
+                    )
+                    candidate[validation] = received
+                    contexts.append(ctx)
+                    pending.add(validation)
+                    received += 1
+
+                    reading = reader.submit(read)
+                    pending.add(reading)
+        finally:
+            # closing the outputs is queued behind any read that's still in flight, so
+            # that the LLM stage ends on the thread that it started on
+            reader.submit(outputs.close)
+            reader.shutdown(wait=False)
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        if not errors:
+            raise RuntimeError("The LLM produced no candidates")
+        if contexts:
+            self.ctx = contexts[-1]
+        raise errors[max(errors)]
+
+    def _start_traversal(
+        self,
+        untrusted_human_input: str,
+        autofix: bool,
+    ) -> tuple[TraverseContext, structlog.BoundLogger]:
+        """Sets up the context and logger for a single traversal."""
+        # a fresh context for every traversal, so that concurrent traversals on the
+        # same Bifrost don't clobber each other's error context
+        ctx = TraverseContext()
+        ctx.untrusted_human_input = untrusted_human_input
+        self.ctx = ctx
 
         log = LOG.bind(autofix=autofix)
         log.info("Traversing untrusted input")
+        return ctx, log
 
-        # wrap the untrusted input in our prompt
+    def _wrap(
+        self,
+        log: structlog.BoundLogger,
+        ctx: TraverseContext,
+        untrusted_human_input: str,
+    ) -> str:
+        """Wraps the untrusted input in our prompt envelope."""
         log.info("Wrapping input in prompt envelope")
-        untrusted_llm_input = self.prompt_envelope.wrap(untrusted_human_input)
+        with self.instrument(Stage.WRAP, ctx):
+            untrusted_llm_input = self.prompt_envelope.wrap(untrusted_human_input)
         log.debug("Produced prompt envelope")
+        return untrusted_llm_input
 
-        # talk to our LLM
-        log.info("Sending envelope to LLM")
-        untrusted_llm_output: str = self.llm.complete(untrusted_llm_input)
-        self.ctx.untrusted_llm_output = untrusted_llm_output
-        log.info("Received raw result from LLM")
+    def _stream(
+        self,
+        ctx: TraverseContext,
+        untrusted_llm_input: str,
+    ) -> Iterable[str]:
+        """Streams the LLM's completion of the wrapped input."""
+        if not self.instrumentation:
+            return self.llm.stream(untrusted_llm_input)
+        return self._instrument_llm(ctx, self.llm.stream(untrusted_llm_input))
+
+    def _instrument_llm(
+        self,
+        ctx: TraverseContext,
+        outputs: Iterable[str],
+    ) -> Generator[str, None, None]:
+        """Runs the LLM stage from the first read of the LLM's outputs until they're
+        exhausted or closed. Closing early, like when the envelope has everything that
+        it needs, isn't an error."""
+        with self.instrument(Stage.LLM, ctx):
+            try:
+                yield from outputs
+            finally:
+                close = getattr(outputs, "close", None)
+                if close is not None:
+                    close()
+
+    def _traverse_llm_output(
+        self,
+        *,
+        log: structlog.BoundLogger,
+        ctx: TraverseContext,
+        untrusted_llm_output: str,
+        autofix: bool,
+    ) -> str:
+        """Everything that happens after the LLM has responded: unwrapping, parsing,
+        validation, and post-transformation. This is all CPU-bound."""
+        untrusted_llm_output = self._unwrap(
+            log=log,
+            ctx=ctx,
+            untrusted_llm_output=[untrusted_llm_output],
+        )
+        return self._traverse_unwrapped(
+            log=log,
+            ctx=ctx,
+            untrusted_llm_output=untrusted_llm_output,
+            autofix=autofix,
+        )
+
+    def _unwrap(
+        self,
+        *,
+        log: structlog.BoundLogger,
+        ctx: TraverseContext,
+        untrusted_llm_output: Iterable[str],
+    ) -> str:
+        """Unwraps the LLM's output from the prompt envelope, as it arrives. The
+        envelope may stop reading the output early, in which case the rest of it is
+        cancelled."""
+        chunks: list[str] = []
+
+        def record() -> Generator[str, None, None]:
+            try:
+                for chunk in untrusted_llm_output:
+                    chunks.append(chunk)
+                    yield chunk
+            finally:
+                close = getattr(untrusted_llm_output, "close", None)
+                if close is not None:
+                    close()
 
         # trim any cruft off of the LLM output
         log.info("Unwrapping prompt envelope")
+        stream = record()
         try:
-            untrusted_llm_output = self.prompt_envelope.unwrap(untrusted_llm_output)
+            # the stream is closed inside the stage, so that an LLM stage nested in it
+            # ends first
+            with self.instrument(Stage.UNWRAP, ctx):
+                try:
+                    unwrapped = self.prompt_envelope.unwrap_stream(stream)
+                finally:
+                    stream.close()
         except Exception as e:
+            ctx.untrusted_llm_output = "".join(chunks)
             log.exception("Unwrap failed")
             raise e
-        self.ctx.untrusted_llm_output = untrusted_llm_output
+
+        ctx.untrusted_llm_output = unwrapped
         log.info("Unwrap succeeded")
+        return unwrapped
+
+    def _traverse_unwrapped(
+        self,
+        *,
+        log: structlog.BoundLogger,
+        ctx: TraverseContext,
+        untrusted_llm_output: str,
+        autofix: bool,
+    ) -> str:
+        """Parsing, validation and post-transformation of the unwrapped LLM output,
+        through the validation cache, if there is one."""
+        cache_key = None
+        if self.validation_cache is not None:
+            cache_key = self._validation_cache_key(untrusted_llm_output, autofix)
+
+        if self.validation_cache is None or cache_key is None:
+            return self._validate_llm_output(
+                log=log,
+                ctx=ctx,
+                untrusted_llm_output=untrusted_llm_output,
+                autofix=autofix,
+            )
+
+        cached = self.validation_cache.get(cache_key)
+        if isinstance(cached, Exception):
+            log.info("Validation cache hit, validation failed")
+            raise _rebind_exception(cached, ctx)
+        elif cached is not None:
+            log.info("Validation cache hit, validation succeeded")
+            ctx.trusted_llm_output = cached
+            return cached
+
+        try:
+            trusted_llm_output = self._validate_llm_output(
+                log=log,
+                ctx=ctx,
+                untrusted_llm_output=untrusted_llm_output,
+                autofix=autofix,
+            )
+        except Exception as e:
+            self.validation_cache.set(cache_key, _rebind_exception(e, None))
+            raise e
+        self.validation_cache.set(cache_key, trusted_llm_output)
+        return trusted_llm_output
 
+    def _validation_cache_key(
+        self, untrusted_llm_output: str, autofix: bool
+    ) -> Optional[tuple]:
+        """The key of the validation cache, or None if any of the validators hasn't
+        opted in to caching with a fingerprint."""
+        if self._validator_fingerprints is None:
+            self._validator_fingerprints = tuple(
+                v.fingerprint() for v in self.constraint_validators
+            )
+        if None in self._validator_fingerprints:
+            return None
+        cls = type(self)
+        return (
+            cls.__module__,
+            cls.__qualname__,
+            autofix,
+            self._validator_fingerprints,
+            untrusted_llm_output,
+        )
+
+    def _validate_llm_output(
+        self,
+        *,
+        log: structlog.BoundLogger,
+        ctx: TraverseContext,
+        untrusted_llm_output: str,
+        autofix: bool,
+    ) -> str:
+        """Parses and validates the unwrapped LLM output, and post-transforms it into
+        the trusted output."""
         # throws a parse error
         log.info("Parsing result via grammar")
         try:
-            tree = self.parse(untrusted_llm_output)
+            with self.instrument(Stage.PARSE, ctx):
+                tree = self.parse(untrusted_llm_output, ctx=ctx)
         except Exception as e:
             log.exception("Parse failed")
             raise e
@@ -129,7 +596,7 @@ class Bifrost:
                     validator=validator,
                     untrusted_llm_output=untrusted_llm_output,
                     autofix=autofix,
-                    ctx=self.ctx,
+                    ctx=ctx,
                     tree=tree,
                 )
             except Exception as e:
@@ -149,8 +616,9 @@ class Bifrost:
                 raise e
 
         log.info("Validation succeeded")
-        trusted_llm_output = self.post_transform(trusted_llm_output, tree)
-        self.ctx.trusted_llm_output = trusted_llm_output
+        with self.instrument(Stage.POST_TRANSFORM, ctx):
+            trusted_llm_output = self.post_transform(trusted_llm_output, tree)
+        ctx.trusted_llm_output = trusted_llm_output
 
         return trusted_llm_output
 
@@ -165,38 +633,57 @@ class Bifrost:
         tree: ParseTree,
     ) -> tuple[str, ParseTree]:
         """Attempt validation with an individual constraint validator."""
+        name = validator.__class__.__name__
 
         if autofix:
             log.info("Autofixing parse tree and reconstructing the input")
             try:
-                untrusted_llm_output = validator.fix(
-                    bifrost=self,
-                    grammar=self.grammar,
-                    tree=tree,
-                    ctx=ctx,
-                )
+                with self.instrument(Stage.FIX, ctx, validator=name):
+                    untrusted_llm_output, tree = validator.fix_tree(
+                        bifrost=self,
+                        grammar=self.grammar,
+                        tree=tree,
+                        ctx=ctx,
+                    )
             except Exception as e:
                 log.exception("Autofix failed")
                 raise e
-            log.info("Re-parsing reconstructed output")
-            try:
-                tree = self.parse(untrusted_llm_output)
-            except Exception as e:
-                log.exception("Reparse failed")
-                raise e
             log.info("Reconstruction succeeded")
 
         # throws a bifrost-specific exception
         log.info("Validating parse tree")
-        validator.validate(
-            bifrost=self,
-            tree=tree,
-            ctx=ctx,
-        )
+        with self.instrument(Stage.VALIDATE, ctx, validator=name):
+            validator.validate(
+                bifrost=self,
+                tree=tree,
+                ctx=ctx,
+            )
         log.info("Validation succeeded")
 
         return untrusted_llm_output, tree
 
+    def instrument(
+        self,
+        stage: Stage,
+        ctx: TraverseContext,
+        **labels: str,
+    ) -> ContextManager[None]:
+        """Runs a stage of a traversal under the Bifrost's :attr:`instrumentation`. The
+        stage is labelled with the Bifrost's :attr:`dialect`, in addition to
+        ``labels``. Without instrumentation, this does nothing.
+
+        :param stage: The stage that runs inside the context.
+        :param ctx: The context of the traversal.
+        :param labels: More labels for the stage, like the ``validator``.
+        :return: The context manager to run the stage in.
+        """
+        if not self.instrumentation:
+            return _UNINSTRUMENTED
+        labels = {"dialect": self.dialect, **labels}
+        if len(self.instrumentation) == 1:
+            return self.instrumentation[0].stage(stage, ctx, labels)
+        return _stages(self.instrumentation, stage, ctx, labels)
+
     def post_transform(self, trusted_llm_output: str, tree: ParseTree) -> str:
         """
         A hook for subclasses to perform post-transformations on the trusted output.
@@ -212,12 +699,35 @@ class Bifrost:
         """
         return trusted_llm_output
 
-    def parse(self, untrusted_llm_output: str) -> ParseTree:
+    def parse(
+        self,
+        untrusted_llm_output: str,
+        ctx: Optional[TraverseContext] = None,
+    ) -> ParseTree:
         """Converts the :term:`LLM` output into a parse tree. Override it in a subclass
         to throw custom exceptions based on the grammar and parse state.
 
         :param untrusted_llm_output: The unwrapped output from the LLM.
+        :param ctx: The context of the current traversal, used for error reporting. If
+            omitted, a new context is created for this parse.
 
         :return: The parse tree.
         """
-        return self.tree_producer(self.grammar, untrusted_llm_output)
+        if ctx is None:
+            ctx = TraverseContext()
+            ctx.untrusted_llm_output = untrusted_llm_output
+        return self.tree_producer(self.grammar, untrusted_llm_output, ctx)
+
+
+@contextmanager
+def _stages(
+    instrumentation: Sequence[Instrumentation],
+    stage: Stage,
+    ctx: TraverseContext,
+    labels: Mapping[str, str],
+) -> Iterator[None]:
+    """Runs a stage under several instrumentations, the first one outermost."""
+    with ExitStack() as stack:
+        for instrument in instrumentation:
+            stack.enter_context(instrument.stage(stage, ctx, labels))
+        yield
@@ -1,14 +1,16 @@
 from abc import ABC, abstractmethod
-from typing import TYPE_CHECKING, Callable, Sequence, Union, cast
+from typing import TYPE_CHECKING, Any, Callable, Mapping, Optional, Sequence, Union
 
 import lark
-from lark import Lark, ParseTree, Token
-from lark.exceptions import VisitError
+from lark import Lark, ParseTree
+from lark.exceptions import UnexpectedInput, VisitError
 
 from heimdallm.bifrost import Bifrost as _BaseBifrost
 from heimdallm.bifrosts.sql import exc
-from heimdallm.bifrosts.sql.visitors.id_setter import IdSetter
-from heimdallm.bifrosts.sql.visitors.parent import ParentSetter
+from heimdallm.bifrosts.sql.visitors.index import TreeIndex
+from heimdallm.cache import LRUCache
+from heimdallm.context import TraverseContext
+from heimdallm.instrumentation import Instrumentation, Stage
 from heimdallm.llm import LLMIntegration
 from heimdallm.llm_providers.mock import EchoMockLLM
 
@@ -16,8 +18,13 @@ if TYPE_CHECKING:
     import heimdallm.bifrosts.sql.envelope
     import heimdallm.bifrosts.sql.validator
 
+from .common import CanonicalQuery, ParameterizedQuery, TrustedQuery
 from .envelope import TestSQLPromptEnvelope
+from .utils.canonical import canonicalize
+from .utils.placeholders import parameterize_literals, rewrite_placeholders
 from .visitors.ambiguity import AmbiguityResolver
+from .visitors import lalr
+from .visitors.lalr import DeferToEarley, LALRNormalizer
 
 
 class Bifrost(_BaseBifrost, ABC):
@@ -31,8 +38,27 @@ class Bifrost(_BaseBifrost, ABC):
     :param constraint_validators: A sequence of constraint validators that will be used
         to validate the parse tree returned by the ``tree_producer``. Only one validator
         needs to succeed for validation to pass.
+    :param validation_cache: An optional cache of validation results, keyed on the
+        unwrapped SQL query and the fingerprints of the constraint validators. Common
+        queries then skip parsing and validation entirely.
+    :param parameterize_literals: Whether to lift the literals in the conditions of the
+        trusted query out into bind parameters. The trusted query is then a
+        :class:`ParameterizedQuery <heimdallm.bifrosts.sql.common.ParameterizedQuery>`,
+        with the values of the literals in its ``params``.
+    :param canonicalize_queries: Whether to attach the :func:`canonical form
+        <heimdallm.bifrosts.sql.utils.canonical.canonicalize>` of each validated query
+        to the trusted query, which is then a :class:`TrustedQuery
+        <heimdallm.bifrosts.sql.common.TrustedQuery>`.
+    :param mask_literals: Whether the canonical form masks the query's literals.
+    :param instrumentation: An optional :class:`Instrumentation
+        <heimdallm.instrumentation.Instrumentation>`, or sequence of them, to time each
+        stage of every traversal.
     """
 
+    #: Whether the dialect's strings escape with backslashes, and may be quoted with
+    #: double quotes. This only matters for lexing the query when it's canonicalized.
+    backslash_strings = False
+
     @classmethod
     def validation_only(
         cls,
@@ -40,6 +66,11 @@ class Bifrost(_BaseBifrost, ABC):
             "heimdallm.bifrosts.sql.validator.ConstraintValidator",
             Sequence["heimdallm.bifrosts.sql.validator.ConstraintValidator"],
         ],
+        validation_cache: Optional[LRUCache] = None,
+        parameterize_literals: bool = False,
+        canonicalize_queries: bool = False,
+        mask_literals: bool = False,
+        instrumentation: Union[Instrumentation, Sequence[Instrumentation], None] = None,
     ):
         """A convenience method for doing just static analysis. This creates a
         Bifrost that assumes its untrusted input is a SQL query already, so it does not
@@ -47,6 +78,15 @@ class Bifrost(_BaseBifrost, ABC):
 
         :param constraint_validators: A constraint validator or sequence of constraint
             validators to run on the untrusted input.
+        :param validation_cache: An optional cache of validation results. See
+            :class:`heimdallm.bifrost.Bifrost`.
+        :param parameterize_literals: Whether to lift the literals of the trusted query
+            out into bind parameters.
+        :param canonicalize_queries: Whether to attach the canonical form of each
+            validated query to the trusted query.
+        :param mask_literals: Whether the canonical form masks the query's literals.
+        :param instrumentation: An optional instrumentation, or sequence of them, to
+            time each stage of every traversal.
         """
         if not isinstance(constraint_validators, Sequence):
             constraint_validators = [constraint_validators]
@@ -60,6 +100,11 @@ class Bifrost(_BaseBifrost, ABC):
                 db_schema="<schema>",  # doesn't matter
                 validators=constraint_validators,
             ),
+            validation_cache=validation_cache,
+            parameterize_literals=parameterize_literals,
+            canonicalize_queries=canonicalize_queries,
+            mask_literals=mask_literals,
+            instrumentation=instrumentation,
         )
 
     def __init__(
@@ -70,13 +115,24 @@ class Bifrost(_BaseBifrost, ABC):
         constraint_validators: Sequence[
             "heimdallm.bifrosts.sql.validator.ConstraintValidator"
         ],
+        validation_cache: Optional[LRUCache] = None,
+        parameterize_literals: bool = False,
+        canonicalize_queries: bool = False,
+        mask_literals: bool = False,
+        instrumentation: Union[Instrumentation, Sequence[Instrumentation], None] = None,
     ):
+        self.parameterize_literals = parameterize_literals
+        self.canonicalize_queries = canonicalize_queries
+        self.mask_literals = mask_literals
+        self.fast_grammar = self.build_fast_grammar()
         super().__init__(
             llm=llm,
             prompt_envelope=prompt_envelope,
             grammar=self.build_grammar(),
             tree_producer=self.build_tree_producer(),
             constraint_validators=constraint_validators,
+            validation_cache=validation_cache,
+            instrumentation=instrumentation,
         )
 
     @classmethod
@@ -91,7 +147,25 @@ class Bifrost(_BaseBifrost, ABC):
         """
         raise NotImplementedError
 
-    def build_tree_producer(self) -> Callable[[Lark, str], ParseTree]:
+    @classmethod
+    def build_fast_grammar(cls) -> Optional[Lark]:
+        """
+        Returns a deterministic LALR variant of the dialect's grammar, which the tree
+        producer tries before the Earley grammar from :meth:`build_grammar
+        <heimdallm.bifrost.Bifrost.build_grammar>`. The fast grammar must produce the
+        same trees as the Earley grammar, and anything it can't parse, or parses in a
+        way that the Earley grammar would resolve differently, falls back to the Earley
+        grammar. May be implemented in a subclass. Returning None disables the fast
+        path.
+
+        :return: The compiled LALR grammar, or None.
+        :meta private:
+        """
+        return None
+
+    def build_tree_producer(
+        self,
+    ) -> Callable[[Lark, str, TraverseContext], ParseTree]:
         """
         Produces a that can create a single parse tree. May be implemented in a subclass
         if you want to do custom ambiguity resolution.
@@ -100,20 +174,45 @@ class Bifrost(_BaseBifrost, ABC):
         :meta private:
         """
 
-        def parse(grammar: Lark, untrusted_query: str) -> ParseTree:
-            ambig_tree = grammar.parse(untrusted_query)
+        def fast_parse(untrusted_query: str) -> Optional[ParseTree]:
+            assert self.fast_grammar is not None
             try:
-                final_tree = AmbiguityResolver(
-                    ctx=self.ctx,
+                tree = lalr.parse(self.fast_grammar, untrusted_query)
+                return LALRNormalizer(
                     reserved_keywords=self.reserved_keywords(),
-                ).transform(ambig_tree)
+                ).transform(tree)
+            except (UnexpectedInput, DeferToEarley):
+                return None
             except VisitError as e:
-                if isinstance(e.orig_exc, exc.BaseException):
-                    raise e.orig_exc
+                if isinstance(e.orig_exc, DeferToEarley):
+                    return None
                 raise e
 
-            final_tree = ParentSetter().visit(final_tree)
-            final_tree = IdSetter().visit(final_tree)
+        def parse(
+            grammar: Lark,
+            untrusted_query: str,
+            ctx: TraverseContext,
+        ) -> ParseTree:
+            final_tree = None
+            if self.fast_grammar is not None:
+                final_tree = fast_parse(untrusted_query)
+
+            # the fast parser couldn't decide, so use the earley parser, which
+            # produces every possible parse, and resolve the ambiguities ourselves
+            if final_tree is None:
+                ambig_tree = grammar.parse(untrusted_query)
+                try:
+                    with self.instrument(Stage.RESOLVE, ctx):
+                        final_tree = AmbiguityResolver(
+                            ctx=ctx,
+                            reserved_keywords=self.reserved_keywords(),
+                        ).transform(ambig_tree)
+                except VisitError as e:
+                    if isinstance(e.orig_exc, exc.BaseException):
+                        raise e.orig_exc
+                    raise e
+
+            TreeIndex(final_tree)
             return final_tree
 
         return parse
@@ -133,25 +232,80 @@ class Bifrost(_BaseBifrost, ABC):
         return ":" + name
 
     def post_transform(self, trusted_llm_output: str, tree: ParseTree) -> str:
-        placeholders = list(tree.find_data("placeholder"))
-
-        # reverse=True so we work backwords so we don't mess up the indices
-        placeholders.sort(key=lambda x: x.meta.start_pos, reverse=True)
-
-        def replace_slice(input_str, start, end, replacement):
-            return input_str[:start] + replacement + input_str[end:]
-
-        for placeholder in placeholders:
-            m = placeholder.meta
-            name = cast(Token, placeholder.children[0]).value
-            trusted_llm_output = replace_slice(
-                trusted_llm_output,
-                m.start_pos,
-                m.end_pos,
-                self.placeholder(name),
+        canonical = None
+        if self.canonicalize_queries:
+            canonical = self.canonicalize(
+                trusted_llm_output, tree, mask_literals=self.mask_literals
             )
+
+        if self.parameterize_literals:
+            query = parameterize_literals(trusted_llm_output, tree, self.placeholder)
+            if canonical is not None:
+                query = ParameterizedQuery(query, query.params, canonical)
+            return query
+
+        trusted_llm_output, _ = self.rewrite_placeholders(trusted_llm_output, tree)
+        if canonical is not None:
+            return TrustedQuery(trusted_llm_output, canonical)
         return trusted_llm_output
 
+    def _validation_cache_key(
+        self, untrusted_llm_output: str, autofix: bool
+    ) -> Optional[tuple]:
+        key = super()._validation_cache_key(untrusted_llm_output, autofix)
+        if key is None:
+            return None
+        return key + (
+            self.parameterize_literals,
+            self.canonicalize_queries,
+            self.mask_literals,
+        )
+
+    def canonicalize(
+        self,
+        trusted_llm_output: str,
+        tree: ParseTree,
+        mask_literals: bool = False,
+    ) -> CanonicalQuery:
+        """Normalizes a query's formatting, for a stable identity to cache, deduplicate
+        or count it by. See :func:`heimdallm.bifrosts.sql.utils.canonical.canonicalize`.
+
+        :param trusted_llm_output: The query that the tree was parsed from.
+        :param tree: The parse tree of the query.
+        :param mask_literals: Whether to replace the query's literals with ``?``.
+        :return: The canonical query.
+        """
+        return canonicalize(
+            trusted_llm_output,
+            tree,
+            mask_literals=mask_literals,
+            backslash_strings=self.backslash_strings,
+        )
+
+    def rewrite_placeholders(
+        self,
+        trusted_llm_output: str,
+        tree: ParseTree,
+        params: Optional[Mapping[str, Any]] = None,
+    ) -> tuple[str, list[str]]:
+        """Replaces the generic ``:name`` placeholders of a query with this dialect's
+        :meth:`placeholder` format, in a single pass. See
+        :func:`heimdallm.bifrosts.sql.utils.placeholders.rewrite_placeholders`.
+
+        :param trusted_llm_output: The query that the tree was parsed from.
+        :param tree: The parse tree of the query.
+        :param params: The values of the placeholders, if they should be checked.
+        :raises MissingPlaceholderValue: If ``params`` is missing a value for any of the
+            placeholders.
+        :return: The rewritten query, and the names of its placeholders, in order.
+        """
+        return rewrite_placeholders(
+            trusted_llm_output,
+            tree,
+            self.placeholder,
+            params=params,
+        )
+
     @staticmethod
     @abstractmethod
     def build_grammar() -> Lark:
@@ -164,25 +318,35 @@ class Bifrost(_BaseBifrost, ABC):
         """
         raise NotImplementedError
 
-    def parse(self, untrusted_llm_output: str) -> ParseTree:
+    def parse(
+        self,
+        untrusted_llm_output: str,
+        ctx: Optional[TraverseContext] = None,
+    ) -> ParseTree:
         """Parse the unwrapped SQL query from the LLM's output. Raise a SQL-specific
         exception if the query is not valid.
 
         :param untrusted_llm_output: The output from the LLM, which should be a SQL
             query. If it isn't, then our
             :meth:`heimdallm.bifrosts.sql.envelope.PromptEnvelope.unwrap` method failed.
+        :param ctx: The context of the current traversal, used for error reporting. If
+            omitted, a new context is created for this parse.
         :raises InvalidQuery: If the query is not valid.
         :return: The Lark parse tree for the query.
 
         :meta private:
         """
+        if ctx is None:
+            ctx = TraverseContext()
+            ctx.untrusted_llm_output = untrusted_llm_output
+
         try:
-            return super().parse(untrusted_llm_output)
+            return super().parse(untrusted_llm_output, ctx=ctx)
         except lark.exceptions.UnexpectedEOF as e:
-            raise exc.InvalidQuery(ctx=self.ctx) from e
+            raise exc.InvalidQuery(ctx=ctx) from e
         except lark.exceptions.UnexpectedCharacters as e:
-            raise exc.InvalidQuery(ctx=self.ctx) from e
+            raise exc.InvalidQuery(ctx=ctx) from e
         except exc.BaseException as e:
             raise e
         except Exception as e:
-            raise exc.InvalidQuery(ctx=self.ctx) from e
+            raise exc.InvalidQuery(ctx=ctx) from e
@@ -1,4 +1,7 @@
-from typing import Any, Optional, Sequence
+import hashlib
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Mapping, Optional, Sequence, cast
 
 
 class ParameterizedConstraint:
@@ -159,3 +162,83 @@ class _AnyJoinCondition(JoinCondition):
 #: A convenience object that represents any valid join condition. Only use it for a
 #: validator that represents full admin access to your database.
 ANY_JOIN = _AnyJoinCondition()
+
+
+@dataclass(frozen=True)
+class CanonicalQuery:
+    """The canonical form of a query, which is the same for every query that only
+    differs in its formatting. See
+    :func:`heimdallm.bifrosts.sql.utils.canonical.canonicalize`.
+
+    :param sql: The normalized query.
+    :param fingerprint: A stable hash of the normalized query.
+    """
+
+    sql: str
+    fingerprint: str
+
+    @staticmethod
+    def hash(sql: str) -> str:
+        """The fingerprint of a normalized query."""
+        return hashlib.sha256(sql.encode("utf8")).hexdigest()
+
+
+class TrustedQuery(str):
+    """A trusted query, along with the canonical form of the query that it was
+    produced from. It's the query text itself, so it can be used anywhere that a
+    trusted query can.
+
+    :param sql: The trusted query.
+    :param canonical: The canonical form of the query, if it was canonicalized.
+    """
+
+    canonical: Optional[CanonicalQuery]
+
+    def __new__(
+        cls, sql: str, canonical: Optional[CanonicalQuery] = None
+    ) -> "TrustedQuery":
+        query = super().__new__(cls, sql)
+        query.canonical = canonical
+        return query
+
+    def __reduce__(self):
+        return (TrustedQuery, (str(self), self.canonical))
+
+
+class ParameterizedQuery(TrustedQuery):
+    """A trusted query whose literals have been lifted out into bind parameters, so
+    that queries that only differ in their literals have the same text, and can share
+    the database's prepared statements and plan cache. It's the query text itself, so
+    it can be used anywhere that a trusted query can, with its :attr:`params` passed
+    alongside to the driver.
+
+    :param sql: The query, with a placeholder for each lifted literal.
+    :param params: The value of each lifted literal, by placeholder name. The values
+        of the query's own placeholders still need to be added.
+    :param canonical: The canonical form of the query, if it was canonicalized.
+
+    The :attr:`params` are read-only, because a query from the validation cache is
+    shared by every traversal that produced it. Merge them into a new dictionary along
+    with your own values, like ``cursor.execute(query, {**query.params, "id": 1})``.
+    """
+
+    params: Mapping[str, Any]
+
+    def __new__(
+        cls,
+        sql: str,
+        params: Mapping[str, Any],
+        canonical: Optional[CanonicalQuery] = None,
+    ) -> "ParameterizedQuery":
+        query = cast("ParameterizedQuery", super().__new__(cls, sql, canonical))
+        query.params = MappingProxyType(dict(params))
+        return query
+
+    def __reduce__(self):
+        return (ParameterizedQuery, (str(self), dict(self.params), self.canonical))
+
+    @property
+    def fingerprint(self) -> str:
+        """A stable fingerprint of the query's text, which is the same for every query
+        that differs only in its literals."""
+        return hashlib.sha256(self.encode("utf8")).hexdigest()
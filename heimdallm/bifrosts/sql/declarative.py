@@ -0,0 +1,277 @@
+import hashlib
+import json
+from importlib import import_module
+from pathlib import Path
+from typing import Any, Iterable, Mapping, Optional, Sequence
+
+from heimdallm.cache import LRUCache
+
+from .common import FqColumn, JoinCondition, ParameterizedConstraint
+from .validator import ConstraintValidator
+
+DIALECTS = ("sqlite", "mysql", "postgres")
+
+#: The validators that have been loaded, by the hash of the policy they were loaded
+#: from, so that the same policy is only ever turned into a validator once.
+cache: LRUCache["DeclarativeConstraints"] = LRUCache(max_size=1024)
+
+
+class InvalidPolicy(ValueError):
+    """Thrown when a declarative policy is malformed."""
+
+
+class DeclarativeConstraints(ConstraintValidator):
+    """A constraint validator that is defined by data, instead of by code. This is
+    useful when there are many similar policies, for example, one per tenant, that are
+    better kept in files or in a database than written as classes.
+
+    A policy looks like this, in TOML:
+
+    .. code-block:: toml
+
+        dialect = "sqlite"
+        max_limit = 100
+        requester_identities = [
+            { column = "customer.customer_id", placeholder = "customer_id" },
+        ]
+        parameterized_constraints = []
+
+        [tables.customer]
+        select = ["first_name", "last_name"]
+        condition = ["customer_id", "first_name", "last_name"]
+
+        [tables.rental]
+        select = "*"
+
+        [[joins]]
+        first = "customer.customer_id"
+        second = "rental.customer_id"
+        identity = "customer_id"
+
+    Each table lists the columns that can be selected, and, optionally, the columns that
+    can be used in conditions, which otherwise default to the selectable columns. Either
+    can be ``"*"``, for every column of the table. If ``functions`` isn't given, the
+    dialect's curated safe functions are allowed.
+
+    Use :func:`load_policy` or :func:`load_policy_file` instead of creating this
+    directly, so that each policy is only loaded once.
+
+    :param policy: The policy, as parsed from TOML or JSON.
+    :raises InvalidPolicy: If the policy is malformed.
+    """
+
+    def __init__(self, policy: Mapping[str, Any]):
+        # the validator is entirely defined by its policy, so the policy's content is
+        # its fingerprint
+        self._policy_hash = hashlib.sha256(
+            json.dumps(policy, sort_keys=True, default=str).encode("utf8")
+        ).hexdigest()
+
+        dialect = policy.get("dialect", "sqlite")
+        if dialect not in DIALECTS:
+            raise InvalidPolicy(f"Unknown dialect: {dialect!r}")
+        self.dialect = dialect
+
+        if "requester_identities" not in policy:
+            raise InvalidPolicy(
+                "You must explicitly provide the requester identities, "
+                "or an empty list for full access (dangerous)"
+            )
+        self._identities = tuple(
+            _constraints(policy["requester_identities"], "requester_identities")
+        )
+        self._constraints = tuple(
+            _constraints(
+                policy.get("parameterized_constraints", []),
+                "parameterized_constraints",
+            )
+        )
+
+        self._joins: tuple[JoinCondition, ...] = tuple(
+            JoinCondition(
+                _get(join, "first", str, "joins"),
+                _get(join, "second", str, "joins"),
+                identity=join.get("identity"),
+            )
+            for join in _get(policy, "joins", list, "policy", [])
+        )
+
+        # the tables whose every column is allowed, and the allowed columns of the rest
+        self._select_tables: set[str] = set()
+        self._select_columns: set[FqColumn] = set()
+        self._condition_tables: set[str] = set()
+        self._condition_columns: set[FqColumn] = set()
+
+        tables = _get(policy, "tables", dict, "policy", {})
+        for table, spec in tables.items():
+            select = _get(spec, "select", (list, str), f"tables.{table}", [])
+            condition = _get(spec, "condition", (list, str), f"tables.{table}", select)
+            _add_columns(table, select, self._select_tables, self._select_columns)
+            _add_columns(
+                table, condition, self._condition_tables, self._condition_columns
+            )
+
+        max_limit = policy.get("max_limit")
+        if max_limit is not None and (
+            not isinstance(max_limit, int) or isinstance(max_limit, bool)
+        ):
+            raise InvalidPolicy(f"max_limit must be an integer, not {max_limit!r}")
+        self._max_limit: Optional[int] = max_limit
+
+        functions = policy.get("functions")
+        if functions is None:
+            presets = import_module(f"heimdallm.bifrosts.sql.{dialect}.presets")
+            functions = presets.safe_functions
+        else:
+            functions = _strings(functions, "functions")
+        self._functions = frozenset(fn.lower() for fn in functions)
+
+    def fingerprint(self) -> str:
+        return self._policy_hash
+
+    def requester_identities(self) -> Sequence[ParameterizedConstraint]:
+        return self._identities
+
+    def parameterized_constraints(self) -> Sequence[ParameterizedConstraint]:
+        return self._constraints
+
+    def select_column_allowed(self, column: FqColumn) -> bool:
+        return column.table in self._select_tables or column in self._select_columns
+
+    def condition_column_allowed(self, fq_column: FqColumn) -> bool:
+        return (
+            fq_column.table in self._condition_tables
+            or fq_column in self._condition_columns
+        )
+
+    def allowed_joins(self) -> Sequence[JoinCondition]:
+        return self._joins
+
+    def max_limit(self) -> Optional[int]:
+        return self._max_limit
+
+    def can_use_function(self, function: str) -> bool:
+        return function in self._functions
+
+    # a wildcard table has no finite allowlist, so the predicates have to decide
+
+    def select_column_allowlist(self) -> Optional[Iterable[FqColumn]]:
+        return None if self._select_tables else self._select_columns
+
+    def condition_column_allowlist(self) -> Optional[Iterable[FqColumn]]:
+        return None if self._condition_tables else self._condition_columns
+
+    def function_allowlist(self) -> Optional[Iterable[str]]:
+        return self._functions
+
+
+def _get(data: Any, key: str, type: Any, where: str, default: Any = None) -> Any:
+    if not isinstance(data, Mapping):
+        raise InvalidPolicy(f"Expected a table in {where}, not {data!r}")
+    if key not in data:
+        if default is None:
+            raise InvalidPolicy(f"Missing {key!r} in {where}")
+        return default
+    value = data[key]
+    if not isinstance(value, type):
+        raise InvalidPolicy(f"Unexpected type for {key!r} in {where}: {value!r}")
+    return value
+
+
+def _strings(items: Any, where: str) -> list[str]:
+    if not isinstance(items, list) or not all(isinstance(i, str) for i in items):
+        raise InvalidPolicy(f"Expected a list of strings in {where}, not {items!r}")
+    return items
+
+
+def _constraints(items: Any, where: str) -> Iterable[ParameterizedConstraint]:
+    if not isinstance(items, list):
+        raise InvalidPolicy(f"Expected a list of constraints in {where}")
+    for item in items:
+        column = _get(item, "column", str, where)
+        if "." not in column:
+            raise InvalidPolicy(f"Expected fully-qualified column name: {column}")
+        yield ParameterizedConstraint(
+            column=column,
+            placeholder=_get(item, "placeholder", str, where),
+        )
+
+
+def _add_columns(
+    table: str,
+    columns: list[str] | str,
+    tables: set[str],
+    fq_columns: set[FqColumn],
+) -> None:
+    if columns == "*":
+        tables.add(table)
+    elif isinstance(columns, str):
+        raise InvalidPolicy(f"Expected a list of columns or '*' for table {table}")
+    else:
+        fq_columns.update(
+            FqColumn(table=table, column=column)
+            for column in _strings(columns, f"tables.{table}")
+        )
+
+
+def _parse(source: str, format: str) -> Any:
+    if format == "json":
+        return json.loads(source)
+
+    if format == "toml":
+        try:
+            import tomllib  # type: ignore
+
+            return tomllib.loads(source)
+        except ImportError:
+            pass
+
+        try:
+            import toml
+        except ImportError:
+            raise ImportError(
+                "Loading TOML policies on python < 3.11 requires the `toml` package"
+            )
+        return toml.loads(source)
+
+    raise InvalidPolicy(f"Unknown policy format: {format!r}")
+
+
+def load_policy(
+    source: str | Mapping[str, Any], *, format: str = "toml"
+) -> DeclarativeConstraints:
+    """Loads a declarative policy into a constraint validator. Policies are cached by
+    the hash of their content, so loading the same policy again, for example, on every
+    request for a tenant, returns the validator that was already built, along with its
+    compiled :class:`ValidatorPolicy <heimdallm.bifrosts.sql.policy.ValidatorPolicy>`.
+
+    :param source: The policy, as TOML or JSON text, or as an already-parsed mapping.
+    :param format: The format of the text, ``"toml"`` or ``"json"``.
+    :raises InvalidPolicy: If the policy is malformed.
+    :return: The constraint validator.
+    """
+    if isinstance(source, str):
+        content = f"{format}:{source}"
+    else:
+        content = "data:" + json.dumps(source, sort_keys=True)
+    key = hashlib.sha256(content.encode("utf8")).hexdigest()
+
+    validator: Optional[DeclarativeConstraints] = cache.get(key)
+    if validator is None:
+        data = _parse(source, format) if isinstance(source, str) else source
+        validator = DeclarativeConstraints(data)
+        cache.set(key, validator)
+    return validator
+
+
+def load_policy_file(path: Path | str) -> DeclarativeConstraints:
+    """Loads a declarative policy from a ``.toml`` or ``.json`` file, with
+    :func:`load_policy`.
+
+    :param path: The path to the policy file.
+    :raises InvalidPolicy: If the policy is malformed.
+    :return: The constraint validator.
+    """
+    path = Path(path)
+    format = path.suffix.lstrip(".").lower()
+    return load_policy(path.read_text(), format=format)
@@ -2,17 +2,27 @@ import re
 from abc import abstractmethod
 from itertools import chain
 from pathlib import Path
-from typing import TYPE_CHECKING, Sequence, cast
+from typing import TYPE_CHECKING, Iterable, Optional, Sequence, Union, cast
 
 import jinja2
 
+from heimdallm.cache import LRUCache
 from heimdallm.envelope import PromptEnvelope as _BasePromptEnvelope
 from heimdallm.llm import LLMIntegration
 
+from .schema import Schema
+
 if TYPE_CHECKING:
     import heimdallm.bifrosts.sql.validator
 
 THIS_DIR = Path(__file__).parent
+# stand-ins for the untrusted input, for rendering the envelope ahead of it
+_PLACEHOLDERS = ("\x00heimdallm-query\x00", "\x00heimdallm-untrusted-query\x00")
+# the most subsets of a pruned schema to keep rendered envelopes for
+_MAX_RENDERED = 128
+_MISSING = object()
+# the query, delimited by ```
+_DELIMITED = re.compile(r"```(?:sql)?(.*?)```", flags=re.DOTALL | re.IGNORECASE)
 _TMPL_ENV = jinja2.Environment(
     loader=jinja2.FileSystemLoader(THIS_DIR / "envelopes"),
     undefined=jinja2.StrictUndefined,
@@ -31,21 +41,35 @@ class PromptEnvelope(_BasePromptEnvelope):
         tweak the :meth:`wrap` and :meth:`unwrap` methods to account for quirks of the
         specific LLM.
     :param db_schema: The database schema of the database being queried. It is passed to
-        the LLM so that the LLM knows how the tables and columns are connected.
+        the LLM so that the LLM knows how the tables and columns are connected. Either
+        text, or a :class:`Schema <heimdallm.bifrosts.sql.schema.Schema>`, like the one
+        that a dialect's ``schema.introspect`` reads from a database.
     :param validators: The validators to use to validate the output of the LLM. They
         aren't used to validate here, but some of the validator's properties are added
         to the envelope to help guide the LLM to produce the correct output.
+    :param prune_schema: Whether to only include the tables of the schema that are
+        relevant to each input, instead of the whole schema. See
+        :meth:`Schema.relevant_tables
+        <heimdallm.bifrosts.sql.schema.Schema.relevant_tables>` for how they are
+        picked.
     """
 
     def __init__(
         self,
         *,
         llm: LLMIntegration,
-        db_schema: str,
+        db_schema: Union[str, Schema],
         validators: Sequence["heimdallm.bifrosts.sql.validator.ConstraintValidator"],
+        prune_schema: bool = False,
     ):
         self.db_schema = db_schema
         self.validators = validators
+        self.prune_schema = prune_schema
+        # the configuration that the envelope was last rendered with, and the parts of
+        # the rendered envelope around the untrusted input, for each rendered schema
+        self._rendered: Optional[tuple[tuple, LRUCache]] = None
+        # the schema that was last indexed, its index, and its text
+        self._schema_index: Optional[tuple[Union[str, Schema], Schema, str]] = None
         super().__init__(llm=llm)
 
     @abstractmethod
@@ -73,23 +97,107 @@ class PromptEnvelope(_BasePromptEnvelope):
         intended to be overridden, but not foribben either. Consider overriding the
         :meth:`template` and :meth:`params` properties first instead.
 
+        The envelope is only rendered once for its configuration, around a
+        placeholder, and the untrusted input is put in the placeholder's place on every
+        call. It's rendered again if the schema, the validators or the :meth:`params`
+        change. A template that does anything with the input but print it is rendered
+        with the input every time instead. With ``prune_schema``, the envelope is
+        rendered once for each distinct subset of the schema.
+
         :param untrusted_input: The untrusted input from the user.
         :return: The wrapped input to send to the LLM."""
+        if self.prune_schema:
+            db_schema = self.relevant_schema(untrusted_input)
+        else:
+            db_schema = self._schema()[1]
+
+        parts = self._parts(db_schema)
+        if parts is None:
+            return self._render(untrusted_input, db_schema, self.params)
+        prefix, suffix = parts
+        return prefix + str(untrusted_input) + suffix
+
+    @property
+    def prefix(self) -> str:
+        """The part of the wrapped input that comes before the untrusted input. It's
+        the same for every input, so an LLM provider can use it for server-side prompt
+        caching. It's empty if the template can't be rendered ahead of the input. With
+        ``prune_schema``, it's the prefix with the whole schema, which inputs that
+        aren't about any table in particular get.
+
+        :return: The prefix of the wrapped input."""
+        parts = self._parts(self._schema()[1])
+        return "" if parts is None else parts[0]
+
+    def relevant_schema(self, untrusted_input: str) -> str:
+        """Renders only the tables of the schema that are relevant to the untrusted
+        input. The schema is indexed once, and again only if it changes. If no table
+        is relevant, or the schema has no ``CREATE TABLE`` statements to index, the
+        whole schema is returned.
+
+        :param untrusted_input: The untrusted input from the user.
+        :return: The schema to show the LLM for the input."""
+        index, text = self._schema()
+        policies = [validator.compile() for validator in self.validators]
+        tables = index.relevant_tables(untrusted_input, policies)
+        if tables is None:
+            return text
+        return index.render(tables)
+
+    def _schema(self) -> tuple[Schema, str]:
+        """The index of the schema, and the schema as text for the LLM."""
+        db_schema = self.db_schema
+        if self._schema_index is None or self._schema_index[0] != db_schema:
+            if isinstance(db_schema, Schema):
+                self._schema_index = (db_schema, db_schema, db_schema.render())
+            else:
+                self._schema_index = (db_schema, Schema.parse(db_schema), db_schema)
+        return self._schema_index[1], self._schema_index[2]
+
+    def _render(self, untrusted_input: str, db_schema: str, extra_params: dict) -> str:
         all_idents = chain.from_iterable(
             v.requester_identities() for v in self.validators
         )
         id_constraints = " or ".join(str(ident) for ident in all_idents)
         params = {
             "id_constraints": id_constraints,
-            "db_schema": self.db_schema,
+            "db_schema": db_schema,
             "query": untrusted_input,
         }
-        params.update(self.params)
+        params.update(extra_params)
 
         tmpl = self.template(_TMPL_ENV)
         prompt = tmpl.render(params)
         return prompt
 
+    def _parts(self, db_schema: str) -> Optional[tuple[str, str]]:
+        """Renders the envelope with a schema around a placeholder, and splits it into
+        what comes before and after the untrusted input, or None if the template treats
+        the input as anything but text to print."""
+        extra_params = self.params
+        config = (self.db_schema, tuple(self.validators), extra_params)
+        if self._rendered is None or self._rendered[0] != config:
+            self._rendered = (config, LRUCache(max_size=_MAX_RENDERED))
+        rendered = self._rendered[1]
+
+        parts = rendered.get(db_schema, _MISSING)
+        if parts is not _MISSING:
+            return parts
+
+        parts = None
+        first = self._render(_PLACEHOLDERS[0], db_schema, extra_params)
+        if first.count(_PLACEHOLDERS[0]) == 1:
+            prefix, suffix = first.split(_PLACEHOLDERS[0])
+            # the same template with a different placeholder, of a different length,
+            # must only differ in the placeholder, or the input affects more than
+            # where it's printed
+            second = self._render(_PLACEHOLDERS[1], db_schema, extra_params)
+            if second == prefix + _PLACEHOLDERS[1] + suffix:
+                parts = (prefix, suffix)
+
+        rendered.set(db_schema, parts)
+        return parts
+
     def unwrap(self, untrusted_llm_output: str) -> str:
         """Unpack the SQL query from the LLM output by finding it (hopefully) among the
         delimiters.
@@ -100,14 +208,7 @@ class PromptEnvelope(_BasePromptEnvelope):
         if "```" in untrusted_llm_output:
             # sometimes the LLM is silly and likes to include the word "sql" inside
             # the delimiters. silly LLM!
-            match = cast(
-                re.Match,
-                re.search(
-                    r"```(?:sql)?(.*?)```",
-                    untrusted_llm_output,
-                    flags=re.DOTALL | re.IGNORECASE,
-                ),
-            )
+            match = cast(re.Match, _DELIMITED.search(untrusted_llm_output))
             unpacked = match.group(1)
         # otherwise, just return the whole thing, and we'll attempt to parse it
         # as is
@@ -119,6 +220,29 @@ class PromptEnvelope(_BasePromptEnvelope):
         unpacked = unpacked.strip()
         return unpacked
 
+    def unwrap_stream(self, untrusted_llm_output: Iterable[str]) -> str:
+        """Unpack the SQL query from the LLM output as it streams in, and stop reading
+        as soon as the closing delimiter arrives, so that any explanation that the LLM
+        adds after the query is never generated. The first delimited query in the output
+        can't change once both of its delimiters have arrived, so this always returns
+        what :meth:`unwrap` would have returned for the whole output.
+
+        If :meth:`unwrap` has been overridden, the whole output is read and passed to
+        it instead.
+
+        :param untrusted_llm_output: The chunks of output from the LLM.
+        :return: The SQL query."""
+        if type(self).unwrap is not PromptEnvelope.unwrap:
+            return super().unwrap_stream(untrusted_llm_output)
+
+        output = ""
+        for chunk in untrusted_llm_output:
+            output += chunk
+            # a delimiter can only have been completed by a chunk with a backtick
+            if "`" in chunk and _DELIMITED.search(output):
+                break
+        return self.unwrap(output)
+
 
 class TestSQLPromptEnvelope(PromptEnvelope):
     """
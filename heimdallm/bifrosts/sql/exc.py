@@ -270,3 +270,18 @@ class AliasConflict(BaseException):
         message = f"Alias `{alias}` conflicts with a table name or another alias"
         super().__init__(message, ctx=ctx)
         self.alias = alias
+
+
+class MissingPlaceholderValue(BaseException):
+    """
+    Thrown when the parameters for a query are missing a value for one of its
+    placeholders.
+
+    :param names: The names of the placeholders that have no value.
+    :param ctx: The context of the Bifrost traversal.
+    """
+
+    def __init__(self, *, names: list[str], ctx: TraverseContext):
+        message = f"Missing values for placeholders: {', '.join(names)}"
+        super().__init__(message, ctx=ctx)
+        self.names = names
@@ -0,0 +1,49 @@
+from typing import Any, Hashable
+
+from heimdallm.bifrosts.sql.schema import Introspector as _Introspector
+from heimdallm.bifrosts.sql.schema import Schema
+
+_COLUMNS = """
+SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE FROM information_schema.COLUMNS
+WHERE TABLE_SCHEMA = DATABASE()
+ORDER BY TABLE_NAME, ORDINAL_POSITION
+"""
+# checksums of the same columns, computed by the server, so that only one row comes
+# back. GROUP_CONCAT would be truncated at group_concat_max_len.
+_FINGERPRINT = """
+SELECT
+    DATABASE(),
+    COUNT(*),
+    BIT_XOR(CRC32(CONCAT_WS(' ', TABLE_NAME, COLUMN_NAME, COLUMN_TYPE))),
+    SUM(CRC32(CONCAT_WS(' ', TABLE_NAME, ORDINAL_POSITION, COLUMN_NAME))),
+    SUM(ORDINAL_POSITION * CRC32(COLUMN_TYPE))
+FROM information_schema.COLUMNS
+WHERE TABLE_SCHEMA = DATABASE()
+"""
+
+
+class Introspector(_Introspector):
+    """Reads the schema of the connection's current MySQL database from
+    ``information_schema.COLUMNS``."""
+
+    def fingerprint(self, conn: Any) -> Hashable:
+        """Checksums of the database's columns, computed by the server.
+
+        :param conn: A connection to the database.
+        :return: The fingerprint.
+        """
+        return ("mysql",) + self._fetchall(conn, _FINGERPRINT)[0]
+
+    def read(self, conn: Any) -> Schema:
+        """Reads the schema, with a ``CREATE TABLE`` statement of each table's columns
+        as its definition.
+
+        :param conn: A connection to the database.
+        :return: The schema.
+        """
+        return Schema.from_columns(self._fetchall(conn, _COLUMNS))
+
+
+#: Returns the :class:`Schema <heimdallm.bifrosts.sql.schema.Schema>` of a MySQL
+#: database, which is only read again when its columns change.
+introspect = Introspector()
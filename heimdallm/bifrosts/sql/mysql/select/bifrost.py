@@ -3,11 +3,13 @@ from pathlib import Path
 from lark import Lark
 
 from heimdallm.bifrosts.sql.bifrost import Bifrost as _SQLBifrost
+from heimdallm.grammar import registry as grammars
 
 from .. import presets
 
 _THIS_DIR = Path(__file__).parent
 _GRAMMAR_PATH = _THIS_DIR / "grammar.lark"
+_LALR_GRAMMAR_PATH = _THIS_DIR / "grammar_lalr.lark"
 
 
 class Bifrost(_SQLBifrost):
@@ -20,8 +22,14 @@ class Bifrost(_SQLBifrost):
     :param constraint_validators: A sequence of constraint validators that will be used
         to validate the parse tree returned by the ``tree_producer``. Only one validator
         needs to succeed for validation to pass.
+    :param validation_cache: An optional cache of validation results, keyed on the
+        unwrapped SQL query and the fingerprints of the constraint validators. Common
+        queries then skip parsing and validation entirely.
     """
 
+    dialect = "mysql"
+    backslash_strings = True
+
     @staticmethod
     def build_grammar() -> Lark:
         """
@@ -32,15 +40,33 @@ class Bifrost(_SQLBifrost):
 
         Outer joins are unsafe because the join constraint is not applied to the
         rows that would be considered "outer."
+
+        The grammar is compiled once per process and shared by every Bifrost of this
+        dialect, via :data:`heimdallm.grammar.registry`.
+        """
+        return grammars.get(
+            "mysql.select",
+            _GRAMMAR_PATH,
+            ambiguity="explicit",
+            maybe_placeholders=False,
+            propagate_positions=True,
+        )
+
+    @staticmethod
+    def build_fast_grammar() -> Lark:
+        """
+        Returns the deterministic LALR variant of the ``SELECT`` grammar, which is
+        tried before the Earley grammar. Unlike the Earley grammar, it can be cached on
+        disk with :meth:`heimdallm.grammar.GrammarRegistry.enable_disk_cache`.
         """
-        with open(_GRAMMAR_PATH, "r") as h:
-            grammar = Lark(
-                ambiguity="explicit",
-                maybe_placeholders=False,
-                propagate_positions=True,
-                grammar=h,
-            )
-        return grammar
+        return grammars.get(
+            "mysql.select.lalr",
+            _LALR_GRAMMAR_PATH,
+            parser="lalr",
+            lexer="contextual",
+            maybe_placeholders=False,
+            propagate_positions=True,
+        )
 
     @classmethod
     def reserved_keywords(self) -> set[str]:
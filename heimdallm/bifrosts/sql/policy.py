@@ -0,0 +1,216 @@
+from dataclasses import dataclass
+from itertools import chain
+from typing import TYPE_CHECKING, Callable, Optional, cast
+
+from heimdallm.context import TraverseContext
+
+from . import exc
+from .common import ANY_JOIN, FqColumn, JoinCondition, ParameterizedConstraint
+from .visitors.facets import Facets
+
+if TYPE_CHECKING:
+    from .validator import ConstraintValidator
+
+
+@dataclass(frozen=True)
+class ValidatorPolicy:
+    """A constraint validator, compiled into an immutable set of rules that a query's
+    facets can be checked against. Everything that the validator returns from its
+    methods is gathered up front, into hashed sets, so that checking a query never calls
+    back into the validator for anything but the column and function predicates that
+    don't have an allowlist.
+
+    Use :meth:`ConstraintValidator.compile
+    <heimdallm.bifrosts.sql.validator.ConstraintValidator.compile>` to get the policy
+    of a validator, instead of creating this directly.
+    """
+
+    # the requester identities, including those annotated on the allowed joins
+    requester_identities: frozenset[ParameterizedConstraint]
+    # in the validator's order, so that the first missing constraint is reported
+    parameterized_constraints: tuple[ParameterizedConstraint, ...]
+    # whether any join condition is allowed
+    any_join: bool
+    # in the validator's order, with every join that it returned, even those that are
+    # equal to another join, like the same join with a different identity annotation
+    allowed_joins: tuple[JoinCondition, ...]
+    # the allowed joins again, for checking a query's joins against
+    allowed_join_set: frozenset[JoinCondition]
+    # every column named in the allowed join conditions, which may always be used in a
+    # condition
+    join_columns: frozenset[FqColumn]
+    max_limit: Optional[int]
+    # the allowlists, where the validator has them, and the predicates otherwise
+    select_columns: Optional[frozenset[FqColumn]]
+    condition_columns: Optional[frozenset[FqColumn]]
+    functions: Optional[frozenset[str]]
+    select_column_predicate: Callable[[FqColumn], bool]
+    condition_column_predicate: Callable[[FqColumn], bool]
+    function_predicate: Callable[[str], bool]
+
+    @classmethod
+    def from_validator(cls, validator: "ConstraintValidator") -> "ValidatorPolicy":
+        """Compiles a validator into a policy.
+
+        :param validator: The constraint validator.
+        :return: The policy.
+        """
+        allowed_joins = tuple(validator.allowed_joins())
+        allowed_join_set = frozenset(allowed_joins)
+        join_identities = chain.from_iterable(
+            join.requester_identities for join in allowed_joins
+        )
+        join_columns = frozenset(
+            chain.from_iterable(
+                (join.first, join.second) for join in allowed_joins if join != ANY_JOIN
+            )
+        )
+
+        select_columns = _frozen(validator.select_column_allowlist())
+        condition_columns = _frozen(validator.condition_column_allowlist())
+        # the default condition_column_allowed defers to select_column_allowed, so the
+        # select allowlist stands in for it too
+        if condition_columns is None and not _overrides(
+            validator, "condition_column_allowed"
+        ):
+            condition_columns = select_columns
+
+        return cls(
+            requester_identities=frozenset(
+                chain(validator.requester_identities(), join_identities)
+            ),
+            parameterized_constraints=tuple(validator.parameterized_constraints()),
+            any_join=ANY_JOIN in allowed_join_set,
+            allowed_joins=allowed_joins,
+            allowed_join_set=allowed_join_set,
+            join_columns=join_columns,
+            max_limit=validator.max_limit(),
+            select_columns=select_columns,
+            condition_columns=condition_columns,
+            functions=_frozen(validator.function_allowlist()),
+            select_column_predicate=validator.select_column_allowed,
+            condition_column_predicate=validator.condition_column_allowed,
+            function_predicate=validator.can_use_function,
+        )
+
+    def select_column_allowed(self, column: FqColumn) -> bool:
+        """Whether a column may be selected."""
+        if self.select_columns is not None:
+            return column in self.select_columns
+        return self.select_column_predicate(column)
+
+    def condition_column_allowed(self, column: FqColumn) -> bool:
+        """Whether a column may be used in a condition."""
+        if column in self.join_columns:
+            return True
+        if self.condition_columns is not None:
+            return column in self.condition_columns
+        return self.condition_column_predicate(column)
+
+    def join_allowed(self, join: JoinCondition) -> bool:
+        """Whether a join condition is allowed."""
+        return self.any_join or join in self.allowed_join_set
+
+    def can_use_function(self, function: str) -> bool:
+        """Whether a function may be used."""
+        if self.functions is not None:
+            return function in self.functions
+        return self.function_predicate(function)
+
+    def check(self, facets: Facets, *, ctx: TraverseContext) -> None:
+        """Checks the facets of a query against the policy, raising the first violation
+        that it finds.
+
+        :param facets: The facets of the query.
+        :param ctx: The context of the traversal, for exceptions.
+        """
+        # check the select column allowlist
+        for fq_column in facets.selected_columns:
+            if not self.select_column_allowed(fq_column):
+                raise exc.IllegalSelectedColumn(
+                    column=fq_column.name,
+                    ctx=ctx,
+                )
+
+        for scope in facets.scopes.values():
+            # check the join condition allowlist
+            for table, join_specs in scope.joined_tables.items():
+                for join_spec in join_specs:
+                    if not self.join_allowed(join_spec):
+                        raise exc.IllegalJoinTable(join=join_spec, ctx=ctx)
+
+            # ensure that the selected table is joined to another table, if joins exist
+            if (
+                scope.joined_tables
+                and not scope.joined_tables[cast(str, scope.selected_table)]
+            ):
+                raise exc.DisconnectedTable(
+                    table=cast(str, scope.selected_table),
+                    ctx=ctx,
+                )
+
+            # ensure that all joins were joined on columns that exist on the joined
+            # tables
+            if scope.bad_joins:
+                raise exc.BogusJoinedTable(
+                    table=scope.bad_joins[0],
+                    ctx=ctx,
+                )
+
+        # check the condition column allowlist. all columns specified in the join
+        # conditions are automatically included in it
+        for fq_column in facets.condition_columns:
+            if not self.condition_column_allowed(fq_column):
+                raise exc.IllegalConditionColumn(
+                    column=fq_column,
+                    ctx=ctx,
+                )
+
+        # get all of the constraints that the query MUST be constrained by in
+        # the WHERE clause
+        for constraint in self.parameterized_constraints:
+            if constraint not in facets.parameterized_constraints:
+                raise exc.MissingParameterizedConstraint(
+                    column=constraint.fq_column,
+                    placeholder=constraint.placeholder,
+                    ctx=ctx,
+                )
+
+        # verify that the query is constrained by at least one of the
+        # requester's identities. this means that the results of the query will
+        # be restricted to data that only the requester has access to.
+        if self.requester_identities and self.requester_identities.isdisjoint(
+            facets.parameterized_constraints
+        ):
+            raise exc.MissingRequiredIdentity(
+                identities=set(self.requester_identities),
+                ctx=ctx,
+            )
+
+        # check that the query limits the rows correctly, if we restrict to a limit
+        if self.max_limit is not None:
+            for limit in facets.limits.values():
+                if limit is None or limit > self.max_limit:
+                    raise exc.TooManyRows(
+                        limit=limit,
+                        ctx=ctx,
+                    )
+
+        # check that every function used has been allowlisted
+        for fn in facets.functions:
+            if not self.can_use_function(fn):
+                raise exc.IllegalFunction(
+                    function=fn,
+                    ctx=ctx,
+                )
+
+
+def _frozen(items) -> Optional[frozenset]:
+    return None if items is None else frozenset(items)
+
+
+def _overrides(validator: "ConstraintValidator", name: str) -> bool:
+    """Whether a validator overrides one of the base validator's methods."""
+    from .validator import ConstraintValidator
+
+    return getattr(type(validator), name) is not getattr(ConstraintValidator, name)
@@ -0,0 +1,51 @@
+from typing import Any, Hashable
+
+from heimdallm.bifrosts.sql.schema import Introspector as _Introspector
+from heimdallm.bifrosts.sql.schema import Schema
+
+_COLUMNS = """
+SELECT table_name, column_name, data_type FROM information_schema.columns
+WHERE table_schema = current_schema()
+ORDER BY table_name, ordinal_position
+"""
+# a hash of the same columns, computed by the server, so that only one row comes back
+_FINGERPRINT = """
+SELECT
+    current_database(),
+    current_schema(),
+    md5(
+        string_agg(
+            table_name || '.' || column_name || ' ' || data_type,
+            ',' ORDER BY table_name, ordinal_position
+        )
+    )
+FROM information_schema.columns
+WHERE table_schema = current_schema()
+"""
+
+
+class Introspector(_Introspector):
+    """Reads the schema of the connection's current Postgres schema from
+    ``information_schema.columns``."""
+
+    def fingerprint(self, conn: Any) -> Hashable:
+        """A hash of the schema's columns, computed by the server.
+
+        :param conn: A connection to the database.
+        :return: The fingerprint.
+        """
+        return ("postgres",) + self._fetchall(conn, _FINGERPRINT)[0]
+
+    def read(self, conn: Any) -> Schema:
+        """Reads the schema, with a ``CREATE TABLE`` statement of each table's columns
+        as its definition.
+
+        :param conn: A connection to the database.
+        :return: The schema.
+        """
+        return Schema.from_columns(self._fetchall(conn, _COLUMNS))
+
+
+#: Returns the :class:`Schema <heimdallm.bifrosts.sql.schema.Schema>` of a Postgres
+#: database, which is only read again when its columns change.
+introspect = Introspector()
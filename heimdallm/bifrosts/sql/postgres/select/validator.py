@@ -1,3 +1,5 @@
+from typing import Iterable, Optional
+
 from heimdallm.bifrosts.sql.validator import (
     ConstraintValidator as _SQLConstraintValidator,
 )
@@ -18,3 +20,14 @@ class ConstraintValidator(_SQLConstraintValidator):
         :return: Whether or not the function is allowed.
         """
         return function in presets.safe_functions
+
+    def function_allowlist(self) -> Optional[Iterable[str]]:
+        """
+        Returns the list of safe functions, unless :meth:`can_use_function` has been
+        overridden, in which case it has the final say.
+
+        :return: The allowed functions, or None.
+        """
+        if type(self).can_use_function is ConstraintValidator.can_use_function:
+            return presets.safe_functions
+        return None
@@ -1,16 +1,19 @@
-from typing import Generator, Iterable, cast
+from typing import Any, Generator, Iterable, cast
 
-from lark import Discard, Token, Tree, v_args
+from lark import Discard, Lark, ParseTree, Token, Tree, v_args
+from lark.reconstruct import Reconstructor
+from lark.utils import is_id_continue
 from lark.visitors import Transformer as _Transformer
 
-from heimdallm.bifrosts.sql.utils.context import has_subquery, in_subquery
+from heimdallm.bifrosts.sql.utils.context import has_subquery
 from heimdallm.context import TraverseContext
 
 from . import exc
 from .common import FqColumn
 from .utils.identifier import get_identifier, is_count_function
-from .validator import ConstraintValidator
-from .visitors.aliases import AliasCollector
+from .utils.placeholders import LITERAL_TYPES
+from .policy import ValidatorPolicy
+from .visitors.analysis import QueryAnalysis
 
 
 def _build_limit_tree(limit, offset=None):
@@ -18,7 +21,7 @@ def _build_limit_tree(limit, offset=None):
         Token("LIMIT", "LIMIT"),
         Tree(
             "limit",
-            [Token("NUMBER", limit)],
+            [Token("NUMBER", str(limit))],
         ),
     ]
     if offset:
@@ -27,16 +30,16 @@ def _build_limit_tree(limit, offset=None):
                 Token("OFFSET", "OFFSET"),
                 Tree(
                     "offset",
-                    [Token("NUMBER", offset)],
+                    [Token("NUMBER", str(offset))],
                 ),
             ]
         )
     return Tree("limit_clause", children)
 
 
-def add_limit(limit_placeholder, max_limit: int):
+def add_limit(limit_placeholder, max_limit: int) -> bool:
     """ensures that a limit exists on the limit placeholder, and that it is not
-    greater than the max limit"""
+    greater than the max limit. returns whether the limit was changed"""
 
     # existing limit? test and maybe replace it
     if limit_placeholder.children:
@@ -54,11 +57,14 @@ def add_limit(limit_placeholder, max_limit: int):
         if current_limit > max_limit:
             limit_tree = _build_limit_tree(max_limit, current_offset)
             limit_placeholder.children[0] = limit_tree
+            return True
+        return False
 
     # adding a limit? just append it
     else:
         limit_tree = _build_limit_tree(max_limit)
         limit_placeholder.children.append(limit_tree)
+        return True
 
 
 def qualify_column(fq_column: FqColumn) -> Tree:
@@ -102,28 +108,36 @@ class ReconstructTransformer(_Transformer):
     def __init__(
         self,
         *,
-        validator: ConstraintValidator,
+        policy: ValidatorPolicy,
+        analysis: QueryAnalysis,
         reserved_keywords: set[str],
         ctx: TraverseContext
     ):
-        self._validator = validator
-        self._collector = AliasCollector(reserved_keywords=reserved_keywords, ctx=ctx)
+        self._policy = policy
+        self._analysis = analysis
+        self._collector = analysis.aliases
         self._last_discarded_column: FqColumn | None = None
         self._reserved_keywords = reserved_keywords
         self._ctx = ctx
+        # whether the transformed tree differs from the original
+        self.changed = False
+        # every column that we asked the validator about, and its answer, in order. the
+        # transformed tree depends on nothing else from the validator but its max limit
+        self.decisions: list[tuple[FqColumn, bool]] = []
         super().__init__()
 
-    def transform(self, tree):
-        self._collector.visit(tree)
-        return super().transform(tree)
+    def _select_column_allowed(self, column: FqColumn) -> bool:
+        allowed = self._policy.select_column_allowed(column)
+        self.decisions.append((column, allowed))
+        return allowed
 
     def _copy_tree(self, tree: Tree) -> Tree:
         return Tree(tree.data, tree.children, tree.meta)
 
     def select_statement(self, tree: Tree):
         """checks if a limit needs to be added or adjusted"""
-        if not in_subquery(tree):
-            max_limit = self._validator.max_limit()
+        if not self._analysis.in_subquery(tree):
+            max_limit = self._policy.max_limit
 
             if max_limit is not None:
                 for child in tree.children:
@@ -131,7 +145,8 @@ class ReconstructTransformer(_Transformer):
                         continue
 
                     if child.data == "limit_placeholder":
-                        add_limit(child, max_limit)
+                        if add_limit(child, max_limit):
+                            self.changed = True
                         break
 
         return self._copy_tree(tree)
@@ -183,6 +198,7 @@ class ReconstructTransformer(_Transformer):
                     )
                 )
                 tree._meta = old_meta
+                self.changed = True
 
         # if there's only one fq column associated with this alias, then we know it's
         # not a composite alias, so we can fully qualify it.
@@ -190,6 +206,7 @@ class ReconstructTransformer(_Transformer):
             old_meta = tree.meta
             tree = qualify_column(next(iter(fq_columns)))
             tree._meta = old_meta
+            self.changed = True
 
         # if it's a composite alias, we can't fully qualify it, so we leave it alone.
         elif len(fq_columns) > 1:
@@ -231,8 +248,9 @@ class ReconstructTransformer(_Transformer):
                 if table_name is not None:
                     column = FqColumn(table=table_name, column=column_name)
 
-                    if not self._validator.select_column_allowed(column):
+                    if not self._select_column_allowed(column):
                         self._last_discarded_column = column
+                        self.changed = True
                         return Discard
 
         return self._copy_tree(tree)
@@ -247,3 +265,63 @@ def postproc(items: Iterable[PostProcToken]) -> Generator[PostProcToken, None, N
             yield " "
             continue
         yield token
+
+
+def reconstruct(grammar: Lark, tree: ParseTree) -> str:
+    """Writes a fixed parse tree back out as a query. The positions of the tree's
+    placeholders are moved to where they are in the new query, so that the tree can be
+    used as though it had been parsed from the query. The tokens are shared with the
+    original tree, so the positions of its literals in the new query are kept on the
+    tree's root, by the literal token's id, instead of on the tokens."""
+
+    # the reconstructor writes out the tree's own tokens, so we can recognize the
+    # placeholders' identifiers by their identity
+    placeholders: dict[int, Tree] = {}
+    for node in tree.find_data("placeholder"):
+        ident = node.children[-1]
+        placeholders[id(ident)] = node
+
+    literals: dict[int, tuple[int, int]] = {}
+    cast(Any, tree.meta).literal_positions = literals
+
+    def write(items: Iterable[PostProcToken]) -> Generator[str, None, None]:
+        offset = 0
+        prev_offset = 0
+        prev_item = ""
+        for item in postproc(items):
+            # the same spacing rule as the reconstructor's
+            if prev_item and item and is_id_continue(prev_item[-1]):
+                if is_id_continue(item[0]):
+                    yield " "
+                    offset += 1
+
+            node = placeholders.get(id(item))
+            if node is not None:
+                # the placeholder's start is the ":" that precedes its identifier
+                node.meta.start_pos = prev_offset
+                node.meta.end_pos = offset + len(item)
+            elif isinstance(item, Token) and item.type in LITERAL_TYPES:
+                literals[id(item)] = (offset, offset + len(item))
+
+            yield item
+            prev_offset = offset
+            offset += len(item)
+            prev_item = item
+
+    def special(sym):
+        return Token("IGNORE", sym.name)
+
+    # the reconstructor rewrites the tree that it's given in place, so give it a copy
+    # of the tree's structure, which shares the tree's tokens and metadata
+    def copy_structure(node: Tree) -> Tree:
+        children = [
+            copy_structure(child) if isinstance(child, Tree) else child
+            for child in node.children
+        ]
+        return Tree(node.data, children, node.meta)
+
+    return Reconstructor(grammar, {"_WS": special}).reconstruct(
+        copy_structure(tree),
+        postproc=write,
+        insert_spaces=False,
+    )
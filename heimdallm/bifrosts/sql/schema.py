@@ -0,0 +1,395 @@
+import re
+from abc import ABC, abstractmethod
+from collections import Counter, deque
+from dataclasses import dataclass
+from itertools import groupby
+from operator import itemgetter
+from typing import TYPE_CHECKING, Any, Hashable, Iterable, Optional, Sequence
+
+from heimdallm.cache import LRUCache
+
+from .common import ANY_JOIN
+
+if TYPE_CHECKING:
+    from .policy import ValidatorPolicy
+
+# the start of a table definition, with its (maybe quoted, maybe schema-qualified) name
+_CREATE_TABLE = re.compile(
+    r"\bCREATE\s+(?:TEMP(?:ORARY)?\s+)?TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?"
+    r"((?:[`\"\[]?[\w$]+[`\"\]]?\.)?[`\"\[]?[\w$ ]+?[`\"\]]?)\s*\(",
+    flags=re.IGNORECASE,
+)
+# the first word of a table element that is a constraint, not a column
+_CONSTRAINT_KEYWORDS = {
+    "constraint",
+    "primary",
+    "foreign",
+    "unique",
+    "check",
+    "key",
+    "index",
+    "fulltext",
+    "spatial",
+    "exclude",
+    "period",
+}
+_QUOTES = '`"[]'
+_WORD = re.compile(r"[a-z0-9_]+")
+_NON_WORD = re.compile(r"[^a-z0-9_]+")
+# a column name in more tables than this is too common, like ``id`` or
+# ``last_update``, to say anything about which table a question is about
+COMMON_COLUMN_TABLES = 3
+
+
+@dataclass(frozen=True)
+class Table:
+    """A table of a database schema.
+
+    :param name: The name of the table, without quotes or a schema qualifier.
+    :param columns: The names of the table's columns, in order.
+    :param definition: The definition of the table, as it's shown to the LLM, usually
+        the ``CREATE TABLE`` statement.
+    """
+
+    name: str
+    columns: tuple[str, ...]
+    definition: str
+
+    @classmethod
+    def from_columns(cls, name: str, columns: Sequence[tuple[str, str]]) -> "Table":
+        """Builds a table, and a ``CREATE TABLE`` statement for its definition, from
+        its columns.
+
+        :param name: The name of the table.
+        :param columns: The name and type of each column, in order.
+        :return: The table.
+        """
+        lines = ",\n".join(f"    {column} {type}" for column, type in columns)
+        return cls(
+            name=name,
+            columns=tuple(column for column, _ in columns),
+            definition=f"CREATE TABLE {name} (\n{lines}\n);",
+        )
+
+
+@dataclass(frozen=True)
+class Schema:
+    """An index of the tables and columns of a database schema, for rendering only the
+    part of the schema that's relevant to a question.
+
+    :param tables: The tables, in the order that they were defined.
+    :param preamble: Any text before the first table definition, which is always
+        rendered.
+    """
+
+    tables: tuple[Table, ...]
+    preamble: str = ""
+
+    @classmethod
+    def parse(cls, db_schema: str) -> "Schema":
+        """Parses the ``CREATE TABLE`` statements out of a schema. Anything else after
+        a table's statement, like its indexes, is kept in the table's definition.
+
+        :param db_schema: The schema, as you would pass it to a prompt envelope.
+        :return: The schema's index. It has no tables if the schema has no ``CREATE
+            TABLE`` statements.
+        """
+        matches = list(_CREATE_TABLE.finditer(db_schema))
+        if not matches:
+            return cls(tables=(), preamble=db_schema.strip())
+
+        tables = []
+        for i, match in enumerate(matches):
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(db_schema)
+            name = match.group(1).split(".")[-1].strip(_QUOTES)
+            body = _parenthesized(db_schema, match.end() - 1)
+            tables.append(
+                Table(
+                    name=name,
+                    columns=tuple(_columns(body)),
+                    definition=db_schema[match.start() : end].strip(),
+                )
+            )
+        return cls(
+            tables=tuple(tables), preamble=db_schema[: matches[0].start()].strip()
+        )
+
+    @classmethod
+    def from_columns(cls, columns: Iterable[tuple[str, str, str]]) -> "Schema":
+        """Builds a schema from the columns of a catalog, like
+        ``information_schema.columns``.
+
+        :param columns: The table name, column name and column type of each column,
+            ordered by table, and then by the column's position in its table.
+        :return: The schema.
+        """
+        return cls(
+            tables=tuple(
+                Table.from_columns(name, [(column, type) for _, column, type in rows])
+                for name, rows in groupby(columns, key=itemgetter(0))
+            )
+        )
+
+    def render(self, tables: Optional[Iterable[str]] = None) -> str:
+        """Renders the schema, or only some of its tables, in their original order.
+
+        :param tables: The names of the tables to render, or None for all of them.
+        :return: The rendered schema.
+        """
+        names = None if tables is None else {name.lower() for name in tables}
+        parts = [self.preamble] if self.preamble else []
+        parts.extend(
+            table.definition
+            for table in self.tables
+            if names is None or table.name.lower() in names
+        )
+        return "\n".join(parts)
+
+    def relevant_tables(
+        self, question: str, policies: Sequence["ValidatorPolicy"] = ()
+    ) -> Optional[list[str]]:
+        """Picks the tables that are relevant to a question:
+
+        * the tables whose name, or the name of one of their columns, appears in the
+          question. If the validators have column allowlists, only allowed columns are
+          matched.
+        * the tables of the validators' requester identities and parameterized
+          constraints, which the query has to use.
+        * the tables that connect all of the above through the validators' allowed
+          joins, on the shortest join paths between them.
+
+        :param question: The untrusted input from the user.
+        :param policies: The compiled policies of the validators.
+        :return: The names of the relevant tables, in the schema's order, or None if
+            nothing in the question matched, and the whole schema should be used.
+        """
+        by_name = {table.name.lower(): table for table in self.tables}
+        terms = set()
+        words = _WORD.findall(question.lower())
+        for word, next_word in zip(words, words[1:] + [""]):
+            terms.update(_stems(word))
+            # multi-word column names, like "first name" for ``first_name``
+            if next_word:
+                terms.update(_stems(f"{word}_{next_word}"))
+
+        allowed = _allowed_columns(policies)
+        column_tables = Counter(
+            column.lower() for table in self.tables for column in set(table.columns)
+        )
+        matched = set()
+        for name, table in by_name.items():
+            if _stems(_term(name)) & terms:
+                matched.add(name)
+                continue
+            for column in table.columns:
+                column = column.lower()
+                if column_tables[column] > COMMON_COLUMN_TABLES:
+                    continue
+                if allowed is not None and (name, column) not in allowed:
+                    continue
+                if _stems(_term(column)) & terms:
+                    matched.add(name)
+                    break
+
+        if not matched:
+            return None
+
+        for policy in policies:
+            for constraint in policy.requester_identities.union(
+                policy.parameterized_constraints
+            ):
+                table_name = constraint.fq_column.table.lower()
+                if table_name in by_name:
+                    matched.add(table_name)
+
+        # connect the tables, one at a time, to the ones that are already connected
+        graph = _join_graph(policies)
+        ordered = [name for name in by_name if name in matched]
+        selected = {ordered[0]}
+        for name in ordered[1:]:
+            selected.update(_shortest_path(graph, selected, name) or [name])
+
+        return [table.name for table in self.tables if table.name.lower() in selected]
+
+
+class Introspector(ABC):
+    """Reads the schema of a database from its catalog, into a :class:`Schema`. Each
+    dialect has its own, as ``heimdallm.bifrosts.sql.<dialect>.schema.introspect``.
+
+    Reading the whole catalog is only done when the schema changes. Every call first
+    takes a cheap :meth:`fingerprint` of the schema, and a schema that has been read
+    before with the same fingerprint is returned from the cache.
+
+    :param cache: The cache of schemas, keyed on their fingerprints.
+    """
+
+    def __init__(self, cache: Optional[LRUCache[Schema]] = None):
+        self.cache: LRUCache[Schema] = LRUCache(max_size=32) if cache is None else cache
+
+    def __call__(self, conn: Any) -> Schema:
+        """Returns the schema of a database, reading it from the catalog only if it
+        has changed since it was last read.
+
+        :param conn: A DB-API connection to the database.
+        :return: The schema.
+        """
+        key = self.fingerprint(conn)
+        schema = self.cache.get(key)
+        if schema is None:
+            schema = self.read(conn)
+            self.cache.set(key, schema)
+        return schema
+
+    @abstractmethod
+    def fingerprint(self, conn: Any) -> Hashable:
+        """A cheap fingerprint of the database's schema, which changes whenever the
+        schema does. Two databases with the same fingerprint must have the same
+        schema.
+
+        :param conn: A DB-API connection to the database.
+        :return: The fingerprint.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def read(self, conn: Any) -> Schema:
+        """Reads the schema from the database's catalog, without the cache.
+
+        :param conn: A DB-API connection to the database.
+        :return: The schema.
+        """
+        raise NotImplementedError
+
+    def _fetchall(self, conn: Any, query: str, params: Sequence = ()) -> list[Any]:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, params)
+            return [tuple(row) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+
+def _term(name: str) -> str:
+    """A table or column name as words joined by underscores, the way that a question's
+    consecutive words are."""
+    return _NON_WORD.sub("_", name).strip("_")
+
+
+def _stems(word: str) -> set[str]:
+    """A word and its likely singular forms, so that "customers" matches
+    ``customer``."""
+    stems = {word}
+    if word.endswith("ies"):
+        stems.add(word[:-3] + "y")
+    if word.endswith("es"):
+        stems.add(word[:-2])
+    if word.endswith("s") and not word.endswith("ss"):
+        stems.add(word[:-1])
+    return stems
+
+
+def _parenthesized(text: str, start: int) -> str:
+    """The text inside the parentheses that open at ``start``, up to the matching
+    close, skipping over quoted strings."""
+    depth = 0
+    quote = None
+    for i in range(start, len(text)):
+        char = text[i]
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"`":
+            quote = char
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                return text[start + 1 : i]
+    return text[start + 1 :]
+
+
+def _columns(body: str) -> Iterable[str]:
+    """The column names of the elements of a table definition's body."""
+    depth = 0
+    quote = None
+    element_start = 0
+    elements = []
+    for i, char in enumerate(body):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"`":
+            quote = char
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            elements.append(body[element_start:i])
+            element_start = i + 1
+    elements.append(body[element_start:])
+
+    for element in elements:
+        element = element.strip()
+        if not element:
+            continue
+        if element[0] in _QUOTES:
+            close = "]" if element[0] == "[" else element[0]
+            end = element.find(close, 1)
+            yield element[1:end] if end > 0 else element[1:]
+            continue
+        first = element.split(None, 1)[0]
+        if first.lower() not in _CONSTRAINT_KEYWORDS:
+            yield first
+
+
+def _allowed_columns(
+    policies: Sequence["ValidatorPolicy"],
+) -> Optional[set[tuple[str, str]]]:
+    """The (table, column) pairs that any of the validators allow to be selected, or
+    None if any validator decides with a predicate instead of an allowlist."""
+    allowed: set[tuple[str, str]] = set()
+    for policy in policies:
+        if policy.select_columns is None:
+            return None
+        allowed.update(
+            (column.table.lower(), column.column.lower())
+            for column in policy.select_columns
+        )
+    return allowed
+
+
+def _join_graph(policies: Sequence["ValidatorPolicy"]) -> dict[str, set[str]]:
+    graph: dict[str, set[str]] = {}
+    for policy in policies:
+        for join in policy.allowed_joins:
+            if join == ANY_JOIN:
+                continue
+            first, second = join.first.table.lower(), join.second.table.lower()
+            graph.setdefault(first, set()).add(second)
+            graph.setdefault(second, set()).add(first)
+    return graph
+
+
+def _shortest_path(
+    graph: dict[str, set[str]], sources: set[str], target: str
+) -> Optional[list[str]]:
+    """The tables on the shortest join path from any of the sources to the target, or
+    None if there's no path."""
+    previous: dict[str, Optional[str]] = {source: None for source in sources}
+    queue = deque(sorted(sources))
+    while queue:
+        node = queue.popleft()
+        if node == target:
+            path = []
+            current: Optional[str] = node
+            while current is not None:
+                path.append(current)
+                current = previous[current]
+            return path
+        for neighbor in sorted(graph.get(node, ())):
+            if neighbor not in previous:
+                previous[neighbor] = node
+                queue.append(neighbor)
+    return None
@@ -0,0 +1,60 @@
+import hashlib
+from typing import Any, Hashable
+
+from heimdallm.bifrosts.sql.schema import Introspector as _Introspector
+from heimdallm.bifrosts.sql.schema import Schema, Table
+
+# the definitions of the tables that can be queried, without sqlite's internal tables,
+# virtual tables, or the shadow tables that hold the data of virtual tables
+_TABLES = """
+SELECT name, sql FROM sqlite_master AS t
+WHERE type = 'table'
+    AND sql IS NOT NULL
+    AND name NOT LIKE 'sqlite\\_%' ESCAPE '\\'
+    AND sql NOT LIKE 'CREATE VIRTUAL%'
+    AND NOT EXISTS (
+        SELECT 1 FROM sqlite_master AS v
+        WHERE v.sql LIKE 'CREATE VIRTUAL%' AND t.name LIKE v.name || '\\_%' ESCAPE '\\'
+    )
+ORDER BY name
+"""
+_COLUMNS = "SELECT name FROM pragma_table_info(?) ORDER BY cid"
+
+
+class Introspector(_Introspector):
+    """Reads the schema of a sqlite database from ``sqlite_master``, and the columns of
+    each table from ``pragma_table_info``. Unlike :meth:`sqlite3.Connection.iterdump`,
+    none of the database's data is read."""
+
+    def fingerprint(self, conn: Any) -> Hashable:
+        """A hash of the table definitions in ``sqlite_master``.
+
+        :param conn: A connection to the database.
+        :return: The fingerprint.
+        """
+        tables = self._fetchall(conn, _TABLES)
+        return "sqlite:" + hashlib.sha256(repr(tables).encode("utf8")).hexdigest()
+
+    def read(self, conn: Any) -> Schema:
+        """Reads the schema, with each table's ``CREATE TABLE`` statement as its
+        definition.
+
+        :param conn: A connection to the database.
+        :return: The schema.
+        """
+        tables = []
+        for name, sql in self._fetchall(conn, _TABLES):
+            columns = self._fetchall(conn, _COLUMNS, (name,))
+            tables.append(
+                Table(
+                    name=name,
+                    columns=tuple(column for column, in columns),
+                    definition=f"{sql};",
+                )
+            )
+        return Schema(tables=tuple(tables))
+
+
+#: Returns the :class:`Schema <heimdallm.bifrosts.sql.schema.Schema>` of a sqlite
+#: database, which is only read again when its tables change.
+introspect = Introspector()
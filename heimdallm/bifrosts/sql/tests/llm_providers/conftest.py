@@ -0,0 +1,16 @@
+import threading
+from typing import Iterator
+
+import pytest
+
+from .utils import StubServer
+
+
+@pytest.fixture
+def server() -> Iterator[StubServer]:
+    server = StubServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,226 @@
+import asyncio
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+from heimdallm.bifrosts.sql.sqlite.select.bifrost import Bifrost
+from heimdallm.bifrosts.sql.sqlite.select.envelope import PromptEnvelope
+from heimdallm.llm import LLMIntegration
+from heimdallm.llm_providers.cache import (
+    CachingLLM,
+    MemoryCacheBackend,
+    SQLiteCacheBackend,
+)
+from heimdallm.llm_providers.mock import AsyncEchoMockLLM
+
+from ..sql.select.utils import PermissiveConstraints
+
+
+class _CountingLLM(LLMIntegration):
+    def __init__(self, model: str = "test-model"):
+        self.model = model
+        self.calls = 0
+
+    def complete(self, untrusted_input: str) -> str:
+        self.calls += 1
+        return untrusted_input.upper()
+
+
+class _StreamingLLM(_CountingLLM):
+    """streams its completion a word at a time, and numbers its candidates"""
+
+    def __init__(self):
+        super().__init__()
+        self.closed = False
+
+    def stream(self, untrusted_input: str) -> Iterator[str]:
+        self.calls += 1
+        try:
+            for word in untrusted_input.split():
+                yield word + " "
+        finally:
+            self.closed = True
+
+    def complete_many(self, untrusted_input: str, n: int) -> Iterator[str]:
+        for _ in range(n):
+            yield self.complete(untrusted_input) + str(self.calls)
+
+
+class _FailingLLM(LLMIntegration):
+    def complete(self, untrusted_input: str) -> str:
+        raise RuntimeError("LLM is down")
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path: Path):
+    if request.param == "memory":
+        yield MemoryCacheBackend()
+    else:
+        backend = SQLiteCacheBackend(tmp_path / "cache.sqlite3")
+        yield backend
+        backend.close()
+
+
+def test_cached(backend):
+    llm = _CountingLLM()
+    cached = CachingLLM(llm, backend=backend)
+
+    assert cached.complete("hello") == "HELLO"
+    assert cached.complete("hello") == "HELLO"
+    assert llm.calls == 1
+
+    assert cached.complete("world") == "WORLD"
+    assert llm.calls == 2
+
+
+def test_keyed_on_model(backend):
+    llm1 = _CountingLLM(model="model-1")
+    llm2 = _CountingLLM(model="model-2")
+    CachingLLM(llm1, backend=backend).complete("hello")
+    CachingLLM(llm2, backend=backend).complete("hello")
+    assert llm1.calls == llm2.calls == 1
+
+
+def test_failures_not_cached(backend):
+    cached = CachingLLM(_FailingLLM(), backend=backend)
+    with pytest.raises(RuntimeError):
+        cached.complete("hello")
+
+    llm = _CountingLLM()
+    cached.llm = llm
+    assert cached.complete("hello") == "HELLO"
+
+
+def test_sqlite_persists(tmp_path: Path):
+    path = tmp_path / "cache.sqlite3"
+    llm = _CountingLLM()
+
+    backend = SQLiteCacheBackend(path)
+    CachingLLM(llm, backend=backend).complete("hello")
+    backend.close()
+
+    backend = SQLiteCacheBackend(path)
+    assert CachingLLM(llm, backend=backend).complete("hello") == "HELLO"
+    assert llm.calls == 1
+    backend.close()
+
+
+def test_sqlite_ttl(tmp_path: Path):
+    backend = SQLiteCacheBackend(tmp_path / "cache.sqlite3", ttl=-1)
+    llm = _CountingLLM()
+    cached = CachingLLM(llm, backend=backend)
+    cached.complete("hello")
+    cached.complete("hello")
+    assert llm.calls == 2
+    backend.close()
+
+
+def test_acomplete(backend):
+    llm = _CountingLLM()
+    cached = CachingLLM(llm, backend=backend)
+
+    assert asyncio.run(cached.acomplete("hello")) == "HELLO"
+    assert asyncio.run(cached.acomplete("hello")) == "HELLO"
+    assert cached.complete("hello") == "HELLO"
+    assert llm.calls == 1
+
+
+def test_acomplete_async_llm():
+    cached = CachingLLM(AsyncEchoMockLLM())
+    assert cached.model == "AsyncEchoMockLLM"
+    assert asyncio.run(cached.acomplete("hello")) == "hello"
+
+
+def test_stream(backend):
+    llm = _StreamingLLM()
+    cached = CachingLLM(llm, backend=backend)
+
+    # a stream that's closed early is read to the end, so that it can be cached
+    stream = cached.stream("a b c")
+    assert next(stream) == "a "
+    stream.close()
+    assert llm.closed
+    assert llm.calls == 1
+
+    assert list(cached.stream("a b c")) == ["a b c "]
+    assert cached.complete("a b c") == "a b c "
+    assert llm.calls == 1
+
+    assert list(cached.stream("d e")) == ["d ", "e "]
+    assert list(cached.stream("d e")) == ["d e "]
+    assert llm.calls == 2
+
+
+def test_stream_failure(backend):
+    """a stream that fails while it's being read to the end isn't cached"""
+
+    class _BrokenLLM(_CountingLLM):
+        def stream(self, untrusted_input: str) -> Iterator[str]:
+            self.calls += 1
+            yield "a "
+            yield "b "
+            raise RuntimeError("connection lost")
+
+    llm = _BrokenLLM()
+    cached = CachingLLM(llm, backend=backend)
+    stream = cached.stream("a b c")
+    assert next(stream) == "a "
+    stream.close()
+
+    assert cached.complete("a b c") == "A B C"
+    assert llm.calls == 2
+
+
+def test_traverse(backend):
+    """the envelope stops reading at the closing delimiter, but the traversal is still
+    cached"""
+
+    class _DelimitedLLM(_CountingLLM):
+        def stream(self, untrusted_input: str) -> Iterator[str]:
+            self.calls += 1
+            output = "```\nselect t1.col from t1\n```\nThis selects a column."
+            for i in range(0, len(output), 4):
+                yield output[i : i + 4]
+
+    llm = _DelimitedLLM()
+    cached = CachingLLM(llm, backend=backend)
+    validator = PermissiveConstraints()
+    bifrost = Bifrost(
+        llm=cached,
+        prompt_envelope=PromptEnvelope(
+            llm=cached, db_schema="<schema>", validators=[validator]
+        ),
+        constraint_validators=[validator],
+    )
+
+    assert bifrost.traverse("a question") == "select t1.col from t1"
+    assert llm.calls == 1
+    assert bifrost.traverse("a question") == "select t1.col from t1"
+    assert llm.calls == 1
+
+
+def test_complete_many(backend):
+    llm = _StreamingLLM()
+    cached = CachingLLM(llm, backend=backend)
+
+    candidates = list(cached.complete_many("hello", 3))
+    assert candidates == ["HELLO1", "HELLO2", "HELLO3"]
+    assert llm.calls == 3
+    assert sorted(cached.complete_many("hello", 3)) == candidates
+    assert llm.calls == 3
+
+    # only the candidates that aren't cached yet are asked for
+    assert list(cached.complete_many("hello", 4)) == candidates + ["HELLO4"]
+    assert llm.calls == 4
+
+
+def test_sqlite_purges_expired(tmp_path: Path):
+    backend = SQLiteCacheBackend(tmp_path / "cache.sqlite3", ttl=-1)
+    backend.set("a", "1")
+    backend.set("b", "2")
+    assert backend._conn.execute("SELECT key FROM completions").fetchall() == [("b",)]
+
+    assert backend.get("b") is None
+    assert backend._conn.execute("SELECT key FROM completions").fetchall() == []
+    backend.close()
@@ -1,8 +1,9 @@
-from unittest.mock import patch
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
 
 from munch import munchify  # type: ignore
 
-from heimdallm.llm_providers.openai import Client, OpenAIMethod
+from heimdallm.llm_providers.openai import AsyncClient, Client, OpenAIMethod
 
 
 def test_chat_complete():
@@ -23,3 +24,98 @@ def test_completion_complete():
         client = Client(api_key="secret", method=OpenAIMethod.COMPLETION)
         resp = client.complete("hello")
     assert resp == "world"
+
+
+def _stream(chunks: list[dict]) -> MagicMock:
+    """a streamed response, which records what was read from it"""
+    response = MagicMock()
+    response.read = 0
+
+    def iterate():
+        for chunk in chunks:
+            response.read += 1
+            yield munchify(chunk)
+
+    response.__iter__.return_value = iterate()
+    return response
+
+
+def test_chat_stream():
+    with patch("heimdallm.llm_providers.openai.openai") as openai:
+        response = _stream(
+            [
+                {"choices": [{"delta": {"role": "assistant"}}]},
+                {"choices": [{"delta": {"content": "wor"}}]},
+                {"choices": [{"delta": {"content": "ld"}}]},
+                {"choices": [{"delta": {"content": "!"}}]},
+            ]
+        )
+        openai.ChatCompletion.create.return_value = response
+        client = Client(api_key="secret", method=OpenAIMethod.CHAT)
+        stream = client.stream("hello")
+        assert next(stream) + next(stream) == "world"
+        stream.close()
+
+    assert openai.ChatCompletion.create.call_args.kwargs["stream"] is True
+    assert response.read == 3
+    response.close.assert_called_once()
+
+
+def test_completion_stream():
+    with patch("heimdallm.llm_providers.openai.openai") as openai:
+        openai.Completion.create.return_value = _stream(
+            [{"choices": [{"text": "wor"}]}, {"choices": [{"text": "ld"}]}]
+        )
+        client = Client(api_key="secret", method=OpenAIMethod.COMPLETION)
+        assert "".join(client.stream("hello")) == "world"
+
+
+def test_chat_complete_many():
+    """each candidate is yielded as soon as it finishes, and closing the iterator
+    cancels the rest"""
+    with patch("heimdallm.llm_providers.openai.openai") as openai:
+
+        def choice(index: int, content: str, finish_reason=None) -> dict:
+            return {
+                "index": index,
+                "delta": {"content": content},
+                "finish_reason": finish_reason,
+            }
+
+        response = _stream(
+            [
+                {"choices": [choice(0, "wor"), choice(1, "hel")]},
+                {"choices": [choice(1, "lo", "stop")]},
+                {"choices": [choice(0, "ld", "stop")]},
+            ]
+        )
+        openai.ChatCompletion.create.return_value = response
+        client = Client(api_key="secret", method=OpenAIMethod.CHAT)
+        candidates = client.complete_many("hello", 2)
+        assert next(candidates) == "hello"
+        candidates.close()
+
+    assert openai.ChatCompletion.create.call_args.kwargs["n"] == 2
+    assert response.read == 2
+    response.close.assert_called_once()
+
+
+def test_async_chat_complete():
+    with patch("heimdallm.llm_providers.openai.openai") as openai:
+        openai.ChatCompletion.acreate = AsyncMock(
+            return_value=munchify({"choices": [{"message": {"content": "world"}}]})
+        )
+        client = AsyncClient(api_key="secret", method=OpenAIMethod.CHAT)
+        resp = asyncio.run(client.acomplete("hello"))
+    assert resp == "world"
+    assert openai.ChatCompletion.acreate.await_args.kwargs["api_key"] == "secret"
+
+
+def test_async_completion_complete():
+    with patch("heimdallm.llm_providers.openai.openai") as openai:
+        openai.Completion.acreate = AsyncMock(
+            return_value=munchify({"choices": [{"text": "world"}]})
+        )
+        client = AsyncClient(api_key="secret", method=OpenAIMethod.COMPLETION)
+        resp = asyncio.run(client.acomplete("hello"))
+    assert resp == "world"
@@ -0,0 +1,129 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+from heimdallm.llm_providers.openai import OpenAIMethod
+from heimdallm.llm_providers.openai_compatible import Client, _Batcher
+
+from .utils import StubServer
+
+
+def test_chat(server: StubServer):
+    server.reply(body={"choices": [{"index": 0, "message": {"content": "world"}}]})
+
+    client = Client(base_url=server.url, model="llama")
+    assert client.complete("hello") == "world"
+
+    path, headers, body = server.requests[0]
+    assert path == "/v1/chat/completions"
+    assert "Authorization" not in headers
+    assert body["model"] == "llama"
+    assert body["messages"] == [{"role": "user", "content": "hello"}]
+
+
+def test_completion(server: StubServer):
+    server.reply(body={"choices": [{"index": 0, "text": " world\n"}]})
+
+    client = Client(
+        base_url=server.url,
+        model="llama",
+        api_key="secret",
+        method=OpenAIMethod.COMPLETION,
+    )
+    assert client.complete("hello") == "world"
+
+    path, headers, body = server.requests[0]
+    assert path == "/v1/completions"
+    assert headers["Authorization"] == "Bearer secret"
+    assert body["prompt"] == "hello"
+
+
+@pytest.mark.parametrize("method", list(OpenAIMethod))
+def test_stream(server: StubServer, method: OpenAIMethod):
+    def event(text: str) -> dict:
+        if method == OpenAIMethod.CHAT:
+            return {"choices": [{"index": 0, "delta": {"content": text}}]}
+        return {"choices": [{"index": 0, "text": text}]}
+
+    body = b"".join(
+        b"data: " + json.dumps(event(text)).encode("utf8") + b"\n\n"
+        for text in ["wor", "ld"]
+    )
+    server.reply(body=body + b"data: [DONE]\n\n")
+
+    client = Client(base_url=server.url, model="llama", method=method)
+    assert list(client.stream("hello")) == ["wor", "ld"]
+    assert server.requests[0][2]["stream"] is True
+
+
+def test_complete_batch(server: StubServer):
+    # the server may return the choices in any order
+    server.reply(
+        body={
+            "choices": [
+                {"index": 1, "text": "b"},
+                {"index": 0, "text": "a"},
+            ]
+        }
+    )
+
+    client = Client(base_url=server.url, model="llama", method=OpenAIMethod.COMPLETION)
+    assert client.complete_batch(["1", "2"]) == ["a", "b"]
+    assert server.requests[0][2]["prompt"] == ["1", "2"]
+
+
+def test_complete_batch_missing(server: StubServer):
+    """a missing output is an error, not an empty completion"""
+    server.reply(body={"choices": [{"index": 1, "text": "b"}]})
+
+    client = Client(base_url=server.url, model="llama", method=OpenAIMethod.COMPLETION)
+    with pytest.raises(RuntimeError, match=r"\[0\]"):
+        client.complete_batch(["1", "2"])
+
+
+def test_batched_complete(server: StubServer):
+    """concurrent completions are batched into one request"""
+    server.reply(body={"choices": [{"index": i, "text": f"out {i}"} for i in range(4)]})
+
+    client = Client(
+        base_url=server.url,
+        model="llama",
+        method=OpenAIMethod.COMPLETION,
+        batch_window=0.5,
+        max_batch=4,
+    )
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        outputs = list(pool.map(client.complete, [f"in {i}" for i in range(4)]))
+
+    assert len(server.requests) == 1
+    prompts = server.requests[0][2]["prompt"]
+    assert sorted(prompts) == [f"in {i}" for i in range(4)]
+    # every caller gets the output of its own prompt
+    for i, output in enumerate(outputs):
+        assert output == f"out {prompts.index(f'in {i}')}"
+
+
+def test_batch_error(server: StubServer):
+    server.reply(400)
+
+    client = Client(
+        base_url=server.url,
+        model="llama",
+        method=OpenAIMethod.COMPLETION,
+        batch_window=0.01,
+    )
+    with pytest.raises(requests.HTTPError):
+        client.complete("hello")
+
+
+def test_batch_short():
+    """if a batch gets fewer outputs than prompts, every caller gets an error instead
+    of waiting forever"""
+    batcher = _Batcher(lambda prompts: prompts[:-1], window=0.1, max_size=2)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = [pool.submit(batcher.submit, f"in {i}") for i in range(2)]
+        for future in futures:
+            with pytest.raises(RuntimeError):
+                future.result(timeout=5)
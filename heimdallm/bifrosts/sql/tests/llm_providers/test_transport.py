@@ -0,0 +1,144 @@
+import json
+
+import pytest
+import requests
+
+from heimdallm.llm_providers.openai import Client, OpenAIMethod
+from heimdallm.llm_providers.transport import HTTPTransport, TokenBucket
+
+from .utils import StubServer
+
+
+def _chat(content: str) -> dict:
+    return {"choices": [{"index": 0, "message": {"content": content}}]}
+
+
+def test_keep_alive(server: StubServer):
+    """sequential requests reuse one connection"""
+    for i in range(5):
+        server.reply(body=_chat(f"hi {i}"))
+
+    transport = HTTPTransport(base_url=server.url)
+    client = Client(api_key="secret", transport=transport)
+    assert [client.complete("hello") for _ in range(5)] == [f"hi {i}" for i in range(5)]
+    transport.close()
+
+    assert len(server.connections) == 1
+    path, headers, body = server.requests[0]
+    assert path == "/v1/chat/completions"
+    assert headers["Authorization"] == "Bearer secret"
+    assert body["messages"] == [{"role": "user", "content": "hello"}]
+    assert "api_key" not in body
+
+
+def test_retry(server: StubServer):
+    """rate limits and server errors are retried with backoff, and the server's
+    Retry-After is honored"""
+    server.reply(429, headers={"Retry-After": "0.25"})
+    server.reply(503)
+    server.reply(body=_chat("world"))
+
+    sleeps: list[float] = []
+    transport = HTTPTransport(
+        base_url=server.url, backoff=1.0, max_backoff=4.0, sleep=sleeps.append
+    )
+    client = Client(api_key="secret", transport=transport)
+    assert client.complete("hello") == "world"
+
+    assert len(server.requests) == 3
+    assert sleeps[0] == 0.25
+    assert 0 <= sleeps[1] <= 2.0
+
+
+def test_retry_after_capped(server: StubServer):
+    """a server can't make us wait longer than max_backoff"""
+    server.reply(503, headers={"Retry-After": "3600"})
+    server.reply(body=_chat("world"))
+
+    sleeps: list[float] = []
+    transport = HTTPTransport(base_url=server.url, max_backoff=4.0, sleep=sleeps.append)
+    client = Client(api_key="secret", transport=transport)
+    assert client.complete("hello") == "world"
+    assert sleeps == [4.0]
+
+
+def test_retries_exhausted(server: StubServer):
+    for _ in range(3):
+        server.reply(500)
+
+    transport = HTTPTransport(base_url=server.url, max_retries=2, sleep=lambda _: None)
+    with pytest.raises(requests.HTTPError):
+        transport.post("/chat/completions", body={})
+    assert len(server.requests) == 3
+
+    # client errors aren't retried
+    server.reply(400)
+    with pytest.raises(requests.HTTPError):
+        transport.post("/chat/completions", body={})
+    assert len(server.requests) == 4
+
+
+def test_timeout(server: StubServer):
+    """a request that times out is retried"""
+    server.reply(body=_chat("slow"), delay=0.5)
+    server.reply(body=_chat("fast"))
+
+    transport = HTTPTransport(
+        base_url=server.url, read_timeout=0.1, sleep=lambda _: None
+    )
+    client = Client(api_key="secret", transport=transport)
+    assert client.complete("hello") == "fast"
+
+
+def test_stream(server: StubServer):
+    events = [
+        {"choices": [{"index": 0, "delta": {"role": "assistant"}}]},
+        {"choices": [{"index": 0, "delta": {"content": "wor"}}]},
+        {"choices": [{"index": 0, "delta": {"content": "ld"}}]},
+    ]
+    body = b"".join(b"data: " + json.dumps(e).encode("utf8") + b"\n\n" for e in events)
+    server.reply(body=body + b"data: [DONE]\n\n")
+
+    client = Client(api_key="secret", transport=HTTPTransport(base_url=server.url))
+    assert "".join(client.stream("hello")) == "world"
+    assert server.requests[0][2]["stream"] is True
+
+
+def test_completion(server: StubServer):
+    server.reply(body={"choices": [{"index": 0, "text": " world "}]})
+
+    client = Client(
+        api_key="secret",
+        method=OpenAIMethod.COMPLETION,
+        transport=HTTPTransport(base_url=server.url),
+    )
+    assert client.complete("hello") == "world"
+    path, _, body = server.requests[0]
+    assert path == "/v1/completions"
+    assert body["model"] == "gpt-3.5-turbo-16k"
+
+
+def test_token_bucket():
+    now = [0.0]
+    sleeps: list[float] = []
+
+    def sleep(seconds: float):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0], sleep=sleep)
+
+    # the burst fits in the bucket, and the rest are smoothed out to the rate
+    for _ in range(5):
+        bucket.acquire()
+    assert sleeps == [0.5, 0.5, 0.5]
+
+    # the bucket refills while idle, up to its capacity
+    now[0] += 10
+    sleeps.clear()
+    for _ in range(2):
+        bucket.acquire()
+    assert sleeps == []
+
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
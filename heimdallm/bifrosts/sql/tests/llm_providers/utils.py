@@ -0,0 +1,50 @@
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubServer(ThreadingHTTPServer):
+    """a local stand-in for the OpenAI API, which replies with a queue of canned
+    responses, and records the requests and connections that it saw"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _StubHandler)
+        # (status, headers, body, delay) for each request, in order
+        self.replies: list[tuple[int, dict, bytes, float]] = []
+        self.requests: list[tuple[str, dict, dict]] = []
+        self.connections: set[tuple[str, int]] = set()
+
+    @property
+    def url(self) -> str:
+        port = self.server_address[1]
+        return f"http://127.0.0.1:{port}/v1"
+
+    def reply(self, status: int = 200, body=None, headers=None, delay: float = 0):
+        if not isinstance(body, bytes):
+            body = json.dumps(body or {}).encode("utf8")
+        self.replies.append((status, headers or {}, body, delay))
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: StubServer
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        body = json.loads(self.rfile.read(length))
+        self.server.requests.append((self.path, dict(self.headers), body))
+        self.server.connections.add(self.client_address)
+
+        status, headers, reply, delay = self.server.replies.pop(0)
+        time.sleep(delay)
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
@@ -0,0 +1,142 @@
+from typing import Type
+
+from lark import Tree
+
+from heimdallm.bifrosts.sql.common import FqColumn, ParameterizedConstraint
+from heimdallm.bifrosts.sql.sqlite.select.bifrost import Bifrost
+from heimdallm.bifrosts.sql.visitors.analysis import analyze
+from heimdallm.context import TraverseContext
+
+from ..utils import dialects
+from .utils import PermissiveConstraints
+
+
+def _analyze(bifrost: Bifrost, query: str):
+    ctx = TraverseContext()
+    tree = bifrost.parse(query, ctx=ctx)
+    return (
+        ctx,
+        tree,
+        analyze(tree, ctx=ctx, reserved_keywords=bifrost.reserved_keywords()),
+    )
+
+
+@dialects()
+def test_visitor_order(dialect: str, Bifrost: Type[Bifrost]):
+    """the collectors see the nodes in the same order that a lark visitor would"""
+    bifrost = Bifrost.validation_only(PermissiveConstraints())
+    _, tree, analysis = _analyze(
+        bifrost,
+        "select t.a, (select u.b from u limit 1) b from t "
+        "join v on t.a = v.a and v.b = :b "
+        "where (t.a = :a or t.b > 1) and t.c in (select w.c from w where w.d = :d)",
+    )
+    assert [id(node) for node in analysis.nodes] == [
+        id(node) for node in tree.iter_subtrees()
+    ]
+
+
+@dialects()
+def test_facets(dialect: str, Bifrost: Type[Bifrost]):
+    bifrost = Bifrost.validation_only(PermissiveConstraints())
+    _, _, analysis = _analyze(
+        bifrost,
+        "select t.a from t join u on t.id = u.id and u.x = :x "
+        "where (t.a = :a and (t.b = :b or t.c = 1)) and t.d = :d "
+        "and t.e in (select v.e from v where v.f = :f) "
+        "order by t.g limit 5",
+    )
+    facets = analysis.facets
+
+    assert facets.selected_columns == {
+        FqColumn(table="t", column="a"),
+        FqColumn(table="v", column="e"),
+    }
+    assert facets.condition_columns == {
+        FqColumn(table=table, column=column)
+        for table, column in [
+            ("t", "id"),
+            ("u", "id"),
+            ("t", "a"),
+            ("t", "b"),
+            ("t", "c"),
+            ("t", "d"),
+            ("t", "e"),
+            ("v", "e"),
+            ("v", "f"),
+            ("t", "g"),
+        ]
+    }
+    # the OR'd comparison is optional, and the subquery's doesn't constrain the result
+    assert facets.parameterized_constraints == {
+        ParameterizedConstraint(column="u.x", placeholder="x"),
+        ParameterizedConstraint(column="t.a", placeholder="a"),
+        ParameterizedConstraint(column="t.d", placeholder="d"),
+    }
+    assert list(facets.limits.values()) == [5]
+
+
+@dialects()
+def test_shared_analysis(dialect: str, Bifrost: Type[Bifrost]):
+    """the analysis is made once per tree, and shared with the fixed tree, unless the
+    fix changed the tree"""
+
+    class LimitConstraints(PermissiveConstraints):
+        def max_limit(self):
+            return 10
+
+    bifrost = Bifrost.validation_only(LimitConstraints())
+    validator = bifrost.constraint_validators[0]
+
+    ctx, tree, analysis = _analyze(bifrost, "select t.a from t limit 5")
+    assert analyze(tree, ctx=ctx, reserved_keywords=set()) is analysis
+
+    _, fixed_tree = validator.fix_tree(
+        bifrost=bifrost, grammar=bifrost.grammar, ctx=ctx, tree=tree
+    )
+    assert fixed_tree is not tree
+    assert analyze(fixed_tree, ctx=ctx, reserved_keywords=set()) is analysis
+
+    ctx, tree, analysis = _analyze(bifrost, "select t.a from t limit 50")
+    _, fixed_tree = validator.fix_tree(
+        bifrost=bifrost, grammar=bifrost.grammar, ctx=ctx, tree=tree
+    )
+    fixed_analysis = analyze(
+        fixed_tree, ctx=ctx, reserved_keywords=bifrost.reserved_keywords()
+    )
+    assert fixed_analysis is not analysis
+    assert list(fixed_analysis.facets.limits.values()) == [10]
+
+
+@dialects()
+def test_index(dialect: str, Bifrost: Type[Bifrost]):
+    """the index agrees with a search of each node's ancestors"""
+    bifrost = Bifrost.validation_only(PermissiveConstraints())
+    tree = bifrost.parse(
+        "with c as (select u.a from u) select t.a, (select v.b from v) b from t "
+        "join (select w.a from w) d on t.a = d.a where t.a in (select c.a from c)"
+    )
+    index = tree.meta.index
+
+    parents = {}
+    for node in tree.iter_subtrees():
+        for child in node.children:
+            if isinstance(child, Tree):
+                parents[id(child)] = node
+
+    def ancestors(node):
+        while (node := parents.get(id(node))) is not None:
+            yield node
+
+    assert sorted(node.meta.id for node in tree.iter_subtrees()) == list(
+        range(len(index))
+    )
+    for node in tree.iter_subtrees():
+        assert index.nodes[node.meta.id] is node
+        assert index.parent(node) is parents.get(id(node))
+
+        query = next((a for a in ancestors(node) if a.data == "full_query"), None)
+        assert index.containing_query(node) == (-1 if query is None else query.meta.id)
+
+        in_subquery = any(a.data in ("subquery", "with_cte") for a in ancestors(node))
+        assert index.in_subquery(node) == in_subquery
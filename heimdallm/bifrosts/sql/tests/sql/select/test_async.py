@@ -0,0 +1,62 @@
+import asyncio
+from typing import Type
+
+import pytest
+
+from heimdallm.bifrosts.sql import exc
+from heimdallm.bifrosts.sql import envelope
+from heimdallm.bifrosts.sql.sqlite.select.bifrost import Bifrost
+from heimdallm.llm_providers.mock import AsyncEchoMockLLM
+
+from ..utils import dialects
+from .utils import PermissiveConstraints
+
+
+def _async_bifrost(Bifrost: Type[Bifrost], validator) -> Bifrost:
+    llm = AsyncEchoMockLLM()
+    return Bifrost(
+        llm=llm,
+        prompt_envelope=envelope.TestSQLPromptEnvelope(
+            llm=llm,
+            db_schema="<schema>",
+            validators=[validator],
+        ),
+        constraint_validators=[validator],
+    )
+
+
+@dialects()
+def test_atraverse_sync_llm(dialect: str, Bifrost: Type[Bifrost]):
+    """a blocking LLM integration is run in the executor"""
+    bifrost = Bifrost.validation_only(PermissiveConstraints())
+    query = "select t1.col from t1"
+    assert asyncio.run(bifrost.atraverse(query)) == bifrost.traverse(query)
+
+
+@dialects()
+def test_atraverse_async_llm(dialect: str, Bifrost: Type[Bifrost]):
+    bifrost = _async_bifrost(Bifrost, PermissiveConstraints())
+    trusted = asyncio.run(bifrost.atraverse("select t1.col from t1 where t1.id=:id"))
+    if dialect == "sqlite":
+        assert ":id" in trusted
+    else:
+        assert "%(id)s" in trusted
+
+
+@dialects()
+def test_atraverse_raises(dialect: str, Bifrost: Type[Bifrost]):
+    bifrost = _async_bifrost(Bifrost, PermissiveConstraints())
+    with pytest.raises(exc.InvalidQuery) as e:
+        asyncio.run(bifrost.atraverse("select t1.col from"))
+    assert e.value.ctx.untrusted_llm_output == "select t1.col from"
+
+
+def test_atraverse_concurrent():
+    """many traversals can be in flight on one event loop"""
+    bifrost = _async_bifrost(Bifrost, PermissiveConstraints())
+    queries = [f"select t{i}.col from t{i}" for i in range(20)]
+
+    async def run():
+        return await asyncio.gather(*(bifrost.atraverse(q) for q in queries))
+
+    assert asyncio.run(run()) == queries
@@ -5,9 +5,10 @@ import pytest
 from heimdallm.bifrosts.sql import exc
 from heimdallm.bifrosts.sql.common import FqColumn
 from heimdallm.bifrosts.sql.sqlite.select.bifrost import Bifrost
+from heimdallm.context import TraverseContext
 
 from ..utils import dialects
-from .utils import PermissiveConstraints
+from .utils import PermissiveConstraints, canonical_tree
 
 
 @dialects()
@@ -170,3 +171,57 @@ AND to_date >= DATE(:timestamp)
 def test_add_parameterized_constraints(dialect: str, Bifrost: Type[Bifrost]):
     """show that we can add a parameterized_constraint to a query"""
     raise NotImplementedError
+
+
+@dialects()
+@pytest.mark.parametrize(
+    "query",
+    [
+        """
+select t1.col, t2.col
+from t1 join t2 on t1.id = t2.id and t2.x = :x
+where t1.id = :id and t1.created >= :start
+""",
+        "select col from t1 where id = :id and created >= date(:start) "
+        "limit 50 offset 5",
+    ],
+)
+def test_fixed_tree_matches_output(dialect: str, Bifrost: Type[Bifrost], query: str):
+    """the fixed tree is validated in place of a reparse of the reconstructed query, so
+    it must be exactly the tree that the reconstructed query parses to"""
+
+    class MyConstraints(PermissiveConstraints):
+        def max_limit(self):
+            return 10
+
+    bifrost = Bifrost.validation_only(MyConstraints())
+    calls = []
+    parse = bifrost.parse
+
+    def spy(*args, **kwargs):
+        calls.append(args)
+        return parse(*args, **kwargs)
+
+    bifrost.parse = spy  # type: ignore
+
+    ctx = TraverseContext()
+    tree = bifrost.parse(query, ctx=ctx)
+    output, fixed_tree = bifrost.constraint_validators[0].fix_tree(
+        bifrost=bifrost,
+        grammar=bifrost.grammar,
+        ctx=ctx,
+        tree=tree,
+    )
+    assert "limit 10" in output.lower()
+    assert canonical_tree(fixed_tree) == canonical_tree(parse(output))
+
+    # the placeholders point at their positions in the fixed query
+    for placeholder in fixed_tree.find_data("placeholder"):
+        name = placeholder.children[-1]
+        span = output[placeholder.meta.start_pos : placeholder.meta.end_pos]
+        assert span == f":{name}"
+
+    # only the untrusted query is parsed
+    calls.clear()
+    bifrost.traverse(query)
+    assert len(calls) == 1
@@ -0,0 +1,87 @@
+import pickle
+from typing import Type
+
+import pytest
+
+from heimdallm.bifrosts.sql.common import ParameterizedQuery, TrustedQuery
+from heimdallm.bifrosts.sql.mysql.select.bifrost import Bifrost as MySQLBifrost
+from heimdallm.bifrosts.sql.sqlite.select.bifrost import Bifrost
+
+from ..utils import dialects
+from .utils import PermissiveConstraints
+
+
+@dialects()
+def test_formatting(dialect: str, Bifrost: Type[Bifrost]):
+    bifrost = Bifrost.validation_only(PermissiveConstraints())
+
+    def canonicalize(query: str, mask_literals: bool = False):
+        return bifrost.canonicalize(
+            query, bifrost.parse(query), mask_literals=mask_literals
+        )
+
+    first = (
+        "with recent as (select r.rental_id from rental r where r.days > -r.grace) "
+        "select c.first_name, count(*) as total, substr(c.email, 1, 3) as domain "
+        "from customer as c join recent on c.customer_id = recent.rental_id "
+        "where c.last_name = 'smith' and c.store_id in (1, 2) and c.id = :id "
+        "group by c.first_name order by total desc limit 5;"
+    )
+    second = (
+        "WITH   Latest AS (SELECT x.rental_id FROM rental x WHERE x.days>-x.grace)\n"
+        "SELECT y.first_name,COUNT(*) Cnt,SUBSTR(y.email,1,3) AS dom\n"
+        "  FROM customer y JOIN Latest ON y.customer_id=Latest.rental_id\n"
+        "  WHERE y.last_name='smith' AND y.store_id IN (1,2) AND y.id=:id\n"
+        "  GROUP BY y.first_name ORDER BY Cnt DESC LIMIT 5"
+    )
+
+    canonical = canonicalize(first)
+    assert canonical.sql == (
+        "WITH a0 AS (SELECT a1.rental_id FROM rental AS a1 WHERE a1.days > -a1.grace) "
+        "SELECT a2.first_name, COUNT(*) AS a3, SUBSTR(a2.email, 1, 3) AS a4 "
+        "FROM customer AS a2 JOIN a0 ON a2.customer_id = a0.rental_id "
+        "WHERE a2.last_name = 'smith' AND a2.store_id IN (1, 2) AND a2.id = :id "
+        "GROUP BY a2.first_name ORDER BY a3 DESC LIMIT 5"
+    )
+    assert canonicalize(second) == canonical
+
+    # only masked literals make queries with different literals the same
+    other = second.replace("'smith'", "'jones'").replace("(1,2)", "(3,4)")
+    assert canonicalize(other).fingerprint != canonical.fingerprint
+    masked = canonicalize(first, mask_literals=True)
+    assert "WHERE a2.last_name = ? AND a2.store_id IN (?, ?)" in masked.sql
+    assert "AND a2.id = :id" in masked.sql
+    assert canonicalize(other, mask_literals=True) == masked
+
+
+@pytest.mark.parametrize("parameterize_literals", [True, False])
+def test_traverse(parameterize_literals: bool):
+    bifrost = Bifrost.validation_only(
+        PermissiveConstraints(),
+        parameterize_literals=parameterize_literals,
+        canonicalize_queries=True,
+        mask_literals=True,
+    )
+    query = bifrost.traverse("select t1.col from t1 where t1.a = 'x' and t1.b = :b")
+    assert isinstance(query, TrustedQuery)
+    assert isinstance(query, ParameterizedQuery) == parameterize_literals
+    assert query.canonical is not None
+    assert query.canonical.sql == ("SELECT t1.col FROM t1 WHERE t1.a = ? AND t1.b = :b")
+    assert (
+        bifrost.traverse(
+            "SELECT t1.col FROM t1 WHERE t1.a='y' AND t1.b=:b", autofix=True
+        ).canonical
+        == query.canonical
+    )
+
+    unpickled = pickle.loads(pickle.dumps(query))
+    assert unpickled == query
+    assert unpickled.canonical == query.canonical
+
+
+def test_backslash_strings():
+    """a backslash in a mysql string doesn't end it"""
+    bifrost = MySQLBifrost.validation_only(PermissiveConstraints())
+    query = 'select t1.col from t1 where t1.a = \'it\\\'s, "quoted"\' and t1.b = "b"'
+    canonical = bifrost.canonicalize(query, bifrost.parse(query), mask_literals=True)
+    assert canonical.sql == "SELECT t1.col FROM t1 WHERE t1.a = ? AND t1.b = ?"
@@ -0,0 +1,209 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Type
+
+import pytest
+
+from heimdallm.bifrosts.sql import envelope, exc
+from heimdallm.bifrosts.sql.sqlite.select.bifrost import Bifrost
+from heimdallm.llm_providers.mock import EchoMockLLM
+
+from ..utils import dialects
+from .utils import CustomerConstraints, PermissiveConstraints
+
+
+@dialects()
+def test_shared_bifrost_threads(dialect: str, Bifrost: Type[Bifrost]):
+    """one Bifrost can be shared by many threads, and each traversal's error context
+    belongs to that traversal only"""
+    bifrost = Bifrost.validation_only(PermissiveConstraints())
+
+    def run(i: int):
+        if i % 2:
+            query = f"select t{i}.col from t{i}"
+            return query, bifrost.traverse(query)
+        else:
+            query = f"select t{i}.col from"
+            try:
+                bifrost.traverse(query)
+            except exc.InvalidQuery as e:
+                return query, e
+            pytest.fail("Expected an invalid query")
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(run, range(32)))
+
+    for i, (query, result) in enumerate(results):
+        if i % 2:
+            assert result == query
+        else:
+            assert isinstance(result, exc.InvalidQuery)
+            assert result.ctx.untrusted_llm_output == query
+
+
+@dialects()
+def test_context_per_traversal(dialect: str, Bifrost: Type[Bifrost]):
+    bifrost = Bifrost.validation_only(PermissiveConstraints())
+
+    with pytest.raises(exc.InvalidQuery) as e1:
+        bifrost.traverse("select t1.col from")
+    with pytest.raises(exc.InvalidQuery) as e2:
+        bifrost.traverse("select t2.col from")
+
+    assert e1.value.ctx is not e2.value.ctx
+    assert e1.value.ctx.untrusted_llm_output == "select t1.col from"
+    assert e2.value.ctx.untrusted_llm_output == "select t2.col from"
+
+
+class _SlowEchoLLM(EchoMockLLM):
+    """tracks how many completions are in flight at once"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def complete(self, sql_output: str) -> str:
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        time.sleep(0.2)
+        with self._lock:
+            self.in_flight -= 1
+        return sql_output
+
+
+@dialects()
+def test_traverse_many(dialect: str, Bifrost: Type[Bifrost]):
+    """results come back in input order, and failures don't affect other inputs"""
+    bifrost = Bifrost.validation_only(PermissiveConstraints())
+    queries = [
+        "select t1.col from t1",
+        "select t2.col from",
+        "select t3.col from t3",
+    ]
+    results = bifrost.traverse_many(queries, concurrency=2)
+
+    assert results[0] == queries[0]
+    assert isinstance(results[1], exc.InvalidQuery)
+    assert results[1].ctx.untrusted_llm_output == queries[1]
+    assert results[2] == queries[2]
+
+
+def test_traverse_many_concurrent():
+    """the LLM calls overlap, instead of happening one after another"""
+    validator = PermissiveConstraints()
+    llm = _SlowEchoLLM()
+    bifrost = Bifrost(
+        llm=llm,
+        prompt_envelope=envelope.TestSQLPromptEnvelope(
+            llm=llm,
+            db_schema="<schema>",
+            validators=[validator],
+        ),
+        constraint_validators=[validator],
+    )
+    queries = [f"select t{i}.col from t{i}" for i in range(10)]
+
+    results = bifrost.traverse_many(queries, concurrency=5)
+
+    assert results == queries
+    assert 1 < llm.peak_in_flight <= 5
+
+
+def test_traverse_many_bad_concurrency():
+    bifrost = Bifrost.validation_only(PermissiveConstraints())
+    with pytest.raises(ValueError):
+        bifrost.traverse_many(["select t1.col from t1"], concurrency=0)
+
+
+class _CandidateLLM(EchoMockLLM):
+    """returns each of its candidates after a delay, one candidate per call"""
+
+    def __init__(self, candidates: list[tuple[float, str]]):
+        self._lock = threading.Lock()
+        self.candidates = candidates
+        self.calls = 0
+
+    def complete(self, sql_output: str) -> str:
+        with self._lock:
+            delay, candidate = self.candidates[self.calls]
+            self.calls += 1
+        time.sleep(delay)
+        return candidate
+
+
+class _SlowConstraints(CustomerConstraints):
+    """takes its time to validate any query that selects the customer's name"""
+
+    def validate(self, *, bifrost, ctx, tree):
+        if "Customer.FirstName" in ctx.untrusted_llm_output:
+            time.sleep(2.0)
+        return super().validate(bifrost=bifrost, ctx=ctx, tree=tree)
+
+
+def _speculative_bifrost(llm: _CandidateLLM) -> Bifrost:
+    validator = _SlowConstraints()
+    return Bifrost(
+        llm=llm,
+        prompt_envelope=envelope.TestSQLPromptEnvelope(
+            llm=llm,
+            db_schema="<schema>",
+            validators=[validator],
+        ),
+        constraint_validators=[validator],
+    )
+
+
+def test_traverse_speculative():
+    """the first candidate to be validated wins, without waiting for the rest"""
+    good = "select Customer.Email from Customer where Customer.CustomerId=:customer_id"
+    llm = _CandidateLLM(
+        [
+            (0.0, "select Customer.Email from Customer"),
+            (0.1, good),
+            (2.0, good),
+        ]
+    )
+    bifrost = _speculative_bifrost(llm)
+
+    start = time.monotonic()
+    assert bifrost.traverse_speculative("<input>", candidates=3) == good
+    assert time.monotonic() - start < 1.5
+    assert llm.calls == 3
+
+
+def test_traverse_speculative_concurrent():
+    """a candidate that is slow to validate doesn't hold up the ones after it"""
+    good = "select Customer.Email from Customer where Customer.CustomerId=:customer_id"
+    llm = _CandidateLLM(
+        [
+            (0.0, "select Customer.FirstName from Customer"),
+            (0.1, good),
+        ]
+    )
+    bifrost = _speculative_bifrost(llm)
+
+    start = time.monotonic()
+    assert bifrost.traverse_speculative("<input>", candidates=2) == good
+    assert time.monotonic() - start < 1.5
+    assert bifrost.ctx.untrusted_llm_output == good
+
+
+def test_traverse_speculative_fail():
+    """if every candidate fails, we raise the last candidate's exception"""
+    llm = _CandidateLLM(
+        [
+            (0.0, "select Customer.Email from Customer"),
+            (0.1, "select Customer.Email from"),
+        ]
+    )
+    bifrost = _speculative_bifrost(llm)
+
+    with pytest.raises(exc.InvalidQuery) as e:
+        bifrost.traverse_speculative("<input>", candidates=2)
+    assert e.value.ctx.untrusted_llm_output == "select Customer.Email from"
+
+    with pytest.raises(ValueError):
+        bifrost.traverse_speculative("<input>", candidates=0)
@@ -0,0 +1,122 @@
+import json
+from typing import Type
+
+import pytest
+
+from heimdallm.bifrosts.sql import exc
+from heimdallm.bifrosts.sql.common import FqColumn
+from heimdallm.bifrosts.sql.declarative import (
+    InvalidPolicy,
+    load_policy,
+    load_policy_file,
+)
+from heimdallm.bifrosts.sql.sqlite.select.bifrost import Bifrost
+
+from ..utils import dialects
+
+POLICY = """
+max_limit = 10
+requester_identities = [
+    { column = "customer.customer_id", placeholder = "customer_id" },
+]
+
+[tables.customer]
+select = ["first_name", "last_name"]
+condition = ["customer_id", "first_name"]
+
+[tables.rental]
+select = "*"
+
+[[joins]]
+first = "customer.customer_id"
+second = "rental.customer_id"
+identity = "customer_id"
+"""
+
+
+@dialects()
+def test_declarative(dialect: str, Bifrost: Type[Bifrost]):
+    validator = load_policy(f'dialect = "{dialect}"\n{POLICY}')
+    bifrost = Bifrost.validation_only(validator)
+
+    trusted_query = bifrost.traverse(
+        "select customer.first_name, upper(rental.title) from customer "
+        "join rental on customer.customer_id = rental.customer_id "
+        "where rental.customer_id = :customer_id"
+    )
+    assert "limit 10" in trusted_query.lower()
+
+    with pytest.raises(exc.IllegalSelectedColumn):
+        bifrost.traverse(
+            "select customer.email from customer "
+            "where customer.customer_id = :customer_id",
+            autofix=False,
+        )
+    with pytest.raises(exc.IllegalConditionColumn):
+        bifrost.traverse(
+            "select customer.first_name from customer "
+            "where customer.customer_id = :customer_id and customer.last_name = 'x'"
+        )
+    with pytest.raises(exc.MissingRequiredIdentity):
+        bifrost.traverse("select customer.first_name from customer")
+
+    # no wildcard columns, so the columns are checked against a hashed allowlist
+    policy = validator.compile()
+    assert policy.condition_columns is None
+    assert policy.select_columns is None
+    assert policy.functions is not None and "upper" in policy.functions
+
+
+def test_cached():
+    validator = load_policy(POLICY)
+    assert load_policy(POLICY) is validator
+    assert load_policy(POLICY.replace("10", "20")) is not validator
+
+    data = {
+        "requester_identities": [],
+        "tables": {"t": {"select": ["a"]}},
+        "functions": ["count"],
+    }
+    validator = load_policy(data)
+    assert load_policy(json.dumps(data), format="json") is not validator
+    assert load_policy(dict(reversed(data.items()))) is validator
+    # the same policy, in a different format, is the same policy to the cache
+    assert load_policy(json.dumps(data), format="json").fingerprint() == (
+        validator.fingerprint()
+    )
+    assert load_policy({**data, "max_limit": 5}).fingerprint() != (
+        validator.fingerprint()
+    )
+
+    policy = validator.compile()
+    assert policy.select_columns == {FqColumn(table="t", column="a")}
+    assert policy.functions == {"count"}
+
+
+def test_load_file(tmp_path):
+    path = tmp_path / "policy.json"
+    path.write_text(
+        json.dumps({"requester_identities": [], "max_limit": 5, "dialect": "mysql"})
+    )
+    validator = load_policy_file(path)
+    assert validator.dialect == "mysql"
+    assert validator.max_limit() == 5
+
+
+@pytest.mark.parametrize(
+    "policy",
+    [
+        "",
+        'dialect = "oracle"\nrequester_identities = []',
+        'requester_identities = [{ column = "customer_id", placeholder = "id" }]',
+        "requester_identities = []\nmax_limit = 'ten'",
+        'requester_identities = []\n[tables.t]\nselect = "a"',
+        'requester_identities = []\n[[joins]]\nfirst = "a.b"',
+        'requester_identities = []\nfunctions = "count"',
+        "requester_identities = []\nfunctions = [1]",
+        "requester_identities = []\n[tables.t]\nselect = [1]",
+    ],
+)
+def test_invalid(policy: str):
+    with pytest.raises(InvalidPolicy):
+        load_policy(policy)
@@ -1,7 +1,10 @@
-from typing import Type
+from typing import Iterator, Type
 
 import jinja2
+import pytest
 
+from heimdallm.bifrosts.sql import envelope
+from heimdallm.bifrosts.sql.sqlite.select.bifrost import Bifrost
 from heimdallm.bifrosts.sql.sqlite.select.envelope import PromptEnvelope
 from heimdallm.llm_providers.mock import EchoMockLLM
 
@@ -136,3 +139,144 @@ def test_custom_envelope(dialect: str, PromptEnvelope: Type[PromptEnvelope]):
 
     # shows that the base template was included
     assert "unrestricted access" in envelope
+
+
+@dialects(bifrost=False, envelope=True)
+def test_wrap_cached(dialect: str, PromptEnvelope: Type[PromptEnvelope]):
+    """the envelope is rendered once, and is the same as rendering it with the input"""
+    env = PromptEnvelope(
+        llm=EchoMockLLM(),
+        db_schema="<schema>",
+        validators=[CustomerConstraints()],
+    )
+    for query in ["select t1.col from t1", "{{ t1.col }}", ""]:
+        assert env.wrap(query) == env._render(query, "<schema>", env.params)
+
+    prefix = env.prefix
+    assert ":customer_id" in prefix
+    assert env.wrap("query").startswith(prefix)
+    assert env.prefix is prefix
+
+    # a new configuration is rendered again
+    env.db_schema = "<other schema>"
+    assert env.prefix is not prefix
+    assert "<other schema>" in env.wrap("query")
+
+
+@dialects(bifrost=False, envelope=True)
+def test_wrap_uncacheable(dialect: str, PromptEnvelope: Type[PromptEnvelope]):
+    """a template that does more with the input than print it is rendered every time"""
+
+    def template(self, env: jinja2.Environment) -> jinja2.Template:
+        tmpl = """
+        {% extends "sql/sqlite/select.j2" %}
+
+        {% block extras %}
+        The query is {{ query|length }} characters long.
+        {% endblock %}
+        """
+        return env.from_string(tmpl)
+
+    MyEnvelope = type("MyEnvelope", (PromptEnvelope,), {"template": template})
+    env = MyEnvelope(
+        llm=EchoMockLLM(),
+        db_schema="<schema>",
+        validators=[PermissiveConstraints()],
+    )
+    assert env.prefix == ""
+    assert "The query is 5 characters long." in env.wrap("query")
+    assert "The query is 2 characters long." in env.wrap("q2")
+
+
+def _chunks(text: str, size: int, consumed: list[str]) -> Iterator[str]:
+    for i in range(0, len(text), size):
+        consumed.append(text[i : i + size])
+        yield text[i : i + size]
+
+
+@dialects(bifrost=False, envelope=True)
+@pytest.mark.parametrize(
+    "resp",
+    [
+        "Here you go:\n```sql\nselect t1.col from t1\n```\nThis selects a column.",
+        "```select t1.col from t1``` and ```select t2.col from t2```",
+        "````\nselect t1.col from t1\n````",
+        "```sq```l",
+        "sql\nselect t1.col from t1",
+    ],
+)
+def test_unwrap_stream(dialect: str, PromptEnvelope: Type[PromptEnvelope], resp: str):
+    """the streamed unwrap always agrees with the unwrap of the whole output"""
+    env = PromptEnvelope(
+        llm=EchoMockLLM(),
+        db_schema="<schema>",
+        validators=[PermissiveConstraints()],
+    )
+    for size in range(1, len(resp) + 1):
+        consumed: list[str] = []
+        assert env.unwrap_stream(_chunks(resp, size, consumed)) == env.unwrap(resp)
+
+
+@dialects(bifrost=False, envelope=True)
+def test_unwrap_stream_early(dialect: str, PromptEnvelope: Type[PromptEnvelope]):
+    """we stop reading the output as soon as the closing delimiter arrives, unless
+    unwrap has been overridden"""
+    resp = "```\nselect t1.col from t1\n```\n" + "This selects a column. " * 10
+
+    consumed: list[str] = []
+    unwrapped = PromptEnvelope(
+        llm=EchoMockLLM(),
+        db_schema="<schema>",
+        validators=[PermissiveConstraints()],
+    ).unwrap_stream(_chunks(resp, 4, consumed))
+    assert unwrapped == "select t1.col from t1"
+    assert "".join(consumed) == resp[:32]
+
+    def unwrap(self, untrusted_llm_output: str) -> str:
+        return untrusted_llm_output
+
+    MyEnvelope = type("MyEnvelope", (PromptEnvelope,), {"unwrap": unwrap})
+
+    consumed.clear()
+    MyEnvelope(
+        llm=EchoMockLLM(),
+        db_schema="<schema>",
+        validators=[PermissiveConstraints()],
+    ).unwrap_stream(_chunks(resp, 4, consumed))
+    assert "".join(consumed) == resp
+
+
+class _StreamingLLM(EchoMockLLM):
+    """streams its output, and records how much of it was read"""
+
+    def __init__(self, explanation: str):
+        self.explanation = explanation
+        self.sent = 0
+        self.closed = False
+
+    def stream(self, sql_output: str) -> Iterator[str]:
+        try:
+            for chunk in ["```", sql_output, "```", self.explanation]:
+                self.sent += 1
+                yield chunk
+        finally:
+            self.closed = True
+
+
+def test_traverse_stream():
+    """the traversal cancels the completion once the query has arrived"""
+    validator = PermissiveConstraints()
+    llm = _StreamingLLM("This selects a column.")
+    bifrost = Bifrost(
+        llm=llm,
+        prompt_envelope=envelope.TestSQLPromptEnvelope(
+            llm=llm,
+            db_schema="<schema>",
+            validators=[validator],
+        ),
+        constraint_validators=[validator],
+    )
+
+    assert bifrost.traverse("select t1.col from t1") == "select t1.col from t1"
+    assert llm.sent == 3
+    assert llm.closed
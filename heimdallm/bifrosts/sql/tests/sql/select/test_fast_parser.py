@@ -0,0 +1,160 @@
+import logging
+import re
+from typing import Type
+
+import pytest
+from lark import Lark
+from lark.exceptions import UnexpectedInput
+
+from heimdallm.bifrosts.sql import exc
+from heimdallm.bifrosts.sql.sqlite.select.bifrost import Bifrost
+from heimdallm.bifrosts.sql.visitors import lalr
+
+from ..utils import dialects
+from .utils import PermissiveConstraints, canonical_tree
+
+# queries that the fast parser must parse into exactly the same tree as the earley
+# parser
+QUERIES = [
+    "select t.a from t",
+    "SELECT T.A FROM T WHERE T.A = :A ORDER BY T.A DESC LIMIT 1",
+    "select t.a from t left join u on t.a = u.b",
+    "select t.a from t t2 join u on t2.a = u.b and u.c = :x and :y = u.d",
+    "select t.a from t join u on t.a = u.b + 1",
+    "select t.a from t where t.a = :x or :y = b and c = :z",
+    "select t.a from t where (t.a) = :x and (t.b = 1 or -t.c > 2)",
+    "select t.a, -t.b, ~t.c, (t.a) + 1 as x from t",
+    "select t.a from t where t.a not between 1 and 2 or t.b in (1, 2)",
+    "select t.a from t where t.a is not null and t.b not like 'y'",
+    "select count(*), count(1), count(distinct t.a) c from t",
+    "select max(t.a) as m from t group by t.a having max(t.a) > 1 "
+    "order by m desc, t.b asc limit 10 offset 5",
+    "select t.a from t order by t.a limit 5, 10",
+    "select t.a from t union select u.a from u union all select v.a from v",
+    "with x as (select t.a from t) select x.a from x join y on x.a = y.a",
+    "select d.a from (select t.a from t) as d where d.a = :a;",
+    "select t.a from t as tt inner join u as uu on tt.a = uu.a cross join v on v.a = "
+    "tt.a",
+    "select t.a from t natural left outer join u on t.a = u.a",
+    "select t.a from t where t.a in (select u.b from u where u.c = :c)",
+    "select t.a from t where t.a div 2 = 1",
+    "select t.a, isx, notx, selectx from t",
+    "select t.a from t where t.a = f(:x) and t.b = true",
+]
+
+
+# queries that the earley parser rejects, because they're missing whitespace that it
+# requires, so the fast parser must not accept them either
+REJECTED = [
+    "select(t.a)from t",
+    "select t.a from t where t.a='x'and t.b=1",
+    "SELECT:x payment_id FROM payment",
+    "SELECT+region FROM t",
+    "SELECT COUNT(DISTINCT film.film_id)AS x FROM film",
+    "select t.a from t where (t.a = 1)or t.b = 2",
+    "select t.a from t where t.a in(1, 2)",
+]
+
+
+def _parse_result(bifrost: Bifrost, query: str):
+    try:
+        return canonical_tree(bifrost.parse(query))
+    except exc.InvalidQuery:
+        return None
+
+
+class _ParseSpy:
+    """wraps a grammar to count how often it's used"""
+
+    def __init__(self, grammar: Lark):
+        self.grammar = grammar
+        self.calls = 0
+
+    def parse(self, *args, **kwargs):
+        self.calls += 1
+        return self.grammar.parse(*args, **kwargs)
+
+
+@dialects()
+@pytest.mark.parametrize("query", QUERIES)
+def test_same_tree(dialect: str, Bifrost: Type[Bifrost], query: str):
+    fast = Bifrost.validation_only(PermissiveConstraints())
+    earley = Bifrost.validation_only(PermissiveConstraints())
+    earley.fast_grammar = None
+
+    spy = _ParseSpy(fast.grammar)
+    fast.grammar = spy  # type: ignore
+    fast_tree = fast.parse(query)
+
+    assert spy.calls == 0
+    assert canonical_tree(fast_tree) == canonical_tree(earley.parse(query))
+
+
+@dialects()
+@pytest.mark.parametrize("query", REJECTED)
+def test_same_rejection(dialect: str, Bifrost: Type[Bifrost], query: str):
+    fast = Bifrost.validation_only(PermissiveConstraints())
+    earley = Bifrost.validation_only(PermissiveConstraints())
+    earley.fast_grammar = None
+
+    with pytest.raises(exc.InvalidQuery):
+        earley.parse(query)
+    with pytest.raises(exc.InvalidQuery):
+        fast.parse(query)
+
+    assert fast.fast_grammar is not None
+    with pytest.raises((lalr.DeferToEarley, UnexpectedInput)):
+        lalr.parse(fast.fast_grammar, query)
+
+
+@dialects()
+@pytest.mark.parametrize("query", QUERIES[:8])
+def test_missing_whitespace(dialect: str, Bifrost: Type[Bifrost], query: str):
+    """removing any one run of whitespace from a query either changes nothing, or
+    makes both parsers reject it"""
+    fast = Bifrost.validation_only(PermissiveConstraints())
+    earley = Bifrost.validation_only(PermissiveConstraints())
+    earley.fast_grammar = None
+
+    for space in re.finditer(r"\s+", query):
+        mutated = query[: space.start()] + query[space.end() :]
+        assert _parse_result(fast, mutated) == _parse_result(earley, mutated), mutated
+
+
+@dialects()
+def test_defer_to_earley(dialect: str, Bifrost: Type[Bifrost]):
+    bifrost = Bifrost.validation_only(PermissiveConstraints())
+    spy = _ParseSpy(bifrost.grammar)
+    bifrost.grammar = spy  # type: ignore
+
+    # the earley parser's choice of nesting is arbitrary
+    bifrost.parse("select (1 + 2 + 3) as num from t")
+    assert spy.calls == 1
+
+    # a reserved keyword as an alias, which the validators reject later
+    bifrost.parse("select t.a from t group")
+    assert spy.calls == 2
+
+    # an aliased count(1) is also an aliased function call
+    with pytest.raises(exc.AmbiguousParse):
+        bifrost.parse("select count(1) c from t")
+    assert spy.calls == 3
+
+
+@dialects()
+def test_no_conflicts(dialect: str, Bifrost: Type[Bifrost], caplog):
+    """lark silently resolves shift/reduce conflicts as shifts, which could produce a
+    different tree than the earley grammar, so the lalr grammars must not have any"""
+    fast_grammar = Bifrost.build_fast_grammar()
+    assert fast_grammar is not None
+
+    with caplog.at_level(logging.DEBUG, logger="lark"):
+        Lark(
+            fast_grammar.source_grammar,
+            parser="lalr",
+            lexer="contextual",
+            maybe_placeholders=False,
+            propagate_positions=True,
+            debug=True,
+        )
+    assert "conflict" not in caplog.text.lower()
@@ -0,0 +1,219 @@
+import asyncio
+from contextlib import nullcontext
+from typing import Mapping, Optional, Type
+
+import pytest
+from lark import Lark, ParseTree
+
+from heimdallm.bifrost import Bifrost as _BaseBifrost
+from heimdallm.bifrosts.sql import exc
+from heimdallm.bifrosts.sql.sqlite.select.bifrost import Bifrost
+from heimdallm.cache import LRUCache
+from heimdallm.constraints import ConstraintValidator as _BaseValidator
+from heimdallm.context import TraverseContext
+from heimdallm.instrumentation import (
+    Instrumentation,
+    MetricsCollector,
+    SpanAdapter,
+    Stage,
+)
+
+from ..utils import dialects
+from .utils import CacheableConstraints, PermissiveConstraints
+
+
+class Recorder(Instrumentation):
+    def __init__(self):
+        self.events: list[tuple[str, Stage]] = []
+        self.errors: dict[Stage, Optional[Exception]] = {}
+
+    def on_start(
+        self,
+        stage: Stage,
+        ctx: TraverseContext,
+        labels: Mapping[str, str],
+    ) -> None:
+        self.events.append(("start", stage))
+
+    def on_end(
+        self,
+        stage: Stage,
+        ctx: TraverseContext,
+        labels: Mapping[str, str],
+        duration: float,
+        error: Optional[Exception],
+    ) -> None:
+        assert duration >= 0
+        self.events.append(("end", stage))
+        self.errors[stage] = error
+
+
+class ReparsingConstraints(PermissiveConstraints):
+    """fixes the query, and then parses the fixed query again, like a validator that
+    can't produce the fixed tree directly"""
+
+    def fix(self, *, bifrost, grammar, ctx, tree) -> str:
+        output, _ = super().fix_tree(
+            bifrost=bifrost, grammar=grammar, ctx=ctx, tree=tree
+        )
+        return output
+
+    def fix_tree(
+        self,
+        *,
+        bifrost: _BaseBifrost,
+        grammar: Lark,
+        ctx: TraverseContext,
+        tree: ParseTree,
+    ) -> tuple[str, ParseTree]:
+        return _BaseValidator.fix_tree(
+            self, bifrost=bifrost, grammar=grammar, ctx=ctx, tree=tree
+        )
+
+
+@dialects()
+@pytest.mark.parametrize("autofix", [True, False])
+def test_stages(dialect: str, Bifrost: Type[Bifrost], autofix: bool):
+    recorder = Recorder()
+    metrics = MetricsCollector()
+    bifrost = Bifrost.validation_only(
+        PermissiveConstraints(), instrumentation=[recorder, metrics]
+    )
+    bifrost.traverse("select t1.col from t1", autofix=autofix)
+
+    # the streamed completion is unwrapped as it arrives
+    expected = [
+        ("start", Stage.WRAP),
+        ("end", Stage.WRAP),
+        ("start", Stage.UNWRAP),
+        ("start", Stage.LLM),
+        ("end", Stage.LLM),
+        ("end", Stage.UNWRAP),
+        ("start", Stage.PARSE),
+        ("end", Stage.PARSE),
+    ]
+    if autofix:
+        expected += [("start", Stage.FIX), ("end", Stage.FIX)]
+    expected += [
+        ("start", Stage.VALIDATE),
+        ("end", Stage.VALIDATE),
+        ("start", Stage.POST_TRANSFORM),
+        ("end", Stage.POST_TRANSFORM),
+    ]
+    assert recorder.events == expected
+    assert not any(recorder.errors.values())
+
+    parse = metrics.histogram(Stage.PARSE, dialect=dialect)
+    assert parse is not None and parse.count == 1 and parse.errors == 0
+    validate = metrics.histogram(
+        Stage.VALIDATE, dialect=dialect, validator="PermissiveConstraints"
+    )
+    assert validate is not None and validate.count == 1
+    assert validate.cumulative()[-1] == (float("inf"), 1)
+    assert metrics.histogram(Stage.VALIDATE, dialect=dialect) is None
+
+
+def test_resolve_and_reparse():
+    recorder = Recorder()
+    bifrost = Bifrost.validation_only(ReparsingConstraints(), instrumentation=recorder)
+    # multi-operator arithmetic is left to the earley parser and ambiguity resolution
+    bifrost.traverse("select t1.a * t1.b - t1.c as net from t1")
+
+    starts = [stage for event, stage in recorder.events if event == "start"]
+    assert starts == [
+        Stage.WRAP,
+        Stage.UNWRAP,
+        Stage.LLM,
+        Stage.PARSE,
+        Stage.RESOLVE,
+        Stage.FIX,
+        Stage.REPARSE,
+        Stage.RESOLVE,
+        Stage.VALIDATE,
+        Stage.POST_TRANSFORM,
+    ]
+
+
+def test_errors():
+    recorder = Recorder()
+    metrics = MetricsCollector()
+    bifrost = Bifrost.validation_only(
+        PermissiveConstraints(), instrumentation=[recorder, metrics]
+    )
+    with pytest.raises(exc.InvalidQuery):
+        bifrost.traverse("select from where")
+
+    assert isinstance(recorder.errors[Stage.PARSE], exc.InvalidQuery)
+    assert recorder.events[-1] == ("end", Stage.PARSE)
+    parse = metrics.histogram(Stage.PARSE, dialect="sqlite")
+    assert parse is not None and parse.errors == 1
+
+    rendered = metrics.render()
+    assert "# TYPE heimdallm_stage_duration_seconds histogram" in rendered
+    assert (
+        'heimdallm_stage_duration_seconds_bucket{dialect="sqlite",stage="parse",'
+        'le="+Inf"} 1'
+    ) in rendered
+    assert 'heimdallm_stage_errors_total{dialect="sqlite",stage="parse"} 1' in rendered
+    assert 'heimdallm_stage_errors_total{dialect="sqlite",stage="wrap"} 0' in rendered
+
+
+def test_validation_cache_hit():
+    """a cache hit skips everything after unwrapping"""
+    metrics = MetricsCollector()
+    bifrost = Bifrost.validation_only(
+        CacheableConstraints(), validation_cache=LRUCache(), instrumentation=metrics
+    )
+    bifrost.traverse("select t1.col from t1")
+    bifrost.traverse("select t1.col from t1")
+
+    unwrap = metrics.histogram(Stage.UNWRAP, dialect="sqlite")
+    parse = metrics.histogram(Stage.PARSE, dialect="sqlite")
+    assert unwrap is not None and unwrap.count == 2
+    assert parse is not None and parse.count == 1
+
+
+def test_spans():
+    spans = SpanAdapter()
+    bifrost = Bifrost.validation_only(PermissiveConstraints(), instrumentation=spans)
+    bifrost.traverse("select t1.a * t1.b - t1.c as net from t1")
+
+    by_name = {span.name: span for span in spans.spans}
+    assert set(by_name) == {f"heimdallm.{stage.value}" for stage in Stage} - {
+        "heimdallm.reparse"
+    }
+    roots = {span.name for span in spans.spans if span.parent_id is None}
+    assert roots == set(by_name) - {"heimdallm.llm", "heimdallm.resolve"}
+    assert by_name["heimdallm.llm"].parent_id == by_name["heimdallm.unwrap"].span_id
+    assert by_name["heimdallm.resolve"].parent_id == by_name["heimdallm.parse"].span_id
+    assert by_name["heimdallm.validate"].attributes == {
+        "heimdallm.dialect": "sqlite",
+        "heimdallm.validator": "PermissiveConstraints",
+    }
+    assert all(span.duration >= 0 and span.error is None for span in spans.spans)
+
+
+def test_tracer():
+    """spans are started with an opentelemetry-compatible tracer, if there is one"""
+    started = []
+
+    class Tracer:
+        def start_as_current_span(self, name: str, attributes: Mapping[str, str]):
+            started.append((name, dict(attributes)))
+            return nullcontext()
+
+    spans = SpanAdapter(tracer=Tracer())
+    bifrost = Bifrost.validation_only(PermissiveConstraints(), instrumentation=spans)
+    asyncio.run(bifrost.atraverse("select t1.col from t1"))
+
+    assert [name for name, _ in started] == [
+        "heimdallm.wrap",
+        "heimdallm.llm",
+        "heimdallm.unwrap",
+        "heimdallm.parse",
+        "heimdallm.fix",
+        "heimdallm.validate",
+        "heimdallm.post_transform",
+    ]
+    assert started[0][1] == {"heimdallm.dialect": "sqlite"}
+    assert not spans.spans
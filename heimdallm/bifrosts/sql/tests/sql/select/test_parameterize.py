@@ -0,0 +1,109 @@
+import pickle
+import sqlite3
+from typing import Type
+
+import pytest
+
+from heimdallm.bifrosts.sql.common import ParameterizedQuery
+from heimdallm.bifrosts.sql.sqlite.select.bifrost import Bifrost
+from heimdallm.cache import LRUCache
+
+from ..utils import dialects
+from .utils import CacheableConstraints, PermissiveConstraints
+
+
+@dialects()
+@pytest.mark.parametrize("autofix", [True, False])
+def test_parameterize(dialect: str, Bifrost: Type[Bifrost], autofix: bool):
+    bifrost = Bifrost.validation_only(
+        PermissiveConstraints(), parameterize_literals=True
+    )
+
+    def traverse(name: str, ids: str) -> ParameterizedQuery:
+        query = bifrost.traverse(
+            "select t1.col, 'label' from t1 "
+            f"where t1.title = '{name}' and t1.id in ({ids}) and t1.id = :id "
+            "and t1.price > 1.5 "
+            "group by substr(t1.col, 1, 2) limit 10",
+            autofix=autofix,
+        )
+        assert isinstance(query, ParameterizedQuery)
+        return query
+
+    query = traverse("ann", "1, 2")
+    assert query.params == {
+        "literal_0": "ann",
+        "literal_1": 1,
+        "literal_2": 2,
+    }
+    # only the literals in the conditions are lifted, and decimals are left alone
+    assert "'label'" in query
+    assert "'ann'" not in query
+    assert "1.5" in query
+    assert "substr(t1.col, 1, 2)" in query.replace(",1,2", ", 1, 2")
+    assert bifrost.placeholder("id") in query
+    assert bifrost.placeholder("literal_2") in query
+
+    # queries that only differ in their literals are the same query
+    other = traverse("bob", "3, 4")
+    assert other == query
+    assert other.fingerprint == query.fingerprint
+    assert other.params["literal_0"] == "bob"
+    assert traverse("bob", "3, 4, 5").fingerprint != query.fingerprint
+
+
+def test_execute():
+    """the parameterized query returns the same rows as the original"""
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(
+        """
+        CREATE TABLE t1 (id INTEGER, name TEXT);
+        INSERT INTO t1 VALUES (1, 'ann'), (2, 'it''s'), (3, 'bob'), (4, 'it''s');
+        """
+    )
+    sql = (
+        "select t1.id from t1 where t1.name = 'it''s' and t1.id > 2 and t1.id < :max "
+        "order by t1.id"
+    )
+
+    trusted = Bifrost.validation_only(PermissiveConstraints()).traverse(sql)
+    parameterized = Bifrost.validation_only(
+        PermissiveConstraints(), parameterize_literals=True
+    ).traverse(sql)
+    assert isinstance(parameterized, ParameterizedQuery)
+    assert parameterized.params == {"literal_0": "it's", "literal_1": 2}
+
+    expected = conn.execute(trusted, {"max": 10}).fetchall()
+    assert expected == [(4,)]
+    assert (
+        conn.execute(parameterized, {**parameterized.params, "max": 10}).fetchall()
+        == expected
+    )
+
+
+def test_name_conflict():
+    bifrost = Bifrost.validation_only(
+        PermissiveConstraints(), parameterize_literals=True
+    )
+    query = bifrost.traverse(
+        "select t1.col from t1 where t1.a = :literal_0 and t1.b = 5"
+    )
+    assert isinstance(query, ParameterizedQuery)
+    assert query.params == {"literal_1": 5}
+    assert pickle.loads(pickle.dumps(query)).params == query.params
+
+
+def test_cached_params():
+    """a query from the validation cache is shared, so its params can't be changed"""
+    bifrost = Bifrost.validation_only(
+        CacheableConstraints(),
+        parameterize_literals=True,
+        validation_cache=LRUCache(),
+    )
+    first = bifrost.traverse("select t1.col from t1 where t1.a = 5")
+    second = bifrost.traverse("select t1.col from t1 where t1.a = 5")
+    assert isinstance(second, ParameterizedQuery)
+
+    with pytest.raises(TypeError):
+        first.params["literal_0"] = 6  # type: ignore
+    assert second.params == {"literal_0": 5}
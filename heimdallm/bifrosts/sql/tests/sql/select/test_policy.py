@@ -0,0 +1,152 @@
+import gc
+import pickle
+import weakref
+from importlib import import_module
+from typing import Any, Type
+
+import pytest
+
+from heimdallm.bifrosts.sql import exc
+from heimdallm.bifrosts.sql.common import FqColumn, JoinCondition
+from heimdallm.bifrosts.sql.sqlite.select.bifrost import Bifrost
+
+from ..utils import dialects
+from .utils import CacheableConstraints, CustomerConstraints, PermissiveConstraints
+
+
+class AllowlistConstraints(PermissiveConstraints):
+    """only checks columns against its allowlist"""
+
+    def select_column_allowed(self, column: FqColumn) -> bool:
+        raise AssertionError("the allowlist should be used instead")
+
+    def condition_column_allowed(self, column: FqColumn) -> bool:
+        raise AssertionError("the allowlist should be used instead")
+
+    def select_column_allowlist(self):
+        return [FqColumn(table="t", column="a"), FqColumn(table="t", column="b")]
+
+    def condition_column_allowlist(self):
+        return [FqColumn(table="t", column="id")]
+
+
+@dialects()
+def test_compiled_once(dialect: str, Bifrost: Type[Bifrost]):
+    class CountingConstraints(CustomerConstraints):
+        calls = 0
+
+        def allowed_joins(self):
+            CountingConstraints.calls += 1
+            return [JoinCondition("Customer.CustomerId", "Invoice.CustomerId")]
+
+    validator = CountingConstraints()
+    bifrost = Bifrost.validation_only(validator)
+    assert validator.compile() is validator.compile()
+
+    for i in range(3):
+        bifrost.traverse(
+            "select Customer.Email from Customer join Invoice "
+            "on Customer.CustomerId = Invoice.CustomerId "
+            f"where Invoice.CustomerId = :customer_id limit {i + 1}"
+        )
+    assert CountingConstraints.calls == 1
+
+
+def test_compiled_collected():
+    """a validator's compiled policy doesn't keep the validator alive, because
+    per-request validators are the norm"""
+    refs = []
+    for i in range(10):
+        validator = PermissiveConstraints()
+        Bifrost.validation_only(validator).traverse(f"select t{i}.col from t{i}")
+        refs.append(weakref.ref(validator))
+    del validator
+    gc.collect()
+    assert all(ref() is None for ref in refs)
+
+
+def test_compiled_state():
+    """compiling doesn't change the validator's fingerprint, and a compiled validator
+    can still be pickled"""
+    validator = CacheableConstraints()
+    fingerprint = validator.fingerprint()
+    policy = validator.compile()
+    assert validator.fingerprint() == fingerprint
+
+    unpickled = pickle.loads(pickle.dumps(validator))
+    assert unpickled.compile().requester_identities == policy.requester_identities
+    assert unpickled.compile().function_predicate == unpickled.can_use_function
+
+
+def test_equal_joins():
+    """joins that are equal to each other are all kept, along with their identities"""
+
+    class Constraints(PermissiveConstraints):
+        def allowed_joins(self):
+            return [
+                JoinCondition("a.id", "b.a_id"),
+                JoinCondition("b.a_id", "a.id", identity="requester"),
+            ]
+
+    policy = Constraints().compile()
+    assert len(policy.allowed_joins) == 2
+    assert policy.allowed_joins[1].identity_placeholder == "requester"
+    assert policy.join_allowed(JoinCondition("a.id", "b.a_id"))
+    assert {str(c) for c in policy.requester_identities} == {
+        "a.id=:requester",
+        "b.a_id=:requester",
+    }
+
+
+@dialects()
+def test_policy(dialect: str, Bifrost: Type[Bifrost]):
+    policy = CustomerConstraints().compile()
+
+    assert policy.any_join
+    assert policy.join_allowed(JoinCondition("a.b", "c.d"))
+    assert policy.requester_identities == frozenset(
+        CustomerConstraints().requester_identities()
+    )
+    assert policy.select_columns is None
+    assert policy.select_column_allowed(FqColumn(table="t", column="a"))
+
+    # the frozen sets can't be changed from under the policy
+    with pytest.raises(AttributeError):
+        policy.max_limit = 10  # type: ignore
+
+
+@dialects()
+def test_column_allowlists(dialect: str, Bifrost: Type[Bifrost]):
+    bifrost = Bifrost.validation_only(AllowlistConstraints())
+    bifrost.traverse("select t.a, t.b from t where t.id = 1")
+
+    with pytest.raises(exc.IllegalSelectedColumn):
+        bifrost.traverse("select t.c from t", autofix=False)
+    with pytest.raises(exc.IllegalConditionColumn):
+        bifrost.traverse("select t.a from t where t.a = 1")
+
+    # the autofixer uses the allowlist too
+    trusted_query = bifrost.traverse("select t.a, t.c from t")
+    assert "t.c" not in trusted_query
+
+
+@dialects()
+def test_function_allowlist(dialect: str, Bifrost: Type[Bifrost]):
+    module = import_module(f"heimdallm.bifrosts.sql.{dialect}.select.validator")
+    DialectConstraints: Any = module.ConstraintValidator
+
+    class Constraints(DialectConstraints, PermissiveConstraints):
+        pass
+
+    class NoFunctions(Constraints):
+        def can_use_function(self, function: str) -> bool:
+            return False
+
+    # the safe functions are used as the allowlist, unless they've been overridden
+    policy = Constraints().compile()
+    assert policy.functions is not None and "count" in policy.functions
+    assert NoFunctions().compile().functions is None
+
+    Bifrost.validation_only(Constraints()).traverse("select count(t.a) from t")
+    with pytest.raises(exc.IllegalFunction):
+        Bifrost.validation_only(NoFunctions()).traverse("select count(t.a) from t")
@@ -1,5 +1,8 @@
 from typing import Type
 
+import pytest
+
+from heimdallm.bifrosts.sql import exc
 from heimdallm.bifrosts.sql.sqlite.select.bifrost import Bifrost
 
 from ..utils import dialects
@@ -18,3 +21,39 @@ def test_parameterized_constraint(dialect: str, Bifrost: Type[Bifrost]):
         assert ":id" in trusted
     else:
         assert "%(id)s" in trusted
+
+
+@dialects()
+def test_rewrite_placeholders(dialect: str, Bifrost: Type[Bifrost]):
+    bifrost = Bifrost.validation_only(PermissiveConstraints())
+
+    query = (
+        "select t1.col from t1 where t1.a=:a and t1.b in (:b, :a) "
+        "and t1.c in (select t2.c from t2 where t2.d=:d)"
+    )
+    tree = bifrost.parse(query)
+    rewritten, names = bifrost.rewrite_placeholders(query, tree)
+    assert names == ["a", "b", "a", "d"]
+    assert rewritten == (
+        "select t1.col from t1 where t1.a={a} and t1.b in ({b}, {a}) "
+        "and t1.c in (select t2.c from t2 where t2.d={d})"
+    ).format(**{name: bifrost.placeholder(name) for name in names})
+
+    # the values for the placeholders are checked in the same pass
+    bifrost.rewrite_placeholders(query, tree, params={"a": 1, "b": 2, "d": 3})
+    with pytest.raises(exc.MissingPlaceholderValue) as e:
+        bifrost.rewrite_placeholders(query, tree, params={"b": 2})
+    assert e.value.names == ["a", "d"]
+
+
+@dialects()
+def test_many_placeholders(dialect: str, Bifrost: Type[Bifrost]):
+    bifrost = Bifrost.validation_only(PermissiveConstraints())
+
+    names = [f"p{i}" for i in range(200)]
+    query = "select t1.col from t1 where t1.id in ({})".format(
+        ", ".join(f":{name}" for name in names)
+    )
+    trusted = bifrost.traverse(query)
+    assert trusted.count(bifrost.placeholder("p199")) == 1
+    assert bifrost.rewrite_placeholders(query, bifrost.parse(query))[1] == names
@@ -0,0 +1,256 @@
+import sqlite3
+from typing import Any, Sequence, Type
+
+import pytest
+
+from heimdallm.bifrosts.sql.common import (
+    FqColumn,
+    JoinCondition,
+    ParameterizedConstraint,
+)
+from heimdallm.bifrosts.sql.mysql.schema import introspect as mysql_introspect
+from heimdallm.bifrosts.sql.postgres.schema import introspect as postgres_introspect
+from heimdallm.bifrosts.sql.schema import Schema, Table
+from heimdallm.bifrosts.sql.sqlite.schema import Introspector
+from heimdallm.bifrosts.sql.sqlite.select.bifrost import get_schema
+from heimdallm.bifrosts.sql.sqlite.select.envelope import PromptEnvelope
+from heimdallm.llm_providers.mock import EchoMockLLM
+
+from ..utils import dialects
+from .utils import PermissiveConstraints
+
+SCHEMA = """-- the video store
+CREATE TABLE customer (
+    customer_id INTEGER PRIMARY KEY,
+    first_name TEXT,
+    "email address" TEXT,
+    CONSTRAINT name_check CHECK (first_name != ''),
+    last_update TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS `rental` (
+    rental_id INTEGER,
+    customer_id INTEGER,
+    inventory_id INTEGER,
+    last_update TIMESTAMP,
+    PRIMARY KEY (rental_id)
+);
+CREATE INDEX rental_customer ON rental (customer_id);
+CREATE TABLE inventory (inventory_id INTEGER, film_id INTEGER, last_update TIMESTAMP);
+CREATE TABLE film (
+    film_id INTEGER, title TEXT, rating TEXT DEFAULT 'G', last_update TIMESTAMP
+);
+CREATE TABLE actor (actor_id INTEGER, first_name TEXT, last_update TIMESTAMP);
+CREATE TABLE category (category_id INTEGER, genre TEXT)"""
+
+
+class RentalConstraints(PermissiveConstraints):
+    def requester_identities(self) -> Sequence[ParameterizedConstraint]:
+        return [
+            ParameterizedConstraint(
+                column="customer.customer_id",
+                placeholder="customer_id",
+            )
+        ]
+
+    def allowed_joins(self) -> Sequence[JoinCondition]:
+        return [
+            JoinCondition("customer.customer_id", "rental.customer_id"),
+            JoinCondition("rental.inventory_id", "inventory.inventory_id"),
+            JoinCondition("inventory.film_id", "film.film_id"),
+        ]
+
+
+def test_parse():
+    schema = Schema.parse(SCHEMA)
+    assert schema.preamble == "-- the video store"
+    assert [table.name for table in schema.tables] == [
+        "customer",
+        "rental",
+        "inventory",
+        "film",
+        "actor",
+        "category",
+    ]
+    assert schema.tables[0].columns == (
+        "customer_id",
+        "first_name",
+        "email address",
+        "last_update",
+    )
+    assert schema.tables[1].columns == (
+        "rental_id",
+        "customer_id",
+        "inventory_id",
+        "last_update",
+    )
+    # what comes after a table's statement belongs to it
+    assert schema.tables[1].definition.endswith("ON rental (customer_id);")
+
+    rendered = schema.render(["film", "Customer"])
+    assert rendered.startswith("-- the video store\nCREATE TABLE customer (")
+    assert "CREATE TABLE film" in rendered
+    assert "rental" not in rendered
+
+    assert Schema.parse("a schema in prose") == Schema(
+        tables=(), preamble="a schema in prose"
+    )
+
+
+def test_relevant_tables():
+    schema = Schema.parse(SCHEMA)
+    policies = [RentalConstraints().compile()]
+
+    # the identity's table, and the tables that join it to the question's table
+    assert schema.relevant_tables("Which films did I rent?", policies) == [
+        "customer",
+        "rental",
+        "inventory",
+        "film",
+    ]
+    # a column's name matches, including with spaces for underscores
+    assert schema.relevant_tables("list the genre of each", policies) == [
+        "customer",
+        "category",
+    ]
+    assert schema.relevant_tables("what's my email address", policies) == ["customer"]
+    # tables with no join path are still included
+    assert schema.relevant_tables("actors", policies) == ["customer", "actor"]
+    # a column in too many tables says nothing about the question
+    assert schema.relevant_tables("the last update", policies) is None
+    assert schema.relevant_tables("hello", policies) is None
+
+
+def test_relevant_allowed_columns():
+    class AllowlistConstraints(PermissiveConstraints):
+        def select_column_allowlist(self):
+            return [FqColumn(table="film", column="title")]
+
+    schema = Schema.parse(SCHEMA)
+    policies = [AllowlistConstraints().compile()]
+    assert schema.relevant_tables("the title and rating", policies) == ["film"]
+    assert schema.relevant_tables("the genre", policies) is None
+
+
+@dialects(bifrost=False, envelope=True)
+def test_pruned_envelope(dialect: str, PromptEnvelope: Type[PromptEnvelope]):
+    env = PromptEnvelope(
+        llm=EchoMockLLM(),
+        db_schema=SCHEMA,
+        validators=[RentalConstraints()],
+        prune_schema=True,
+    )
+
+    wrapped = env.wrap("my favorite actor")
+    assert "CREATE TABLE actor" in wrapped
+    assert "CREATE TABLE customer" in wrapped
+    assert "CREATE TABLE film" not in wrapped
+    assert wrapped == env._render(
+        "my favorite actor", env.relevant_schema("my favorite actor"), env.params
+    )
+
+    # an input that isn't about any table gets the whole schema
+    assert env.wrap("hello") == env.prefix + "hello"
+    assert "CREATE TABLE film" in env.prefix
+
+
+def test_introspect_sqlite():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(
+        """
+        create table rental (rental_id INTEGER, customer_id INTEGER);
+        CREATE TABLE customer ("customer id" INTEGER, first_name TEXT);
+        CREATE VIRTUAL TABLE notes USING fts5(body);
+        INSERT INTO customer VALUES (1, 'CREATE TABLE');
+        """
+    )
+    introspect = Introspector()
+
+    schema = introspect(conn)
+    assert schema.tables[0] == Table(
+        name="customer",
+        columns=("customer id", "first_name"),
+        definition='CREATE TABLE customer ("customer id" INTEGER, first_name TEXT);',
+    )
+    assert [table.name for table in schema.tables] == ["customer", "rental"]
+    assert get_schema(conn) == schema.render()
+
+    # the schema is read again only when it changes
+    assert introspect(conn) is schema
+    conn.execute("ALTER TABLE rental ADD COLUMN film_id INTEGER")
+    schema = introspect(conn)
+    assert schema.tables[1].columns == ("rental_id", "customer_id", "film_id")
+    assert introspect(conn) is schema
+    assert introspect.cache.misses == 2
+
+
+class _Cursor:
+    def __init__(self, conn: "_Connection"):
+        self.conn = conn
+        self.rows: list = []
+
+    def execute(self, query: str, params: Sequence = ()):
+        self.conn.queries.append(query)
+        if "ORDER BY" in query.splitlines()[-1]:
+            self.rows = self.conn.columns
+        else:
+            self.rows = [("db", len(self.conn.columns), hash(tuple(self.conn.columns)))]
+
+    def fetchall(self) -> list:
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class _Connection:
+    """a DB-API connection to a catalog of columns"""
+
+    def __init__(self, columns: list[tuple[str, str, str]]):
+        self.columns = columns
+        self.queries: list[str] = []
+
+    def cursor(self) -> _Cursor:
+        return _Cursor(self)
+
+
+@pytest.mark.parametrize("introspect", [mysql_introspect, postgres_introspect])
+def test_introspect_catalog(introspect: Any):
+    conn = _Connection(
+        [
+            ("customer", "customer_id", "int"),
+            ("customer", "email", "varchar(50)"),
+            ("rental", "rental_id", "int"),
+        ]
+    )
+    schema = introspect(conn)
+    assert schema.tables == (
+        Table(
+            name="customer",
+            columns=("customer_id", "email"),
+            definition="CREATE TABLE customer (\n"
+            "    customer_id int,\n"
+            "    email varchar(50)\n"
+            ");",
+        ),
+        Table.from_columns("rental", [("rental_id", "int")]),
+    )
+
+    # only the fingerprint is taken until the columns change
+    assert introspect(conn) is schema
+    assert len(conn.queries) == 3
+    conn.columns = conn.columns[:2]
+    assert introspect(conn).render().count("CREATE TABLE") == 1
+
+
+@dialects(bifrost=False, envelope=True)
+def test_envelope_schema(dialect: str, PromptEnvelope: Type[PromptEnvelope]):
+    """an envelope can be given a structured schema"""
+    schema = Schema.parse(SCHEMA)
+    env = PromptEnvelope(
+        llm=EchoMockLLM(),
+        db_schema=schema,
+        validators=[RentalConstraints()],
+        prune_schema=True,
+    )
+    assert "CREATE TABLE film" not in env.wrap("my favorite actor")
+    assert env.wrap("hello") == env._render("hello", schema.render(), env.params)
@@ -0,0 +1,156 @@
+from typing import Type
+
+import pytest
+
+from heimdallm.bifrosts.sql import exc
+from heimdallm.bifrosts.sql.common import FqColumn, JoinCondition
+from heimdallm.bifrosts.sql.sqlite.select.bifrost import Bifrost
+from heimdallm.cache import LRUCache
+
+from ..utils import dialects
+from .utils import CacheableConstraints, PermissiveConstraints
+
+
+class _NoSecretConstraints(CacheableConstraints):
+    def select_column_allowed(self, column: FqColumn) -> bool:
+        return column.column != "secret"
+
+
+class _LimitConstraints(CacheableConstraints):
+    def __init__(self, limit: int):
+        self.limit = limit
+
+    def max_limit(self):
+        return self.limit
+
+
+def _count_parses(bifrost: Bifrost) -> list[str]:
+    parses: list[str] = []
+    parse = bifrost.parse
+
+    def counting_parse(untrusted_llm_output, ctx=None):
+        parses.append(untrusted_llm_output)
+        return parse(untrusted_llm_output, ctx=ctx)
+
+    bifrost.parse = counting_parse  # type: ignore
+    return parses
+
+
+@dialects()
+def test_cache_hit(dialect: str, Bifrost: Type[Bifrost]):
+    cache: LRUCache = LRUCache()
+    bifrost = Bifrost.validation_only(
+        CacheableConstraints(),
+        validation_cache=cache,
+    )
+    parses = _count_parses(bifrost)
+
+    query = "select t1.col from t1 where t1.id=:id"
+    first = bifrost.traverse(query)
+    # the autofixed tree is validated directly, without a reparse
+    assert len(parses) == 1
+
+    second = bifrost.traverse(query)
+    assert second == first
+    assert len(parses) == 1
+    assert cache.hits == 1
+
+
+@dialects()
+def test_cache_failure(dialect: str, Bifrost: Type[Bifrost]):
+    cache: LRUCache = LRUCache()
+    bifrost = Bifrost.validation_only(
+        _NoSecretConstraints(),
+        validation_cache=cache,
+    )
+    parses = _count_parses(bifrost)
+
+    query = "select t1.secret from t1"
+    with pytest.raises(exc.IllegalSelectedColumn) as e1:
+        bifrost.traverse(query, autofix=False)
+    with pytest.raises(exc.IllegalSelectedColumn) as e2:
+        bifrost.traverse(query, autofix=False)
+
+    assert len(parses) == 1
+    assert e2.value.column == e1.value.column == "t1.secret"
+    # the cached exception is rebound to the new traversal
+    assert e2.value.ctx is not e1.value.ctx
+    assert e2.value.ctx.untrusted_human_input == query
+
+
+def test_cache_shared_between_bifrosts():
+    cache: LRUCache = LRUCache()
+    query = "select t1.col from t1"
+
+    b1 = Bifrost.validation_only(_LimitConstraints(10), validation_cache=cache)
+    b2 = Bifrost.validation_only(_LimitConstraints(10), validation_cache=cache)
+    b3 = Bifrost.validation_only(_LimitConstraints(20), validation_cache=cache)
+
+    assert "10" in b1.traverse(query)
+    # same configuration, so it's a hit
+    assert "10" in b2.traverse(query)
+    assert cache.hits == 1
+
+    # different configuration, so it's a miss
+    assert "20" in b3.traverse(query)
+    assert cache.hits == 1
+    assert len(cache) == 2
+
+
+def test_cache_keyed_on_autofix():
+    cache: LRUCache = LRUCache()
+    bifrost = Bifrost.validation_only(_LimitConstraints(10), validation_cache=cache)
+    query = "select t1.col from t1"
+
+    bifrost.traverse(query)
+    with pytest.raises(exc.TooManyRows):
+        bifrost.traverse(query, autofix=False)
+
+
+def test_fingerprint_join_order():
+    """join conditions are unordered, so their order doesn't affect the fingerprint"""
+
+    class Joins1(CacheableConstraints):
+        def allowed_joins(self):
+            return [JoinCondition("a.id", "b.a_id"), JoinCondition("b.id", "c.b_id")]
+
+    class Joins2(CacheableConstraints):
+        def allowed_joins(self):
+            return [JoinCondition("c.b_id", "b.id"), JoinCondition("b.a_id", "a.id")]
+
+    class Joins3(CacheableConstraints):
+        def allowed_joins(self):
+            return [JoinCondition("a.id", "b.a_id")]
+
+    # the class name is part of the fingerprint, so give them the same name
+    Joins2.__qualname__ = Joins3.__qualname__ = Joins1.__qualname__
+
+    assert Joins1().fingerprint() == Joins2().fingerprint()
+    assert Joins1().fingerprint() != Joins3().fingerprint()
+
+
+def test_cache_opt_in():
+    """a validator without a fingerprint is never cached, even alongside one with a
+    fingerprint"""
+    cache: LRUCache = LRUCache()
+    bifrost = Bifrost.validation_only(
+        [PermissiveConstraints(), CacheableConstraints()], validation_cache=cache
+    )
+    parses = _count_parses(bifrost)
+
+    query = "select t1.col from t1"
+    assert PermissiveConstraints().fingerprint() is None
+    assert bifrost.traverse(query) == bifrost.traverse(query)
+    assert len(parses) == 2
+    assert len(cache) == 0
+
+
+def test_fingerprint_memory_address():
+    """state whose repr is an object's address can't be fingerprinted"""
+
+    class _ObjectConstraints(CacheableConstraints):
+        def __init__(self):
+            self.lookup = object()
+
+    with pytest.raises(ValueError):
+        _ObjectConstraints().fingerprint()
@@ -3,8 +3,9 @@ from typing import Type
 import pytest
 
 from heimdallm.bifrosts.sql import exc
-from heimdallm.bifrosts.sql.common import FqColumn
+from heimdallm.bifrosts.sql.common import FqColumn, ParameterizedConstraint
 from heimdallm.bifrosts.sql.sqlite.select.bifrost import Bifrost
+from heimdallm.bifrosts.sql.visitors.analysis import QueryAnalysis
 
 from ..utils import dialects
 from .utils import PermissiveConstraints
@@ -81,3 +82,76 @@ def test_both_succeed(dialect: str, Bifrost: Type[Bifrost]):
         t1.foo='bar'
     """
     bifrost.traverse(query)
+
+
+class TenantConstraints(PermissiveConstraints):
+    """only allows queries constrained to one tenant's identity"""
+
+    def __init__(self, identity: str):
+        self.identity = identity
+
+    def requester_identities(self):
+        return [ParameterizedConstraint(column=self.identity, placeholder="id")]
+
+    def max_limit(self):
+        return 10
+
+
+@dialects()
+def test_shared_analysis(dialect: str, Bifrost: Type[Bifrost], monkeypatch):
+    """the query is analyzed and fixed once, no matter how many validators reject it"""
+    walks = []
+    walk = QueryAnalysis._walk
+
+    def spy(self):
+        walks.append(self)
+        return walk(self)
+
+    monkeypatch.setattr(QueryAnalysis, "_walk", spy)
+
+    bifrost = Bifrost.validation_only(
+        [
+            TenantConstraints("admin.id"),
+            TenantConstraints("manager.id"),
+            TenantConstraints("customer.id"),
+            TenantConstraints("t1.id"),
+        ]
+    )
+
+    # each validator fixes the limit, but only the last one accepts the identity
+    query = "select t1.col from t1 where t1.id=:id limit 50"
+    trusted_query = bifrost.traverse(query)
+    assert "limit 10" in trusted_query.lower()
+    # once for the query, and once for the fixed query
+    assert len(walks) == 2
+
+    # every validator rejects the query with the same exception, without analyzing it
+    # again
+    walks.clear()
+    with pytest.raises(exc.IllegalJoinType):
+        bifrost.traverse(
+            "select t1.col from t1 natural join t2 on t1.id = t2.id "
+            "where t1.id=:id limit 5"
+        )
+    assert len(walks) == 1
+
+
+@dialects()
+def test_distinct_fixes(dialect: str, Bifrost: Type[Bifrost]):
+    """validators that disagree about the columns get their own fixes"""
+
+    class NoSecrets(TenantConstraints):
+        def select_column_allowed(self, column: FqColumn) -> bool:
+            return column.column != "secret"
+
+    query = "select t1.col, t1.secret from t1 where t1.id=:id"
+
+    bifrost = Bifrost.validation_only(
+        [NoSecrets("customer.id"), TenantConstraints("t1.id")]
+    )
+    assert "secret" in bifrost.traverse(query)
+
+    bifrost = Bifrost.validation_only(
+        [TenantConstraints("customer.id"), NoSecrets("t1.id")]
+    )
+    assert "secret" not in bifrost.traverse(query)
@@ -1,5 +1,7 @@
 from typing import Sequence
 
+from lark import Token, Tree
+
 from heimdallm.bifrosts.sql.common import (
     ANY_JOIN,
     FqColumn,
@@ -34,6 +36,13 @@ class PermissiveConstraints(ConstraintValidator):
         return self.select_column_allowed(column)
 
 
+class CacheableConstraints(PermissiveConstraints):
+    """allows basically anything, and opts in to the validation cache"""
+
+    def fingerprint(self) -> str:
+        return self.attribute_fingerprint()
+
+
 class CustomerConstraints(PermissiveConstraints):
     def requester_identities(self):
         return [
@@ -49,3 +58,15 @@ class CustomerConstraints(PermissiveConstraints):
 
     def parameterized_constraints(self) -> Sequence[ParameterizedConstraint]:
         return []
+
+
+def canonical_tree(node: Tree | Token):
+    """a tree comparison that, unlike lark's, includes token types and the positions
+    of placeholders"""
+    if isinstance(node, Token):
+        return (node.type, node.value)
+
+    positions = None
+    if node.data == "placeholder":
+        positions = (node.meta.start_pos, node.meta.end_pos)
+    return (node.data, [canonical_tree(c) for c in node.children], positions)
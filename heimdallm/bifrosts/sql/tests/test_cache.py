@@ -0,0 +1,52 @@
+import pytest
+
+from heimdallm.cache import LRUCache
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_lru_eviction():
+    cache: LRUCache[int] = LRUCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+
+    # touch "a" so that "b" is the least recently used
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_ttl():
+    clock = _Clock()
+    cache: LRUCache[int] = LRUCache(ttl=10, clock=clock)
+    cache.set("a", 1)
+
+    clock.now = 9
+    assert cache.get("a") == 1
+
+    clock.now = 11
+    assert cache.get("a", "expired") == "expired"
+    assert len(cache) == 0
+
+
+def test_stats():
+    cache: LRUCache[int] = LRUCache()
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("b")
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_bad_size():
+    with pytest.raises(ValueError):
+        LRUCache(max_size=0)
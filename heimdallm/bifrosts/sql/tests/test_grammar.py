@@ -0,0 +1,90 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Type
+
+from heimdallm.bifrosts.sql.sqlite.select.bifrost import Bifrost
+from heimdallm.grammar import GrammarRegistry
+
+from .sql.select.utils import PermissiveConstraints
+from .sql.utils import dialects
+
+_TINY_GRAMMAR = """
+start: WORD ("," WORD)*
+%import common.WORD
+%ignore " "
+"""
+
+
+def _write_grammar(tmp_path: Path) -> Path:
+    grammar_path = tmp_path / "tiny.lark"
+    grammar_path.write_text(_TINY_GRAMMAR)
+    return grammar_path
+
+
+@dialects()
+def test_bifrosts_share_grammar(dialect: str, Bifrost: Type[Bifrost]):
+    b1 = Bifrost.validation_only(PermissiveConstraints())
+    b2 = Bifrost.validation_only(PermissiveConstraints())
+    assert b1.grammar is b2.grammar
+
+
+def test_dialects_have_distinct_grammars():
+    from heimdallm.bifrosts.sql.mysql.select.bifrost import Bifrost as MySQLBifrost
+
+    assert Bifrost.build_grammar() is not MySQLBifrost.build_grammar()
+
+
+def test_keyed_by_options(tmp_path: Path):
+    registry = GrammarRegistry()
+    grammar_path = _write_grammar(tmp_path)
+
+    earley = registry.get("tiny", grammar_path)
+    assert registry.get("tiny", grammar_path) is earley
+
+    lalr = registry.get("tiny", grammar_path, parser="lalr")
+    assert lalr is not earley
+    assert len(registry) == 2
+
+    registry.clear()
+    assert registry.get("tiny", grammar_path) is not earley
+
+
+def test_threaded_build(tmp_path: Path):
+    """concurrent requests for the same grammar all receive the same object"""
+    registry = GrammarRegistry()
+    grammar_path = _write_grammar(tmp_path)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        grammars = list(
+            pool.map(lambda _: registry.get("tiny", grammar_path), range(32))
+        )
+    assert all(g is grammars[0] for g in grammars)
+    assert len(registry) == 1
+
+
+def test_disk_cache(tmp_path: Path):
+    grammar_path = _write_grammar(tmp_path)
+    cache_dir = tmp_path / "cache"
+
+    registry = GrammarRegistry()
+    registry.enable_disk_cache(cache_dir)
+    grammar = registry.get("tiny", grammar_path, parser="lalr")
+    assert len(list(cache_dir.iterdir())) == 1
+
+    # a fresh registry, like one in a new process, loads from the same file
+    other = GrammarRegistry()
+    other.enable_disk_cache(cache_dir)
+    loaded = other.get("tiny", grammar_path, parser="lalr")
+    assert len(list(cache_dir.iterdir())) == 1
+    assert loaded.parse("a, b") == grammar.parse("a, b")
+
+
+def test_disk_cache_earley_in_memory(tmp_path: Path):
+    """lark can only serialize lalr grammars, so earley grammars stay in memory"""
+    grammar_path = _write_grammar(tmp_path)
+    cache_dir = tmp_path / "cache"
+
+    registry = GrammarRegistry()
+    registry.enable_disk_cache(cache_dir)
+    registry.get("tiny", grammar_path)
+    assert list(cache_dir.iterdir()) == []
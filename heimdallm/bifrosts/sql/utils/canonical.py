@@ -0,0 +1,235 @@
+import re
+from typing import Optional
+
+from lark import ParseTree, Token, Tree
+
+from ..common import CanonicalQuery
+from ..visitors.index import index_tree
+
+# the lexemes of a query that has already been parsed, so the lexer only needs to
+# find the boundaries of its tokens, not check them. the groups are whitespace,
+# literals, quoted identifiers, words, placeholders and operators. strings that may
+# escape with backslashes (postgres' E'' strings, and all of mysql's strings) have
+# their own alternative, because a backslash changes where they end.
+_TOKENS = r"""
+    (\s+)
+    |([eE]'(?:[^'\\]|\\.|'')*'|{strings}|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    |(`[^`]*`|"[^"]*"|\[[^\]]*\])
+    |([a-zA-Z_][a-zA-Z0-9_$]*)
+    |(:[a-zA-Z_][a-zA-Z0-9_]*)
+    |(::|<=>|<=|>=|<>|!=|\|\||<<|>>|@@|.)
+"""
+_LEXER = re.compile(
+    _TOKENS.format(strings=r"'(?:[^']|'')*'"),
+    flags=re.VERBOSE | re.DOTALL,
+)
+_BACKSLASH_LEXER = re.compile(
+    _TOKENS.format(strings=r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\""),
+    flags=re.VERBOSE | re.DOTALL,
+)
+
+#: What a masked literal is replaced with.
+MASK = "?"
+
+# what a token is, for deciding on the spaces around it
+_KEYWORD, _NAME, _LITERAL, _OPERATOR = range(4)
+# the tokens that are never followed by a space, and those never preceded by one
+_NO_SPACE_AFTER = {"(", ".", "::"}
+_NO_SPACE_BEFORE = {")", ",", ".", "::"}
+# a sign after a keyword or another operator is unary, and sticks to its operand
+_UNARY_SIGNS = {"+", "-", "~", "@"}
+# the keywords that may be followed by a parenthesized list or subquery. any other
+# word before a parenthesis is a function's name
+_SPACED_KEYWORDS = {
+    "ALL",
+    "AND",
+    "AS",
+    "BETWEEN",
+    "BY",
+    "DISTINCT",
+    "EXISTS",
+    "FROM",
+    "HAVING",
+    "IN",
+    "INTERVAL",
+    "IS",
+    "JOIN",
+    "LIKE",
+    "ILIKE",
+    "LIMIT",
+    "NOT",
+    "OFFSET",
+    "ON",
+    "OR",
+    "SELECT",
+    "UNION",
+    "WHERE",
+    "WITH",
+}
+# the rules that the names of a query are found in
+_IDENTIFIER, _ALIAS, _TABLE, _CTE = range(4)
+_NAME_RULES = {
+    "unquoted_identifier": _IDENTIFIER,
+    "quoted_identifier": _IDENTIFIER,
+    "generic_alias": _ALIAS,
+    "selected_table": _TABLE,
+    "aliased_table": _TABLE,
+    "joined_table": _TABLE,
+    "cte": _CTE,
+}
+
+
+def canonicalize(
+    query: str,
+    tree: ParseTree,
+    *,
+    mask_literals: bool = False,
+    backslash_strings: bool = False,
+) -> CanonicalQuery:
+    """Normalizes a query, so that queries that only differ in their formatting have
+    the same text and fingerprint:
+
+    * whitespace is collapsed, and only kept between tokens where it's conventional.
+    * keywords and function names are uppercased. Identifiers keep their case.
+    * table and column aliases are renamed to ``a0``, ``a1``, and so on, in the order
+      that they first appear.
+    * a trailing semicolon is dropped.
+    * literals are replaced with ``?``, if ``mask_literals`` is set, so that queries
+      that only differ in their literals are the same, too.
+
+    The query is lexed once, with a regular expression, and the tree is only used to
+    tell identifiers apart from keywords, so it's cheap enough to do on every
+    traversal.
+
+    :param query: The query that the tree was parsed from.
+    :param tree: The parse tree of the query.
+    :param mask_literals: Whether to replace the string and number literals with
+        ``?``. The query's ``:name`` placeholders are kept.
+    :param backslash_strings: Whether the dialect's strings escape with backslashes,
+        and may also be quoted with double quotes, like MySQL's.
+    :return: The canonical query.
+    """
+    identifiers, aliases, tables = _names(tree)
+    renamed: dict[str, str] = {}
+    lexer = _BACKSLASH_LEXER if backslash_strings else _LEXER
+
+    tokens: list[str] = []
+    kinds: list[int] = []
+    append_token = tokens.append
+    append_kind = kinds.append
+    # only the alternative that matched is non-empty
+    for _, literal, quoted, word, placeholder, op in lexer.findall(query):
+        if literal:
+            append_token(MASK if mask_literals else literal)
+            append_kind(_LITERAL)
+        elif placeholder:
+            append_token(placeholder)
+            append_kind(_NAME)
+        elif op:
+            append_token(op)
+            append_kind(_NAME if op == ")" else _OPERATOR)
+        elif word or quoted:
+            key = (word or quoted[1:-1]).lower()
+            if (
+                key in aliases
+                and key not in tables
+                and (not tokens or tokens[-1] != ".")
+            ):
+                alias = renamed.get(key)
+                if alias is None:
+                    alias = _fresh_alias(len(renamed), identifiers)
+                    renamed[key] = alias
+                # an alias that's defined right after its expression, without the
+                # optional ``AS``
+                if kinds and (kinds[-1] == _NAME or kinds[-1] == _LITERAL):
+                    append_token("AS")
+                    append_kind(_KEYWORD)
+                append_token(alias)
+                append_kind(_NAME)
+            elif quoted or key in identifiers:
+                append_token(quoted or word)
+                append_kind(_NAME)
+            else:
+                append_token(word.upper())
+                append_kind(_KEYWORD)
+
+    while tokens and tokens[-1] == ";":
+        tokens.pop()
+
+    parts: list[str] = []
+    for i, token in enumerate(tokens):
+        if i and not _sticks(tokens, kinds, i):
+            parts.append(" ")
+        parts.append(token)
+
+    sql = "".join(parts)
+    return CanonicalQuery(sql=sql, fingerprint=CanonicalQuery.hash(sql))
+
+
+def _sticks(tokens: list[str], kinds: list[int], i: int) -> bool:
+    """Whether the token at ``i`` follows the token before it without a space."""
+    token = tokens[i]
+    previous = tokens[i - 1]
+    if previous in _NO_SPACE_AFTER or token in _NO_SPACE_BEFORE:
+        return True
+    # a function call, as opposed to a keyword like ``IN (``
+    if token == "(":
+        if kinds[i - 1] == _KEYWORD:
+            return previous not in _SPACED_KEYWORDS
+        return kinds[i - 1] == _NAME and previous != ")"
+    # a sign before its operand, like ``-1``
+    return (
+        previous in _UNARY_SIGNS
+        and kinds[i - 1] == _OPERATOR
+        and (i < 2 or kinds[i - 2] in (_KEYWORD, _OPERATOR))
+    )
+
+
+def _fresh_alias(index: int, identifiers: set[str]) -> str:
+    """The canonical name of the ``index``-th alias, which isn't the name of anything
+    else in the query."""
+    alias = f"a{index}"
+    while alias in identifiers:
+        alias = "_" + alias
+    return alias
+
+
+def _names(tree: ParseTree) -> tuple[set[str], set[str], set[str]]:
+    """The lowercased names of a tree's identifiers, of the aliases that it defines,
+    and of the tables that it selects from. The names of CTEs are aliases, not
+    tables."""
+    identifiers: set[str] = set()
+    aliases: set[str] = set()
+    tables: set[str] = set()
+    ctes: set[str] = set()
+    for node in index_tree(tree).nodes:
+        # a rule's name is a token, which is slow to compare, so it's only compared
+        # once, by looking it up
+        rule = _NAME_RULES.get(node.data)
+        if rule is None:
+            continue
+        elif rule == _IDENTIFIER:
+            for child in node.children:
+                if isinstance(child, Token) and child.type == "IDENTIFIER":
+                    identifiers.add(child.value.lower())
+        elif rule == _TABLE:
+            for child in node.children:
+                if isinstance(child, Tree) and child.data == "table_name":
+                    name = _identifier(child)
+                    if name is not None:
+                        tables.add(name)
+        else:
+            name = _identifier(node)
+            if name is not None:
+                (aliases if rule == _ALIAS else ctes).add(name)
+    return identifiers, aliases, tables - ctes
+
+
+def _identifier(node: ParseTree) -> Optional[str]:
+    """The lowercased identifier of a name rule, quoted or not."""
+    for child in node.children:
+        if isinstance(child, Tree):
+            return _identifier(child)
+        if child.type == "IDENTIFIER":
+            return child.value.lower()
+    return None
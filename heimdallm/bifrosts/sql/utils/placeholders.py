@@ -0,0 +1,167 @@
+from typing import Any, Callable, Mapping, Optional, Union, cast
+
+from lark import ParseTree, Token
+
+from heimdallm.context import TraverseContext
+
+from .. import exc
+from ..common import ParameterizedQuery
+
+# the clauses whose literals are lifted into parameters. literals in the selected
+# columns, GROUP BY and ORDER BY are left alone, because an expression in one of them
+# must match the same expression in another, which two parameters wouldn't.
+_CONDITIONS = {"where_clause", "having_clause", "join_condition"}
+#: The types of the tokens of the literals that may be lifted into parameters.
+LITERAL_TYPES = frozenset({"NUMBER", "ESCAPED_STRING"})
+# literals after these tokens are part of a typed literal, like ``date '2023-01-01'``
+# or ``interval '1 day'``, or are escaped, and must stay literals
+_KEEP_AFTER = {"PREFIX_CAST", "INTERVAL", "ESCAPE_PREFIX"}
+
+
+def rewrite_placeholders(
+    query: str,
+    tree: ParseTree,
+    placeholder: Callable[[str], str],
+    *,
+    params: Optional[Mapping[str, Any]] = None,
+    ctx: Optional[TraverseContext] = None,
+) -> tuple[str, list[str]]:
+    """Rewrites the generic ``:name`` placeholders of a query into a driver's format,
+    in a single pass over the tree. The query is copied once, by joining the segments
+    between the placeholders with their replacements, instead of once per placeholder.
+
+    :param query: The query that the tree was parsed from.
+    :param tree: The parse tree of the query.
+    :param placeholder: Produces the driver's placeholder for a name.
+    :param params: The values of the placeholders, if they should be checked. Every
+        placeholder in the query must have one.
+    :param ctx: The context of the traversal, for exceptions.
+    :raises MissingPlaceholderValue: If ``params`` is given, and it's missing a value
+        for any of the placeholders.
+    :return: The rewritten query, and the name of each placeholder, in the order that
+        they appear in the query, with repeats.
+    """
+    # top-down is depth-first and left to right, which, because placeholders don't
+    # nest, is the order that they appear in the query
+    spans = [
+        (
+            node.meta.start_pos,
+            node.meta.end_pos,
+            cast(Token, node.children[0]).value,
+        )
+        for node in tree.iter_subtrees_topdown()
+        if node.data == "placeholder"
+    ]
+    if any(spans[i][0] < spans[i - 1][1] for i in range(1, len(spans))):
+        spans.sort()
+
+    segments = []
+    names = []
+    pos = 0
+    for start, end, name in spans:
+        segments.append(query[pos:start])
+        segments.append(placeholder(name))
+        names.append(name)
+        pos = end
+    segments.append(query[pos:])
+
+    if params is not None:
+        missing = [name for name in dict.fromkeys(names) if name not in params]
+        if missing:
+            if ctx is None:
+                ctx = TraverseContext()
+                ctx.trusted_llm_output = query
+            raise exc.MissingPlaceholderValue(names=missing, ctx=ctx)
+
+    return "".join(segments), names
+
+
+def parameterize_literals(
+    query: str,
+    tree: ParseTree,
+    placeholder: Callable[[str], str],
+) -> ParameterizedQuery:
+    """Lifts the integer and string literals in the conditions of a query out into
+    bind parameters, named ``literal_0``, ``literal_1``, and so on, in the order that
+    they appear. The query's own ``:name`` placeholders are rewritten into the driver's
+    format at the same time. Decimal numbers, and strings with backslashes, are left in
+    place, because their value as a parameter may not compare the same as the literal.
+
+    :param query: The query that the tree was parsed from.
+    :param tree: The parse tree of the query.
+    :param placeholder: Produces the driver's placeholder for a name.
+    :return: The parameterized query.
+    """
+    # the positions of the literals of a fixed tree, which was reconstructed into the
+    # query, are on its root. a tree that was parsed from the query has them on its
+    # tokens
+    positions: Optional[dict[int, tuple[int, int]]] = getattr(
+        tree.meta, "literal_positions", None
+    )
+    spans: list[tuple[int, int, str, Any]] = []
+    taken = set()
+    stack = [(tree, False)]
+    while stack:
+        node, in_condition = stack.pop()
+        if node.data == "placeholder":
+            name = cast(Token, node.children[0]).value
+            taken.add(name)
+            spans.append((node.meta.start_pos, node.meta.end_pos, name, None))
+            continue
+
+        if node.data in _CONDITIONS:
+            in_condition = True
+        elif node.data == "full_query":
+            in_condition = False
+
+        previous: Optional[Token] = None
+        for child in node.children:
+            if not isinstance(child, Token):
+                previous = None
+                continue
+            if in_condition and (previous is None or previous.type not in _KEEP_AFTER):
+                value = _literal(child)
+                if positions is not None:
+                    span = positions.get(id(child))
+                elif child.start_pos is not None and child.end_pos is not None:
+                    span = (child.start_pos, child.end_pos)
+                else:
+                    span = None
+                if value is not None and span is not None:
+                    spans.append((span[0], span[1], "", value))
+            previous = child
+
+        for child in reversed(node.children):
+            if not isinstance(child, Token):
+                stack.append((child, in_condition))
+
+    spans.sort(key=lambda span: span[0])
+
+    segments = []
+    params = {}
+    pos = 0
+    counter = 0
+    for start, end, name, value in spans:
+        if not name:
+            name = f"literal_{counter}"
+            while name in taken:
+                counter += 1
+                name = f"literal_{counter}"
+            counter += 1
+            params[name] = value
+        segments.append(query[pos:start])
+        segments.append(placeholder(name))
+        pos = end
+    segments.append(query[pos:])
+
+    return ParameterizedQuery("".join(segments), params)
+
+
+def _literal(token: Token) -> Union[int, str, None]:
+    """The value of a literal token, or None if it isn't one that we lift."""
+    if token.type == "NUMBER" and token.value.isdigit():
+        return int(token.value)
+    if token.type == "ESCAPED_STRING" and "\\" not in token.value:
+        quote = token.value[0]
+        return token.value[1:-1].replace(quote * 2, quote)
+    return None
@@ -1,10 +1,9 @@
 from abc import abstractmethod
-from itertools import chain
-from typing import Optional, Sequence, cast
+from copy import copy
+from typing import Any, Iterable, Optional, Sequence, cast
 
-from lark import Lark, ParseTree, Token
+from lark import Lark, ParseTree
 from lark.exceptions import VisitError
-from lark.reconstruct import Reconstructor
 
 from heimdallm.bifrost import Bifrost
 from heimdallm.bifrosts.sql import exc
@@ -12,9 +11,10 @@ from heimdallm.bifrosts.sql.bifrost import Bifrost as _SQLBifrost
 from heimdallm.constraints import ConstraintValidator as _BaseConstraintValidator
 from heimdallm.context import TraverseContext
 
-from .common import ANY_JOIN, FqColumn, JoinCondition, ParameterizedConstraint
-from .visitors.aliases import AliasCollector
-from .visitors.facets import FacetCollector, Facets
+from .common import FqColumn, JoinCondition, ParameterizedConstraint
+from .policy import ValidatorPolicy
+from .visitors.analysis import Fix, analyze
+from .visitors.index import TreeIndex
 
 
 class ConstraintValidator(_BaseConstraintValidator):
@@ -22,6 +22,12 @@ class ConstraintValidator(_BaseConstraintValidator):
     This validator checks different of a SQL query. You are intended to derive this
     class and implement its methods."""
 
+    # the compiled policy is kept on the validator, so that it lives exactly as long
+    # as the validator does. it's a slot, not an instance attribute, so that it isn't
+    # part of the validator's attribute fingerprint
+    __slots__ = ("_policy",)
+    _policy: ValidatorPolicy
+
     @abstractmethod
     def requester_identities(self) -> Sequence[ParameterizedConstraint]:
         """Returns the possible identities of the requester, as represented in the
@@ -145,6 +151,84 @@ class ConstraintValidator(_BaseConstraintValidator):
         # let's default to "if you can see it, you can use it"
         return self.select_column_allowed(fq_column)
 
+    def select_column_allowlist(self) -> Optional[Iterable[FqColumn]]:
+        """Returns every column that is allowed to be selected, if there is a fixed set
+        of them. If you return one, it is checked with a hashed lookup in place of
+        :meth:`select_column_allowed`, so the two must agree. By default, there is no
+        allowlist, and every column is checked with :meth:`select_column_allowed`.
+
+        If :meth:`condition_column_allowed` isn't overridden, this is also used as the
+        condition column allowlist.
+
+        :return: The allowed columns, or None.
+        """
+        return None
+
+    def condition_column_allowlist(self) -> Optional[Iterable[FqColumn]]:
+        """Returns every column that is allowed to be used in a condition, if there is
+        a fixed set of them. Like :meth:`select_column_allowlist`, it takes the place
+        of :meth:`condition_column_allowed`, and the two must agree.
+
+        :return: The allowed columns, or None.
+        """
+        return None
+
+    def function_allowlist(self) -> Optional[Iterable[str]]:
+        """Returns the *lowercase* name of every function that is allowed to be used,
+        if there is a fixed set of them. Like :meth:`select_column_allowlist`, it
+        takes the place of :meth:`can_use_function`, and the two must agree.
+
+        :return: The allowed functions, or None.
+        """
+        return None
+
+    def compile(self) -> ValidatorPolicy:
+        """Compiles the validator's configuration into an immutable
+        :class:`ValidatorPolicy <heimdallm.bifrosts.sql.policy.ValidatorPolicy>`, with
+        the joins, identities and allowlists held in hashed sets. The policy is built
+        the first time that it's asked for, and reused for every traversal after that,
+        so, like the validator's :meth:`fingerprint
+        <heimdallm.constraints.ConstraintValidator.fingerprint>` in a Bifrost's
+        validation cache, the validator's configuration shouldn't change once it's in
+        use.
+
+        :return: The policy.
+        """
+        try:
+            return self._policy
+        except AttributeError:
+            self._policy = ValidatorPolicy.from_validator(self)
+            return self._policy
+
+    def attribute_fingerprint(self, *state: Any) -> str:
+        """A fingerprint for :meth:`fingerprint
+        <heimdallm.constraints.ConstraintValidator.fingerprint>` to return, to opt the
+        validator in to a Bifrost's validation cache. It covers the requester
+        identities, the parameterized constraints, the allowed joins, the max limit,
+        and, through the validator's class and instance attributes, the column and
+        function allowlists.
+
+        If :meth:`select_column_allowed`, :meth:`condition_column_allowed` or
+        :meth:`can_use_function` depend on anything other than the validator's class and
+        instance attributes, pass it as ``state``.
+
+        :param state: Anything else that the validator's decisions depend on.
+        :return: The fingerprint.
+        """
+
+        def fmt_join(join: JoinCondition) -> str:
+            # join conditions are unordered, so their fingerprints should be too
+            sides = "=".join(sorted((join.first.name, join.second.name)))
+            return f"{sides}#{join.identity_placeholder}"
+
+        return super().attribute_fingerprint(
+            sorted(str(ident) for ident in self.requester_identities()),
+            sorted(str(c) for c in self.parameterized_constraints()),
+            sorted(fmt_join(join) for join in self.allowed_joins()),
+            self.max_limit(),
+            *state,
+        )
+
     def fix(
         self,
         *,
@@ -158,32 +242,80 @@ class ConstraintValidator(_BaseConstraintValidator):
         decisions about those constraints, and fix the parse tree though, for
         example, by adding a limit to a query.
 
+        :meta private:
+        """
+        output, _ = self.fix_tree(bifrost=bifrost, grammar=grammar, ctx=ctx, tree=tree)
+        return output
+
+    def fix_tree(
+        self,
+        *,
+        bifrost: Bifrost,
+        grammar: Lark,
+        ctx: TraverseContext,
+        tree: ParseTree,
+    ) -> tuple[str, ParseTree]:
+        """Fixes the parse tree, and reconstructs the query from it. The fixed tree is
+        returned alongside the query, ready to be validated, so the query never needs
+        to be parsed a second time.
+
+        The fix only depends on the validator's :meth:`max_limit` and whether each
+        selected column is allowed, so if another validator has already fixed the
+        same tree, and this validator agrees with all of its answers, we reuse its fix,
+        fixed tree and all.
+
         :meta private:
         """
 
         # gets around a circular import issue
         from heimdallm.bifrosts.sql import reconstruct
 
+        reserved_keywords = cast(_SQLBifrost, bifrost).reserved_keywords()
+        analysis = analyze(tree, ctx=ctx, reserved_keywords=reserved_keywords)
+
+        policy = self.compile()
+        max_limit = policy.max_limit
+        for fix in analysis.fixes:
+            if fix.max_limit == max_limit and all(
+                policy.select_column_allowed(column) == allowed
+                for column, allowed in fix.decisions
+            ):
+                if isinstance(fix.result, exc.BaseException):
+                    raise fix.result
+                return fix.result
+
         transform = reconstruct.ReconstructTransformer(
-            validator=self,
-            reserved_keywords=cast(_SQLBifrost, bifrost).reserved_keywords(),
+            policy=policy,
+            analysis=analysis,
+            reserved_keywords=reserved_keywords,
             ctx=ctx,
         )
         try:
             fixed_tree = transform.transform(tree)
         except VisitError as e:
             if isinstance(e.orig_exc, exc.BaseException):
+                decisions = tuple(transform.decisions)
+                analysis.fixes.append(Fix(max_limit, decisions, e.orig_exc))
                 raise e.orig_exc
             raise e
 
-        def special(sym):
-            return Token("IGNORE", sym.name)
+        # the transformer shares the nodes' metadata with the original tree, which
+        # another validator may still need, so the fixed tree gets its own copy before
+        # we index it and point its positions at the fixed query
+        for node in fixed_tree.iter_subtrees():
+            node._meta = copy(node.meta)
+        TreeIndex(fixed_tree)
 
-        output = Reconstructor(grammar, {"_WS": special}).reconstruct(
-            fixed_tree,
-            postproc=reconstruct.postproc,
-        )
-        return output
+        # the copied metadata includes the original tree's analysis, which is only
+        # still true of the fixed tree if nothing was fixed. an unchanged tree is
+        # indexed exactly like the original, so the analysis' ids still line up
+        if transform.changed:
+            del cast(Any, fixed_tree.meta).analysis
+
+        output = reconstruct.reconstruct(grammar, fixed_tree)
+        result = (output, fixed_tree)
+        analysis.fixes.append(Fix(max_limit, tuple(transform.decisions), result))
+        return result
 
     def validate(
         self,
@@ -200,123 +332,9 @@ class ConstraintValidator(_BaseConstraintValidator):
 
         :meta private:
         """
-        alias_collector = AliasCollector(
+        facets = analyze(
+            tree,
             ctx=ctx,
             reserved_keywords=cast(_SQLBifrost, bifrost).reserved_keywords(),
-        )
-        alias_collector.visit(tree)
-
-        facets = Facets()
-        facet_collector = FacetCollector(
-            facets=facets,
-            collector=alias_collector,
-            reserved_keywords=cast(_SQLBifrost, bifrost).reserved_keywords(),
-            ctx=ctx,
-        )
-        facet_collector.visit(tree)
-
-        # check the select column allowlist
-        for fq_column in facets.selected_columns:
-            if not self.select_column_allowed(fq_column):
-                raise exc.IllegalSelectedColumn(
-                    column=fq_column.name,
-                    ctx=ctx,
-                )
-
-        for scope in facets.scopes.values():
-            # check the join condition allowlist
-            any_join_cond_allowed = ANY_JOIN in self.allowed_joins()
-            for table, join_specs in scope.joined_tables.items():
-                for join_spec in join_specs:
-                    allowed = any_join_cond_allowed or join_spec in self.allowed_joins()
-                    if not allowed:
-                        raise exc.IllegalJoinTable(join=join_spec, ctx=ctx)
-
-            # ensure that the selected table is joined to another table, if joins exist
-            if (
-                scope.joined_tables
-                and not scope.joined_tables[cast(str, scope.selected_table)]
-            ):
-                raise exc.DisconnectedTable(
-                    table=cast(str, scope.selected_table),
-                    ctx=ctx,
-                )
-
-            # ensure that all joins were joined on columns that exist on the joined
-            # tables
-            if scope.bad_joins:
-                raise exc.BogusJoinedTable(
-                    table=scope.bad_joins[0],
-                    ctx=ctx,
-                )
-
-        # all columns specified in the join conditions are automatically included in the
-        # condition column allowlist
-        allowed_join_conditions = set()
-        for join_spec in self.allowed_joins():
-            if join_spec == ANY_JOIN:
-                continue
-            allowed_join_conditions.add(join_spec.first)
-            allowed_join_conditions.add(join_spec.second)
-
-        # check the condition column allowlist
-        for fq_column in facets.condition_columns:
-            if fq_column in allowed_join_conditions:
-                continue
-
-            if not self.condition_column_allowed(fq_column):
-                raise exc.IllegalConditionColumn(
-                    column=fq_column,
-                    ctx=ctx,
-                )
-
-        # get all of the constraints that the query MUST be constrained by in
-        # the WHERE clause
-        for constraint in self.parameterized_constraints():
-            if constraint not in facets.parameterized_constraints:
-                raise exc.MissingParameterizedConstraint(
-                    column=constraint.fq_column,
-                    placeholder=constraint.placeholder,
-                    ctx=ctx,
-                )
-
-        # verify that the query is constrained by at least one of the
-        # requester's identities. this means that the results of the query will
-        # be restricted to data that only the requester has access to.
-        #
-        # we look at both the identities returned explicitly from the
-        # `requester_identities` method, and also the identities that have been
-        # annotated in the join conditions.
-        req_ids = self.requester_identities()
-        join_identities = chain.from_iterable(
-            j.requester_identities for j in self.allowed_joins()
-        )
-        all_req_identities = set(chain(req_ids, join_identities))
-        if all_req_identities:
-            found_id = False
-            for one_id in all_req_identities:
-                if one_id in facets.parameterized_constraints:
-                    found_id = True
-                    break
-            if not found_id:
-                raise exc.MissingRequiredIdentity(
-                    identities=all_req_identities,
-                    ctx=ctx,
-                )
-
-        # check that the query limits the rows correctly, if we restrict to a limit
-        if (max_limit := self.max_limit()) is not None:
-            for limit in facets.limits.values():
-                if limit is None or limit > max_limit:
-                    raise exc.TooManyRows(
-                        limit=limit,
-                        ctx=ctx,
-                    )
-
-        # check that every function used has been allowlisted
-        for fn in facets.functions:
-            if not self.can_use_function(fn):
-                raise exc.IllegalFunction(
-                    function=fn,
-                    ctx=ctx,
-                )
+        ).facets
+        self.compile().check(facets, ctx=ctx)
@@ -1,16 +1,15 @@
 from functools import partialmethod
-from typing import Any, cast
-from uuid import UUID
+from typing import TYPE_CHECKING, Any, cast
 
-from lark import Tree, Visitor
-
-from heimdallm.bifrosts.sql.utils.context import get_containing_query
-from heimdallm.context import TraverseContext
+from lark import Tree
 
 from ..common import FqColumn
 from ..exc import AliasConflict
 from ..utils.identifier import get_identifier, is_count_function, is_subquery
 
+if TYPE_CHECKING:
+    from .analysis import QueryAnalysis
+
 
 class _QueryAliases:
     """These are aliases for tables and columns contained in a query. Each top-level
@@ -43,31 +42,37 @@ class _QueryAliases:
         # to resolve them in the .resolve() method.
         self.columns: dict[str, set[FqColumn] | None] = {}
         # these represent subqueries that are aliased in the FROM and JOIN clauses. the
-        # key is the alias for the subquery, and the value is the uuid associated with
+        # key is the alias for the subquery, and the value is the id associated with
         # the subquery node.
-        self.subqueries: dict[str, UUID] = {}
+        self.subqueries: dict[str, int] = {}
         # this is used to help resolve unqualified column names to their fully qualified
         # name, if possible.
         self.selected_table: str | None = None
 
 
-class AliasCollector(Visitor):
+class AliasCollector:
     """Collects all of our table and column aliases, which can then be mapped back to
-    the authoritative names. We have to do this pass first, before any other passes,
+    the authoritative names. We have to do this before collecting anything else,
     because the tree may not evaluate in the order that would allow us to resolve
     aliases."""
 
-    def __init__(self, ctx: TraverseContext, reserved_keywords: set[str]):
-        self._query_aliases: dict[UUID, _QueryAliases] = {}
-        self._reserved_keywords = reserved_keywords
+    # the nodes that we collect aliases from
+    _HANDLERS = ("full_query", "selected_table", "joined_table", "aliased_column")
+
+    def __init__(self, analysis: "QueryAnalysis"):
+        self._analysis = analysis
+        self._query_aliases: dict[int, _QueryAliases] = {}
+        self._reserved_keywords = analysis.reserved_keywords
         self._table_aliases: dict[str, str] = {}
         self.derived_table_aliases: set[str] = set()
-        self._ctx = ctx
+        self._ctx = analysis.ctx
 
-    def visit(self, tree: Tree) -> Tree:
-        new_tree = super().visit(tree)
+    def collect(self) -> None:
+        """Collects the aliases from the analyzed nodes, and resolves them."""
+        for node in self._analysis.nodes:
+            if node.data in self._HANDLERS:
+                getattr(self, node.data)(node)
         self._resolve_aliases()
-        return new_tree
 
     def _resolve_aliases(self) -> None:
         """Processes all aliases, resolves tables to their authoritative names, and
@@ -126,8 +131,8 @@ class AliasCollector(Visitor):
     def alias_scope(self, node: Tree) -> _QueryAliases:
         """Finds the wrapping query for a given node, and returns the aliases for it.
         This is the scope of aliases that are available to the current node."""
-        query = cast(Any, get_containing_query(node))
-        scope = self._query_aliases.setdefault(query.meta.id, _QueryAliases())
+        query = self._analysis.containing_query(node)
+        scope = self._query_aliases.setdefault(query, _QueryAliases())
         return scope
 
     def join_or_selected_table(self, select: bool, node: Tree):
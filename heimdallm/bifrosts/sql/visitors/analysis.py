@@ -0,0 +1,200 @@
+from array import array
+from collections import defaultdict as dd
+from typing import Any, NamedTuple, Optional, Union, cast
+
+from lark import ParseTree, Token, Tree
+
+from heimdallm.context import TraverseContext
+
+from .. import exc
+from ..common import FqColumn
+from .aliases import AliasCollector
+from .facets import FacetCollector, Facets
+from .index import index_tree
+
+# the nodes whose columns are condition columns
+_CONDITIONS = ("where_condition", "having_condition", "order_column")
+# the nodes that a join is made of
+_JOIN_PARTS = ("illegal_join", "parameterized_comparison", "connecting_join_condition")
+
+
+class Fix(NamedTuple):
+    """An autofix of an analyzed tree, along with everything about the validator that
+    it depended on. Any validator that would make the same decisions gets the same
+    fix."""
+
+    # the validator's max limit
+    max_limit: Optional[int]
+    # the columns that the validator was asked about, and whether they were allowed
+    decisions: tuple[tuple[FqColumn, bool], ...]
+    # the reconstructed query and the fixed tree, or the exception that the fix raised
+    result: Union[tuple[str, ParseTree], exc.BaseException]
+
+
+class QueryAnalysis:
+    """Everything that the constraint validators and the autofixer need to know about a
+    query's parse tree, collected in a single walk over the tree.
+
+    The walk goes over the nodes of the tree's :class:`TreeIndex
+    <heimdallm.bifrosts.sql.visitors.index.TreeIndex>`, and files the nodes that the
+    facets are made of under the condition, join, or WHERE clause that they belong to.
+    The aliases are collected from the nodes straight away, in the order that a
+    :class:`lark.Visitor` would visit them. The facets are collected the first
+    time that they are needed, because a query that can be autofixed may not have valid
+    facets until it has been fixed.
+
+    Use :func:`analyze` instead of creating this directly, so that the analysis of a
+    tree is shared by everything that needs it.
+    """
+
+    def __init__(
+        self,
+        tree: ParseTree,
+        *,
+        ctx: TraverseContext,
+        reserved_keywords: set[str],
+    ) -> None:
+        self.ctx = ctx
+        self.reserved_keywords = reserved_keywords
+
+        self.index = index_tree(tree)
+        # every node in the tree, bottom up
+        self.nodes: list[Tree] = self.index.nodes[::-1]
+        # the fq_column and column_alias nodes of each condition, by condition id
+        self.condition_columns: dd[int, list[Tree]] = dd(list)
+        # the join types and join conditions of each join, by join id
+        self.join_parts: dd[int, list[Tree]] = dd(list)
+        # the required parameterized comparisons of each WHERE clause, by clause id
+        self.where_constraints: dd[int, list[Tree]] = dd(list)
+        self._walk()
+
+        self.aliases = AliasCollector(self)
+        self.aliases.collect()
+        self._facets: Optional[Facets] = None
+        self._facets_error: Optional[exc.BaseException] = None
+        # the autofixes that have been made of the tree, one for each distinct set of
+        # validator decisions
+        self.fixes: list[Fix] = []
+
+    @property
+    def facets(self) -> Facets:
+        """The facets of the query. Raises if the query has facets that no constraint
+        validator could allow, every time that they're asked for."""
+        if self._facets_error is not None:
+            raise self._facets_error
+
+        if self._facets is None:
+            facets = Facets()
+            try:
+                FacetCollector(self, facets).collect()
+            except exc.BaseException as e:
+                self._facets_error = e
+                raise e
+            self._facets = facets
+        return self._facets
+
+    def containing_query(self, node: Tree) -> int:
+        """The id of the query that contains a node."""
+        return self.index.containing_query(node)
+
+    def in_subquery(self, node: Tree) -> bool:
+        """Whether a node is inside a subquery or a CTE."""
+        return self.index.in_subquery(node)
+
+    def _walk(self) -> None:
+        """Top down, so that each node can find its nearest condition, join and WHERE
+        clause from its parent, instead of searching its ancestors. Each of these arrays
+        holds what a node's children inherit from it."""
+        index = self.index
+        size = len(index)
+        conditions = array("i", [-1]) * size
+        joins = array("i", [-1]) * size
+        where_clauses = array("i", [-1]) * size
+        # whether every WHERE condition between the node's children and their WHERE
+        # clause is joined by AND. a parameterized comparison is only a required
+        # constraint if this is true of its parent
+        required = bytearray(size)
+
+        for id, node in enumerate(index.nodes):
+            data = node.data
+            parent = index.parents[id]
+            condition = join = where_clause = -1
+            is_required = False
+            if parent >= 0:
+                condition = conditions[parent]
+                join = joins[parent]
+                where_clause = where_clauses[parent]
+                is_required = bool(required[parent])
+
+            if data == "fq_column" or data == "column_alias":
+                if condition >= 0:
+                    self.condition_columns[condition].append(node)
+
+            elif data in _JOIN_PARTS:
+                if join >= 0:
+                    self.join_parts[join].append(node)
+
+                if (
+                    data == "parameterized_comparison"
+                    and is_required
+                    and where_clause >= 0
+                    and not index.in_subqueries[id]
+                ):
+                    self.where_constraints[where_clause].append(node)
+
+            conditions[id] = id if data in _CONDITIONS else condition
+            joins[id] = id if data == "join" else join
+            where_clauses[id] = id if data == "where_clause" else where_clause
+            if data == "where_clause":
+                required[id] = True
+            else:
+                required[id] = is_required and not _joined_by_or(node)
+
+        # each node's lists were filled top down, but the collectors expect them in the
+        # same bottom-up order as the nodes
+        for lists in (self.condition_columns, self.join_parts, self.where_constraints):
+            for nodes in lists.values():
+                nodes.reverse()
+
+
+def _joined_by_or(node: Tree) -> bool:
+    """Whether a node has an OR between its WHERE conditions."""
+    for child in node.children:
+        if isinstance(child, Token):
+            if child.type == "WHERE_TYPE" and child.value.lower() == "or":
+                return True
+    return False
+
+
+def analyze(
+    tree: ParseTree,
+    *,
+    ctx: TraverseContext,
+    reserved_keywords: set[str],
+) -> QueryAnalysis:
+    """Analyzes a parse tree, or returns the analysis that has already been made of it.
+    If the analysis failed, it raises the same exception again, so that a query is only
+    ever analyzed once, no matter how many constraint validators look at it.
+
+    :param tree: The parse tree.
+    :param ctx: The context of the traversal, for exceptions.
+    :param reserved_keywords: The reserved keywords of the SQL dialect.
+    :return: The analysis.
+    """
+    meta = cast(Any, tree.meta)
+    analysis = getattr(meta, "analysis", None)
+    if isinstance(analysis, exc.BaseException):
+        raise analysis
+
+    if analysis is None:
+        try:
+            analysis = QueryAnalysis(
+                tree,
+                ctx=ctx,
+                reserved_keywords=reserved_keywords,
+            )
+        except exc.BaseException as e:
+            meta.analysis = e
+            raise e
+        meta.analysis = analysis
+    return analysis
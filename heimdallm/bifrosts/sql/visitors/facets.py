@@ -1,20 +1,16 @@
 from collections import defaultdict as dd
-from typing import Any, MutableMapping, Optional, cast
-from uuid import UUID
+from typing import TYPE_CHECKING, Any, MutableMapping, Optional, cast
 
-from lark import Token, Tree, Visitor
+from lark import Token, Tree
 
-from heimdallm.bifrosts.sql.utils.context import (
-    get_containing_query,
-    has_subquery,
-    in_subquery,
-)
-from heimdallm.context import TraverseContext
+from heimdallm.bifrosts.sql.utils.context import has_subquery
 
 from .. import exc
 from ..common import FqColumn, JoinCondition, ParameterizedConstraint
 from ..utils.identifier import get_identifier, is_count_function
-from .aliases import AliasCollector
+
+if TYPE_CHECKING:
+    from .analysis import QueryAnalysis
 
 
 class _QueryScope:
@@ -35,7 +31,7 @@ class Facets:
     that we can easily validate them with a constraint validator"""
 
     def __init__(self) -> None:
-        self.scopes: dict[UUID, _QueryScope] = {}
+        self.scopes: dict[int, _QueryScope] = {}
         # the columns selected in the query
         self.selected_columns: set[FqColumn] = set()
         # the columns used in the WHERE, JOIN, HAVING, and ORDER BY clauses
@@ -46,25 +42,38 @@ class Facets:
         # all of the functions used in the query
         self.functions: set[str] = set()
         # the row limit of the query and all subqueries
-        self.limits: dict[UUID, int | None] = {}
+        self.limits: dict[int, int | None] = {}
 
 
-class FacetCollector(Visitor):
+class FacetCollector:
     """Collects all of the facets of the query that we care about. This will
     feed directly into the constraint validator."""
 
-    def __init__(
-        self,
-        *,
-        facets: Facets,
-        collector: AliasCollector,
-        reserved_keywords: set[str],
-        ctx: TraverseContext,
-    ) -> None:
-        self._collector = collector
+    # the nodes that we collect facets from
+    _HANDLERS = (
+        "join",
+        "selected_table",
+        "selected_column",
+        "where_clause",
+        "where_condition",
+        "having_condition",
+        "order_column",
+        "limit_placeholder",
+        "function",
+    )
+
+    def __init__(self, analysis: "QueryAnalysis", facets: Facets) -> None:
+        self._analysis = analysis
+        self._collector = analysis.aliases
         self._facets = facets
-        self._reserved_keywords = reserved_keywords
-        self._ctx = ctx
+        self._reserved_keywords = analysis.reserved_keywords
+        self._ctx = analysis.ctx
+
+    def collect(self) -> None:
+        """Collects the facets from the analyzed nodes."""
+        for node in self._analysis.nodes:
+            if node.data in self._HANDLERS:
+                getattr(self, node.data)(node)
 
     def _resolve_column(self, node: Tree) -> set[FqColumn] | None:
         """Resolves a column alias to the underlying fully-qualified columns."""
@@ -110,16 +119,18 @@ class FacetCollector(Visitor):
     def query_scope(self, node: Tree) -> _QueryScope:
         """Finds the wrapping query for a given node, and returns the aliases for it.
         This is the scope of aliases that are available to the current node."""
-        query = cast(Any, get_containing_query(node))
-        scope = self._facets.scopes.setdefault(query.meta.id, _QueryScope())
+        query = self._analysis.containing_query(node)
+        scope = self._facets.scopes.setdefault(query, _QueryScope())
         return scope
 
     def join(self, node: Tree):
         scope = self.query_scope(node)
+        parts = self._analysis.join_parts[cast(Any, node.meta).id]
 
-        if join_type_nodes := list(node.find_data("illegal_join")):
-            join_type = cast(Token, join_type_nodes[0].children[0]).type
-            raise exc.IllegalJoinType(join_type=join_type, ctx=self._ctx)
+        for part in parts:
+            if part.data == "illegal_join":
+                join_type = cast(Token, part.children[0]).type
+                raise exc.IllegalJoinType(join_type=join_type, ctx=self._ctx)
 
         joined_table = node.children[1].children[0]
         joined_table_name = self._resolve_table(joined_table)
@@ -133,10 +144,14 @@ class FacetCollector(Visitor):
         # if a parameterized_comparison node exists, it means it is actually required
         # (enforced by the grammar, see grammar comments). a parameterized comparison
         # has a placeholder for the RHS
-        for parameterized_comparison in node.find_data("parameterized_comparison"):
-            self._add_parameterized_comparison(parameterized_comparison)
+        for part in parts:
+            if part.data == "parameterized_comparison":
+                self._add_parameterized_comparison(part)
+
+        for condition in parts:
+            if condition.data != "connecting_join_condition":
+                continue
 
-        for condition in node.find_data("connecting_join_condition"):
             # from_table may be an alias, but from_column will always be authoritative.
             # the LHS of the join condition is always a fully-qualified column
             from_fq_column_node = condition.children[0]
@@ -155,7 +170,7 @@ class FacetCollector(Visitor):
 
             # conditions in a join are compared against are allowed conditions, so
             # record the LHS
-            self._collect_condition_column(from_fq_column_node)
+            self._collect_fq_column(from_fq_column_node)
 
             # to_table may be an alias, but to_column will always be authoritative.
             # the RHS of the join condition can be a `value` rule.
@@ -192,7 +207,7 @@ class FacetCollector(Visitor):
 
             # conditions in a join are compared against are allowed conditions, so
             # record the RHS
-            self._collect_condition_column(to_fq_column_node)
+            self._collect_fq_column(to_fq_column_node)
 
             # our join represents two sides, the from table and the to table.
             # we'll record both in our joined_tables set.
@@ -315,7 +330,7 @@ class FacetCollector(Visitor):
 
         # if we're in a subquery, don't count it as a parameterized comparison, because
         # a parameterized comparison must exist in the outermost query
-        if in_subquery(node):
+        if self._analysis.in_subquery(node):
             return
 
         # handle both a forwards (column = :placeholder) and backwards (:placeholder =
@@ -380,66 +395,57 @@ class FacetCollector(Visitor):
             )
 
     def where_clause(self, where_node: Tree):
-        """here we'll do a breadth-first search on the where clause, going level
-        by level. if any level contains an "OR", that means the entire level is
-        tainted and can't be used for a required constraint, because the
-        required constraint may be optional.
-
-        if a level is tainted, then all of its children (WHERE subclauses) are
-        tainted as well, so we will not process them.
-
-        the end result is that we only collect a parameterized comparison node IFF it
-        is not joined by an OR anywhere in the WHERE clause, either at its
-        level, or at any level above it. only then can we know that the
-        comparison is actually constraining to the query"""
-        conditions = where_node.children[1]
-        stack: list[Tree] = [conditions]
-
-        while stack:
-            conditions = stack.pop()
-
-            level_stack: list[Tree] = []
-            for child in conditions.children:
-                if isinstance(child, Token):
-                    # is the level tainted? if so, clear the stack and exit the loop
-                    if child.type == "WHERE_TYPE" and child.value.lower() == "or":
-                        level_stack = []
-                        break
-                elif isinstance(child, Tree):
-                    level_stack.append(child)
-
-            for child in reversed(level_stack):
-                stack.append(child)
-                if child.data == "parameterized_comparison":
-                    self._add_parameterized_comparison(child)
+        """we only collect a parameterized comparison node IFF it is not joined by an
+        OR anywhere in the WHERE clause, either at its level, or at any level above it.
+        only then can we know that the comparison is actually constraining to the
+        query, because otherwise the constraint may be optional.
+
+        the analysis has already found those comparisons, by tainting every level of the
+        WHERE clause that contains an "OR", along with all of its children (WHERE
+        subclauses)."""
+        for child in self._analysis.where_constraints[cast(Any, where_node.meta).id]:
+            self._add_parameterized_comparison(child)
+
+    def _collect_fq_column(self, fq_column_node: Tree):
+        """records a fully-qualified column as a condition column"""
+        table_node, column_node = fq_column_node.children
+        table_name = self._resolve_table(table_node)
+        if table_name is None:
+            raise exc.UnsupportedQuery(
+                msg="WHERE condition on derived table",
+                ctx=self._ctx,
+            )
+
+        column_name = get_identifier(
+            self._ctx,
+            column_node,
+            self._reserved_keywords,
+        )
+        self._facets.condition_columns.add(
+            FqColumn(
+                table=table_name,
+                column=column_name,
+            )
+        )
 
     def _collect_condition_column(self, node: Tree):
         """here we'll parse out the columns that are referenced anywhere in the
         WHERE, regardless of the depth of the expression. we care if a column is being
         referenced at all, even optionally, because that will be checked against the
-        allowlist"""
-        for fq_column_node in node.find_data("fq_column"):
-            table_node, column_node = fq_column_node.children
-            table_name = self._resolve_table(table_node)
-            if table_name is None:
-                raise exc.UnsupportedQuery(
-                    msg="WHERE condition on derived table",
-                    ctx=self._ctx,
-                )
+        allowlist.
 
-            column_name = get_identifier(
-                self._ctx,
-                column_node,
-                self._reserved_keywords,
-            )
-            self._facets.condition_columns.add(
-                FqColumn(
-                    table=table_name,
-                    column=column_name,
-                )
-            )
+        the columns of a nested condition belong to that condition, so each column is
+        only collected once, by its nearest condition."""
+        columns = self._analysis.condition_columns[cast(Any, node.meta).id]
+
+        for fq_column_node in columns:
+            if fq_column_node.data == "fq_column":
+                self._collect_fq_column(fq_column_node)
+
+        for column_alias_node in columns:
+            if column_alias_node.data != "column_alias":
+                continue
 
-        for column_alias_node in node.find_data("column_alias"):
             maybe_fq_columns = self._resolve_column(column_alias_node)
 
             # a None means this is a non-column expression alias. this is valid as it
@@ -472,7 +478,7 @@ class FacetCollector(Visitor):
     def limit_placeholder(self, node: Tree):
         # a subquery does not require a limit because the only limit we care about is
         # the outermost query which yields the actual result set.
-        if in_subquery(node):
+        if self._analysis.in_subquery(node):
             return
 
         if limit_nodes := list(node.find_data("limit")):
@@ -0,0 +1,75 @@
+from array import array
+from typing import Any, Optional, cast
+
+from lark import ParseTree, Tree
+
+
+class TreeIndex:
+    """A compact index of a parse tree. Every node gets a small integer id, which is
+    stored on the node's metadata, and is its position in :attr:`nodes`. Everything that
+    we'd otherwise find by searching a node's ancestors is kept in flat arrays, indexed
+    by id, so that it can be looked up in constant time.
+
+    The ids are assigned breadth first, with each node's children reversed, so a node's
+    parent always has a lower id than the node itself, and :attr:`nodes`, reversed, is
+    in the order of :meth:`lark.Tree.iter_subtrees`.
+    """
+
+    def __init__(self, tree: ParseTree) -> None:
+        # every node in the tree, by id
+        self.nodes: list[Tree] = [tree]
+        # the id of each node's parent, or -1 for the root
+        self.parents = array("i", [-1])
+        # the id of the query that contains each node, or -1 for the outermost query
+        self.queries = array("i", [-1])
+        # whether each node is inside a subquery or a CTE
+        self.in_subqueries = bytearray(1)
+
+        nodes = self.nodes
+        parents = self.parents
+        queries = self.queries
+        in_subqueries = self.in_subqueries
+
+        # the list grows as we go
+        for id, node in enumerate(nodes):
+            cast(Any, node.meta).id = id
+            data = node.data
+            query = id if data == "full_query" else queries[id]
+            in_subquery = in_subqueries[id] or data in ("subquery", "with_cte")
+
+            for child in reversed(node.children):
+                if isinstance(child, Tree):
+                    nodes.append(child)
+                    parents.append(id)
+                    queries.append(query)
+                    in_subqueries.append(in_subquery)
+
+        cast(Any, tree.meta).index = self
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def parent(self, node: Tree) -> Optional[Tree]:
+        """The parent of a node, or None for the root."""
+        parent = self.parents[cast(Any, node.meta).id]
+        return None if parent < 0 else self.nodes[parent]
+
+    def containing_query(self, node: Tree) -> int:
+        """The id of the query that contains a node, or -1 for the outermost query."""
+        return self.queries[cast(Any, node.meta).id]
+
+    def in_subquery(self, node: Tree) -> bool:
+        """Whether a node is inside a subquery or a CTE."""
+        return bool(self.in_subqueries[cast(Any, node.meta).id])
+
+
+def index_tree(tree: ParseTree) -> TreeIndex:
+    """Indexes a parse tree, or returns its existing index.
+
+    :param tree: The parse tree.
+    :return: The index.
+    """
+    index = getattr(tree.meta, "index", None)
+    if index is None:
+        index = TreeIndex(tree)
+    return index
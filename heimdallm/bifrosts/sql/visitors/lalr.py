@@ -0,0 +1,230 @@
+import re
+from copy import copy
+from typing import Union
+
+from lark import Lark, ParseTree, Token, Transformer, Tree, v_args
+
+# the FUNCTION_NAME terminal from the earley grammars
+_FUNCTION_NAME = re.compile(r"[a-zA-Z_]+")
+# the value nodes that may appear opposite a placeholder in a parameterized comparison
+_REQ_COLUMNS = ("fq_column", "column_alias")
+# the tokens that may touch a keyword without whitespace, on either side of it. the
+# earley grammars require whitespace around keywords everywhere else
+_BEFORE_KEYWORD = {"("}
+_AFTER_KEYWORD = {")", ",", ";"}
+# the last or first character of a token that can't touch another such token without
+# whitespace, because the two would read as one word to the earley lexer
+_WORD_EDGE = re.compile(r"[\w'\"`]")
+
+
+class DeferToEarley(Exception):
+    """raised when the LALR tree can't be normalized into the tree that the Earley
+    parser would have produced, so the query must be parsed by the Earley parser
+    instead"""
+
+
+def parse(grammar: Lark, untrusted_query: str) -> ParseTree:
+    """Parses a query with one of the ``grammar_lalr.lark`` grammars.
+
+    The LALR grammars ignore whitespace, but the Earley grammars require it around
+    keywords and between words, so the LALR grammar alone would accept queries like
+    ``select(t.a)from t``, which the Earley grammar rejects. The fast path must never
+    accept more than the Earley grammar, so any query where a keyword touches a token
+    other than an opening parenthesis before it, or a closing parenthesis, comma or
+    semicolon after it, or where two words touch, raises :class:`DeferToEarley`, and the
+    Earley parser decides.
+
+    :raises DeferToEarley: If the query has tokens that touch.
+    :raises lark.exceptions.UnexpectedInput: If the query doesn't parse.
+    :return: The LALR parse tree, for :class:`LALRNormalizer`.
+    """
+    parser = grammar.parse_interactive(untrusted_query)
+    previous = None
+    for token in parser.iter_parse():
+        if (
+            previous is not None
+            and previous.end_pos == token.start_pos
+            and not _may_touch(previous, token)
+        ):
+            raise DeferToEarley
+        previous = token
+    return parser.feed_eof(previous)
+
+
+def _is_keyword(token: Token) -> bool:
+    return token.type != "IDENTIFIER" and token.value[:1].isalpha()
+
+
+def _may_touch(first: Token, second: Token) -> bool:
+    """Whether two tokens may be adjacent without whitespace between them."""
+    if _is_keyword(first) and second.value not in _AFTER_KEYWORD:
+        # dialect functions with their own name terminals, like postgres' substring,
+        # are called like any other function
+        if not (second.value == "(" and first.type.endswith("_FN_NAME")):
+            return False
+    if _is_keyword(second) and first.value not in _BEFORE_KEYWORD:
+        return False
+    return not (
+        _WORD_EDGE.match(first.value[-1:]) and _WORD_EDGE.match(second.value[:1])
+    )
+
+
+def _is_placeholder(node: Union[Tree, Token]) -> bool:
+    return isinstance(node, Tree) and node.data == "placeholder"
+
+
+def _is_req_column(node: Union[Tree, Token]) -> bool:
+    return isinstance(node, Tree) and node.data in _REQ_COLUMNS
+
+
+def _retype(token: Token, type: str) -> Token:
+    return Token.new_borrow_pos(type, token.value, token)
+
+
+@v_args(tree=True)
+class LALRNormalizer(Transformer):
+    """Turns a tree from one of the ``grammar_lalr.lark`` grammars into the exact tree
+    that the Earley grammar and :class:`AmbiguityResolver
+    <heimdallm.bifrosts.sql.visitors.ambiguity.AmbiguityResolver>` would have produced
+    for the same query, so that the rest of the pipeline can't tell the two parsers
+    apart. Raises :class:`DeferToEarley` for anything that the Earley path resolves in
+    a way we can't reproduce here."""
+
+    def __init__(self, reserved_keywords: set[str]) -> None:
+        self.reserved_keywords = reserved_keywords
+        super().__init__()
+
+    def aliased_column(self, tree: Tree) -> Tree:
+        # an aliased count(1) is also an aliased function call to the earley grammar
+        column = tree.children[0]
+        if isinstance(column, Token) and column.type == "COUNT_STAR":
+            if "1" in column.value:
+                raise DeferToEarley
+        return tree
+
+    def generic_alias(self, tree: Tree) -> Tree:
+        # an unquoted reserved keyword as an alias is something the earley path either
+        # prunes or rejects, so let it decide, and raise the same error it would have
+        ident = tree.children[0]
+        assert isinstance(ident, Tree)
+        if ident.data == "unquoted_identifier":
+            name = ident.children[0]
+            assert isinstance(name, Token)
+            if name.value.lower() in self.reserved_keywords:
+                raise DeferToEarley
+        return tree
+
+    def function(self, tree: Tree) -> Tree:
+        name = tree.children[0]
+        assert isinstance(name, Token)
+
+        # dialect-specific functions, like postgres' substring, have their own name
+        # terminals, and use FROM as an anonymous token
+        if name.type != "IDENTIFIER":
+            tree.children = [
+                child
+                for child in tree.children
+                if not (isinstance(child, Token) and child.type == "FROM")
+            ]
+            return tree
+
+        if not _FUNCTION_NAME.fullmatch(name.value):
+            raise DeferToEarley
+        tree.children[0] = _retype(name, "FUNCTION_NAME")
+        return tree
+
+    def value(self, tree: Tree) -> Tree:
+        # a type cast prefix followed by anything but a literal could also be read as a
+        # column named after the type, so only the earley path can decide
+        first = tree.children[0]
+        if isinstance(first, Token) and first.type == "PREFIX_CAST":
+            target = tree.children[1]
+            is_literal = (
+                isinstance(target, Token)
+                and target.type in ("NUMBER", "ESCAPED_STRING")
+                or isinstance(target, Tree)
+                and target.data == "string"
+            )
+            if not is_literal:
+                raise DeferToEarley
+        return tree
+
+    def arith_expr(self, tree: Tree) -> Tree:
+        # with more than one operator, or a prefixed operand, the earley grammar is
+        # ambiguous about the nesting, and the tree it picks is an implementation detail
+        # of the earley parser
+        if len(tree.children) > 3:
+            raise DeferToEarley
+        for child in tree.children:
+            if isinstance(child, Tree) and child.data == "value":
+                raise DeferToEarley
+        return tree
+
+    def where_conditions(self, tree: Tree) -> Tree:
+        tree.children = [
+            _retype(child, "WHERE_TYPE")
+            if isinstance(child, Token) and child.type in ("AND", "OR")
+            else child
+            for child in tree.children
+        ]
+        return tree
+
+    def where_condition(self, tree: Tree) -> Tree:
+        comparison = tree.children[0]
+        if isinstance(comparison, Tree) and comparison.data == "relational_comparison":
+            lhs, op, rhs = comparison.children
+            assert isinstance(op, Tree)
+            is_eq = isinstance(op.children[0], Token) and op.children[0].type == "EQ"
+            if is_eq:
+                # parameterized comparisons are a subset of relational comparisons, and
+                # we always prefer them, because they are stricter
+                req = self._req_comparison(comparison, lhs, rhs)
+                if req is not None:
+                    tree.children[0] = req
+        return tree
+
+    def join(self, tree: Tree) -> Tree:
+        tree.children = [
+            child
+            for child in tree.children
+            if not (isinstance(child, Token) and child.type == "AND")
+        ]
+        return tree
+
+    def join_condition(self, tree: Tree) -> Tree:
+        lhs, eq, rhs = tree.children
+        assert isinstance(eq, Token)
+
+        req = self._req_comparison(tree, lhs, rhs)
+        if req is not None:
+            tree.children = [req]
+        elif isinstance(lhs, Tree) and lhs.data == "fq_column":
+            tree.children = [
+                Tree(
+                    "connecting_join_condition",
+                    [lhs, _retype(eq, "EQUI_JOIN"), rhs],
+                    meta=copy(tree.meta),
+                )
+            ]
+        else:
+            raise DeferToEarley
+        return tree
+
+    def _req_comparison(
+        self,
+        tree: Tree,
+        lhs: Union[Tree, Token],
+        rhs: Union[Tree, Token],
+    ) -> Tree | None:
+        if _is_req_column(lhs) and _is_placeholder(rhs):
+            data = "lhs_req_comparison"
+        elif _is_placeholder(lhs) and _is_req_column(rhs):
+            data = "rhs_req_comparison"
+        else:
+            return None
+
+        return Tree(
+            "parameterized_comparison",
+            [Tree(data, [lhs, rhs], meta=copy(tree.meta))],
+            meta=copy(tree.meta),
+        )
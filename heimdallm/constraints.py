@@ -1,9 +1,16 @@
+import hashlib
+import re
 from abc import ABC, abstractmethod
+from typing import Any, Optional
 
 from lark import Lark, ParseTree
 
 from heimdallm.bifrost import Bifrost
 from heimdallm.context import TraverseContext
+from heimdallm.instrumentation import Stage
+
+# the memory address in the default repr of an object, like ``<Foo object at 0x7f...>``
+_MEMORY_ADDRESS = re.compile(r"\bat 0x[0-9a-fA-F]+")
 
 
 class ConstraintValidator(ABC):
@@ -31,6 +38,28 @@ class ConstraintValidator(ABC):
         """
         raise NotImplementedError
 
+    def fix_tree(
+        self,
+        *,
+        bifrost: Bifrost,
+        grammar: Lark,
+        ctx: TraverseContext,
+        tree: ParseTree,
+    ) -> tuple[str, ParseTree]:
+        """Like :meth:`fix`, but also returns the parse tree of the fixed input, which
+        is what gets validated. By default, the fixed input is parsed again to get its
+        tree. Override this if the validator can produce the fixed tree directly, to
+        skip the second parse.
+
+        :param grammar: The Lark grammar used to parse the untrusted input.
+        :param ctx: The traversal context, used for error reporting.
+        :param tree: The resulting parse tree of the untrusted input.
+        :return: The fixed input, and its parse tree.
+        """
+        output = self.fix(bifrost=bifrost, grammar=grammar, ctx=ctx, tree=tree)
+        with bifrost.instrument(Stage.REPARSE, ctx, validator=type(self).__name__):
+            return output, bifrost.parse(output, ctx=ctx)
+
     @abstractmethod
     def validate(
         self,
@@ -46,3 +75,47 @@ class ConstraintValidator(ABC):
         :param tree: The resulting parse tree of the untrusted input.
         """
         raise NotImplementedError
+
+    def fingerprint(self) -> Optional[str]:
+        """A stable fingerprint of the validator's configuration, which opts the
+        validator in to a Bifrost's :class:`validation cache
+        <heimdallm.cache.LRUCache>`. By default, there is no fingerprint, and the
+        results of a traversal that tries this validator are never cached.
+
+        The fingerprint is part of the cache's key, and a cache hit returns the trusted
+        output without validating it again, so the contract is strict: two validators
+        with the same fingerprint must accept and reject exactly the same inputs, for
+        as long as either is in use. A fingerprint that misses something the validator
+        depends on serves one policy's approval under another.
+
+        If the validator's decisions only depend on its class and the values of its
+        instance attributes, return :meth:`attribute_fingerprint`. If they also depend
+        on anything else, like a closure, a global or a database, pass that state to
+        it, or don't fingerprint the validator at all.
+
+        :return: The fingerprint, or None to never cache this validator's results.
+        """
+        return None
+
+    def attribute_fingerprint(self, *state: Any) -> str:
+        """A fingerprint derived from the validator's class, the ``repr`` of its
+        instance attributes, and any extra ``state``, for :meth:`fingerprint` to
+        return.
+
+        :param state: Anything else that the validator's decisions depend on. Its
+            ``repr`` must be stable.
+        :raises ValueError: If a ``repr`` includes a memory address, like the default
+            ``repr`` of an object, because it would be different for two validators
+            with the same configuration, and would change from one process to the
+            next.
+        :return: The fingerprint.
+        """
+        attributes = sorted((k, repr(v)) for k, v in vars(self).items())
+        cls = type(self)
+        config = repr((cls.__module__, cls.__qualname__, attributes, state))
+        if _MEMORY_ADDRESS.search(config):
+            raise ValueError(
+                f"{cls.__qualname__} can't be fingerprinted from its attributes, "
+                "because the repr of its state includes a memory address"
+            )
+        return hashlib.sha256(config.encode("utf8")).hexdigest()
@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from typing import Iterable
 
 from heimdallm.llm import LLMIntegration
 
@@ -37,3 +38,13 @@ class PromptEnvelope(ABC):
         :param untrusted_llm_output: The untrusted output from the LLM.
         :return: The structured response, unwrapped from the LLM's output."""
         raise NotImplementedError
+
+    def unwrap_stream(self, untrusted_llm_output: Iterable[str]) -> str:
+        """Unwrap the LLM's output as it is streamed in chunks. An envelope that can
+        tell when it has everything that it needs should stop reading the chunks at that
+        point, so that the rest of the completion can be cancelled. By default, this
+        reads all of the chunks and calls :meth:`unwrap`.
+
+        :param untrusted_llm_output: The chunks of untrusted output from the LLM.
+        :return: The structured response, unwrapped from the LLM's output."""
+        return self.unwrap("".join(untrusted_llm_output))
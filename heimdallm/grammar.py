@@ -0,0 +1,101 @@
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Hashable, Optional
+
+import structlog
+from lark import Lark
+
+LOG = structlog.get_logger(__name__)
+
+
+class GrammarRegistry:
+    """A process-wide, thread-safe registry of compiled Lark grammars. Compiling a
+    grammar is expensive, and a Bifrost needs one, so without a registry every new
+    Bifrost would pay for the compilation. Grammars are keyed by their name (typically
+    the dialect) and the Lark options used to build them, so differently-configured
+    parsers for the same grammar file never collide.
+
+    Lark grammars are safe to share between threads once they are built, because all
+    parse state is created per call to :meth:`lark.Lark.parse`.
+
+    Compiled grammars can optionally be serialized to disk via :meth:`enable_disk_cache`
+    so that new processes skip the compilation too. This uses Lark's own ``cache=``
+    mechanism, which, as of Lark 1.1, only supports ``parser="lalr"``. Other grammars
+    are only cached in memory.
+    """
+
+    def __init__(self) -> None:
+        self._grammars: dict[Hashable, Lark] = {}
+        self._lock = threading.Lock()
+        self._cache_dir: Optional[Path] = None
+
+    def enable_disk_cache(self, cache_dir: Path | str) -> None:
+        """Opt-in to serializing compiled grammars to disk. Grammars already in the
+        registry are unaffected.
+
+        :param cache_dir: The directory to write the serialized grammars to. It will be
+            created if it doesn't exist.
+        """
+        cache_dir = Path(cache_dir)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self._cache_dir = cache_dir
+
+    def disable_disk_cache(self) -> None:
+        """Stop serializing compiled grammars to disk."""
+        self._cache_dir = None
+
+    def clear(self) -> None:
+        """Drop all of the compiled grammars from memory. The next :meth:`get` for any
+        grammar will compile it again (or load it from the disk cache)."""
+        with self._lock:
+            self._grammars.clear()
+
+    def __len__(self) -> int:
+        return len(self._grammars)
+
+    def get(self, name: str, grammar_path: Path, **options: Any) -> Lark:
+        """Fetch a compiled grammar, compiling it if it hasn't been compiled yet.
+
+        :param name: A name for the grammar, for example, the SQL dialect.
+        :param grammar_path: The path to the ``.lark`` grammar file.
+        :param options: The keyword options to pass to :class:`lark.Lark`. These must
+            be hashable.
+        :return: The shared, compiled grammar.
+        """
+        key = (name, str(grammar_path), tuple(sorted(options.items())))
+
+        # fast path, without the lock. dict reads are atomic
+        grammar = self._grammars.get(key)
+        if grammar is not None:
+            return grammar
+
+        with self._lock:
+            # another thread may have built it while we waited on the lock
+            grammar = self._grammars.get(key)
+            if grammar is None:
+                grammar = self._build(name, grammar_path, options)
+                self._grammars[key] = grammar
+        return grammar
+
+    def _build(self, name: str, grammar_path: Path, options: dict[str, Any]) -> Lark:
+        log = LOG.bind(grammar=name)
+        text = grammar_path.read_text()
+
+        if self._cache_dir is not None and options.get("parser") == "lalr":
+            # lark validates the cache file against the grammar and options itself, so
+            # the digest in the filename just keeps different configurations from
+            # thrashing the same file
+            digest = hashlib.sha256(
+                repr((text, sorted(options.items()))).encode("utf8")
+            ).hexdigest()[:16]
+            cache_file = self._cache_dir / f"{name}-{digest}.lark"
+            log.info("Building grammar with disk cache", cache_file=str(cache_file))
+            return Lark(text, cache=str(cache_file), **options)
+
+        log.info("Building grammar")
+        return Lark(text, **options)
+
+
+#: The process-wide grammar registry used by all of the Bifrosts.
+registry = GrammarRegistry()
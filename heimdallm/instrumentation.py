@@ -0,0 +1,403 @@
+import bisect
+import contextvars
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Iterator, Mapping, Optional, Sequence
+
+from heimdallm.context import TraverseContext
+
+
+class Stage(Enum):
+    """The stages of a Bifrost traversal that are instrumented, in the order that they
+    run. Not every traversal runs every stage: a validation cache hit skips from
+    unwrapping straight to the end, and the stages after parsing only run when the
+    previous stage succeeded."""
+
+    #: Wrapping the untrusted human input in the prompt envelope.
+    WRAP = "wrap"
+    #: Waiting on the LLM's completion. A streamed completion is unwrapped as it
+    #: arrives, so this stage runs inside :attr:`UNWRAP` when traversing with
+    #: :meth:`Bifrost.traverse <heimdallm.bifrost.Bifrost.traverse>`.
+    LLM = "llm"
+    #: Unwrapping the LLM's output from the prompt envelope.
+    UNWRAP = "unwrap"
+    #: Parsing the unwrapped output into a parse tree.
+    PARSE = "parse"
+    #: Resolving the ambiguities of an Earley parse into a single tree. This runs
+    #: inside :attr:`PARSE`, and only for SQL queries that the fast LALR parser
+    #: couldn't decide.
+    RESOLVE = "resolve"
+    #: A constraint validator autofixing the parse tree.
+    FIX = "fix"
+    #: Parsing a validator's fixed output again. This runs inside :attr:`FIX`, and
+    #: only for validators that don't produce their fixed tree directly. The SQL
+    #: validators never reparse.
+    REPARSE = "reparse"
+    #: A constraint validator validating the parse tree.
+    VALIDATE = "validate"
+    #: The Bifrost's :meth:`post_transform <heimdallm.bifrost.Bifrost.post_transform>`
+    #: of the trusted output.
+    POST_TRANSFORM = "post_transform"
+
+
+class Instrumentation:
+    """The base class for instrumenting Bifrost traversals, by passing instances to a
+    Bifrost's ``instrumentation`` argument. Every stage of a traversal is run inside
+    :meth:`stage`, which by default calls :meth:`on_start` before the stage and
+    :meth:`on_end` after it, so a subclass only needs to override those callbacks. A
+    subclass that needs to wrap the stage itself, like a tracer does, can override
+    :meth:`stage` instead.
+
+    The callbacks run on the traversal's thread, in the middle of the traversal, so
+    they should be quick, and must be thread-safe if the Bifrost is shared between
+    threads. Stages may nest, see :class:`Stage`.
+
+    Every stage has a ``dialect`` label, the :attr:`dialect
+    <heimdallm.bifrost.Bifrost.dialect>` of the Bifrost. The fix, reparse and validate
+    stages also have a ``validator`` label, the class name of the constraint validator.
+    """
+
+    def on_start(
+        self,
+        stage: Stage,
+        ctx: TraverseContext,
+        labels: Mapping[str, str],
+    ) -> None:
+        """Called before a stage runs.
+
+        :param stage: The stage that's about to run.
+        :param ctx: The context of the traversal.
+        :param labels: The labels of the stage.
+        """
+
+    def on_end(
+        self,
+        stage: Stage,
+        ctx: TraverseContext,
+        labels: Mapping[str, str],
+        duration: float,
+        error: Optional[Exception],
+    ) -> None:
+        """Called after a stage has run, whether or not it succeeded.
+
+        :param stage: The stage that ran.
+        :param ctx: The context of the traversal.
+        :param labels: The labels of the stage.
+        :param duration: How long the stage took, in seconds.
+        :param error: The exception that the stage raised, or None if it succeeded.
+        """
+
+    @contextmanager
+    def stage(
+        self,
+        stage: Stage,
+        ctx: TraverseContext,
+        labels: Mapping[str, str],
+    ) -> Iterator[None]:
+        """Runs a stage between :meth:`on_start` and :meth:`on_end`.
+
+        :param stage: The stage that runs inside the context.
+        :param ctx: The context of the traversal.
+        :param labels: The labels of the stage.
+        """
+        self.on_start(stage, ctx, labels)
+        error = None
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.on_end(stage, ctx, labels, time.perf_counter() - start, error)
+
+
+#: The upper bounds, in seconds, of a :class:`MetricsCollector`'s histogram buckets by
+#: default. They're finer than Prometheus' defaults, because parsing and validation
+#: usually take milliseconds.
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+@dataclass
+class Histogram:
+    """The distribution of the durations of a stage with one set of labels.
+
+    :param buckets: The upper bounds of the buckets, in seconds, in ascending order.
+        Durations above the last bound are only counted in :attr:`count`.
+    """
+
+    buckets: Sequence[float]
+    #: The number of durations in each bucket, not cumulative.
+    counts: list[int] = field(init=False)
+    #: The sum of the durations, in seconds.
+    sum: float = 0.0
+    #: The number of durations.
+    count: int = 0
+    #: The number of times that the stage raised an exception.
+    errors: int = 0
+
+    def __post_init__(self) -> None:
+        self.counts = [0] * len(self.buckets)
+
+    def observe(self, duration: float, error: bool = False) -> None:
+        """Records a duration.
+
+        :param duration: The duration, in seconds.
+        :param error: Whether the stage raised an exception.
+        """
+        i = bisect.bisect_left(self.buckets, duration)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.sum += duration
+        self.count += 1
+        if error:
+            self.errors += 1
+
+    def cumulative(self) -> list[tuple[float, int]]:
+        """The upper bound of each bucket, and the number of durations at or below it,
+        ending with the ``+Inf`` bucket, like a Prometheus histogram's ``le`` buckets.
+        """
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        result.append((float("inf"), self.count))
+        return result
+
+
+class MetricsCollector(Instrumentation):
+    """Collects Prometheus-style histograms of the durations of each stage, in process,
+    with a histogram for every combination of a stage and its labels, like the dialect
+    and the constraint validator. The histograms can be read with :meth:`histogram`, or
+    rendered in the Prometheus text format with :meth:`render`, to serve from a metrics
+    endpoint or to copy into a real Prometheus client.
+
+    A collector is thread-safe, and may be shared by many Bifrosts.
+
+    :param buckets: The upper bounds of the histogram buckets, in seconds.
+    :param namespace: The prefix of the rendered metrics' names.
+    """
+
+    def __init__(
+        self,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        namespace: str = "heimdallm",
+    ):
+        if list(buckets) != sorted(set(buckets)):
+            raise ValueError("buckets must be unique and in ascending order")
+
+        self.buckets = tuple(buckets)
+        self.namespace = namespace
+        self._histograms: dict[tuple[tuple[str, str], ...], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def on_end(
+        self,
+        stage: Stage,
+        ctx: TraverseContext,
+        labels: Mapping[str, str],
+        duration: float,
+        error: Optional[Exception],
+    ) -> None:
+        key = self._key(stage, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = Histogram(self.buckets)
+                self._histograms[key] = histogram
+            histogram.observe(duration, error=error is not None)
+
+    def histogram(self, stage: Stage, **labels: str) -> Optional[Histogram]:
+        """The histogram of a stage with exactly these labels.
+
+        :param stage: The stage.
+        :param labels: The labels of the stage, like ``dialect`` and ``validator``.
+        :return: The histogram, or None if the stage hasn't run with these labels.
+        """
+        return self._histograms.get(self._key(stage, labels))
+
+    def histograms(self) -> dict[tuple[tuple[str, str], ...], Histogram]:
+        """A snapshot of every histogram, keyed on its sorted label pairs, including
+        the ``stage`` label."""
+        snapshot = {}
+        with self._lock:
+            for key, histogram in self._histograms.items():
+                copy = Histogram(
+                    buckets=self.buckets,
+                    sum=histogram.sum,
+                    count=histogram.count,
+                    errors=histogram.errors,
+                )
+                copy.counts = list(histogram.counts)
+                snapshot[key] = copy
+        return snapshot
+
+    def render(self) -> str:
+        """Renders the histograms in the Prometheus text exposition format, as a
+        ``<namespace>_stage_duration_seconds`` histogram, and a
+        ``<namespace>_stage_errors_total`` counter.
+
+        :return: The rendered metrics.
+        """
+        duration = f"{self.namespace}_stage_duration_seconds"
+        errors = f"{self.namespace}_stage_errors_total"
+        with self._lock:
+            items = sorted(
+                (key, histogram.cumulative(), histogram.sum, histogram.errors)
+                for key, histogram in self._histograms.items()
+            )
+
+        lines = [
+            f"# HELP {duration} The duration of each stage of a Bifrost traversal.",
+            f"# TYPE {duration} histogram",
+        ]
+        for key, buckets, total, _ in items:
+            for bound, count in buckets:
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _render_labels(key + (("le", le),))
+                lines.append(f"{duration}_bucket{labels} {count}")
+            labels = _render_labels(key)
+            lines.append(f"{duration}_sum{labels} {total!r}")
+            lines.append(f"{duration}_count{labels} {buckets[-1][1]}")
+
+        lines.append(
+            f"# HELP {errors} The number of stages of Bifrost traversals that raised "
+            "an exception."
+        )
+        lines.append(f"# TYPE {errors} counter")
+        for key, _, _, error_count in items:
+            lines.append(f"{errors}{_render_labels(key)} {error_count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        """Removes every histogram."""
+        with self._lock:
+            self._histograms.clear()
+
+    @staticmethod
+    def _key(stage: Stage, labels: Mapping[str, str]) -> tuple[tuple[str, str], ...]:
+        return tuple(sorted({**labels, "stage": stage.value}.items()))
+
+
+def _render_labels(labels: Sequence[tuple[str, str]]) -> str:
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+@dataclass(frozen=True)
+class RecordedSpan:
+    """A finished span, as recorded by a :class:`SpanAdapter` without a tracer.
+
+    :param name: The name of the span, ``heimdallm.<stage>``.
+    :param span_id: The id of the span, unique to its adapter.
+    :param parent_id: The id of the span that this span ran inside, or None.
+    :param start_ns: When the span started, from :func:`time.time_ns`.
+    :param end_ns: When the span ended, from :func:`time.time_ns`.
+    :param attributes: The span's attributes.
+    :param error: The exception that the stage raised, or None if it succeeded.
+    """
+
+    name: str
+    span_id: int
+    parent_id: Optional[int]
+    start_ns: int
+    end_ns: int
+    attributes: Mapping[str, str]
+    error: Optional[Exception] = None
+
+    @property
+    def duration(self) -> float:
+        """The duration of the span, in seconds."""
+        return (self.end_ns - self.start_ns) / 1e9
+
+
+class SpanAdapter(Instrumentation):
+    """Turns each stage into an OpenTelemetry-style span, named ``heimdallm.<stage>``,
+    with the stage's labels as ``heimdallm.*`` attributes. Spans of nested stages are
+    children of the stage that they run in, and a traversal's spans are children of
+    whatever span is current when the traversal starts.
+
+    With an OpenTelemetry tracer, like ``opentelemetry.trace.get_tracer(__name__)``,
+    the spans are started with its ``start_as_current_span``, and exported by whatever
+    backend the tracer is configured with. HeimdaLLM doesn't depend on OpenTelemetry,
+    so any object with a compatible ``start_as_current_span`` will do.
+
+    Without a tracer, the adapter records finished spans in memory instead, in
+    :attr:`spans`, so that traversals can be traced with no backend at all.
+
+    :param tracer: The OpenTelemetry tracer, or None to record spans in memory.
+    :param max_spans: The number of recorded spans to keep, without a tracer. The
+        oldest spans are dropped first.
+    """
+
+    def __init__(self, tracer: Any = None, max_spans: int = 10000):
+        self.tracer = tracer
+        #: The most recent finished spans, in the order that they finished.
+        self.spans: deque[RecordedSpan] = deque(maxlen=max_spans)
+        self._ids = itertools.count(1)
+        self._current: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar(
+            f"heimdallm_span_{id(self)}", default=None
+        )
+
+    @contextmanager
+    def stage(
+        self,
+        stage: Stage,
+        ctx: TraverseContext,
+        labels: Mapping[str, str],
+    ) -> Iterator[None]:
+        name = f"heimdallm.{stage.value}"
+        attributes = {f"heimdallm.{key}": value for key, value in labels.items()}
+        if self.tracer is not None:
+            with self.tracer.start_as_current_span(name, attributes=attributes):
+                yield
+            return
+
+        span_id = next(self._ids)
+        parent_id = self._current.get()
+        token = self._current.set(span_id)
+        error = None
+        start = time.time_ns()
+        try:
+            yield
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            end = time.time_ns()
+            self._current.reset(token)
+            self.spans.append(
+                RecordedSpan(
+                    name=name,
+                    span_id=span_id,
+                    parent_id=parent_id,
+                    start_ns=start,
+                    end_ns=end,
+                    attributes=attributes,
+                    error=error,
+                )
+            )
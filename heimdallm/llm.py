@@ -1,4 +1,7 @@
+import asyncio
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator
 
 
 class LLMIntegration(ABC):
@@ -15,3 +18,73 @@ class LLMIntegration(ABC):
         :return: The untrusted output from the LLM.
         """
         raise NotImplementedError
+
+    def stream(self, untrusted_input: str) -> Iterator[str]:
+        """Send the untrusted input to the LLM and yield the LLM's output in chunks, as
+        it's generated. The consumer may stop reading, and close the iterator, as soon
+        as it has what it needs, so a provider that streams natively should cancel the
+        completion when the iterator is closed. By default, this yields the whole output
+        of :meth:`complete` as a single chunk.
+
+        :param untrusted_input: The untrusted input from the user, but almost always
+            wrapped in a :class:`PromptEnvelope <heimdallm.envelope.PromptEnvelope>`.
+        :return: The chunks of untrusted output from the LLM.
+        """
+        yield self.complete(untrusted_input)
+
+    def complete_many(self, untrusted_input: str, n: int) -> Iterator[str]:
+        """Ask the LLM for ``n`` candidate completions of the same input, and yield
+        each one as soon as it's ready. The consumer may close the iterator once it has
+        found a candidate that it likes, and the rest are abandoned.
+
+        By default, this makes ``n`` concurrent calls to :meth:`complete`. Closing the
+        iterator cancels the calls that haven't started, but a blocking call that is
+        already in flight can't be interrupted, so it finishes in the background, and
+        its completion is discarded. Providers that can generate several completions in
+        one request should override this.
+
+        :param untrusted_input: The untrusted input from the user, but almost always
+            wrapped in a :class:`PromptEnvelope <heimdallm.envelope.PromptEnvelope>`.
+        :param n: The number of candidate completions.
+        :return: The untrusted candidate outputs from the LLM, in the order that they
+            completed.
+        """
+        if n == 1:
+            yield self.complete(untrusted_input)
+            return
+
+        pool = ThreadPoolExecutor(max_workers=n)
+        futures = [pool.submit(self.complete, untrusted_input) for _ in range(n)]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+class AsyncLLMIntegration(LLMIntegration):
+    """An LLM integration that can also complete asynchronously.
+    :meth:`Bifrost.atraverse <heimdallm.bifrost.Bifrost.atraverse>` awaits
+    :meth:`acomplete` directly, so an in-flight completion does not hold a thread."""
+
+    @abstractmethod
+    async def acomplete(self, untrusted_input: str) -> str:
+        """Send the untrusted input to the LLM and return the LLM's output, without
+        blocking the event loop.
+
+        :param untrusted_input: The untrusted input from the user, but almost always
+            wrapped in a :class:`PromptEnvelope <heimdallm.envelope.PromptEnvelope>`.
+        :return: The untrusted output from the LLM.
+        """
+        raise NotImplementedError
+
+    def complete(self, untrusted_input: str) -> str:
+        """A blocking completion, implemented by running :meth:`acomplete` in a new
+        event loop. Override it if the provider has a native blocking API. It cannot be
+        called from a running event loop.
+
+        :param untrusted_input: The untrusted input from the user, but almost always
+            wrapped in a :class:`PromptEnvelope <heimdallm.envelope.PromptEnvelope>`.
+        :return: The untrusted output from the LLM.
+        """
+        return asyncio.run(self.acomplete(untrusted_input))
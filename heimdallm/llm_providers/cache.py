@@ -0,0 +1,247 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Iterator, Optional
+
+from heimdallm.cache import LRUCache
+from heimdallm.llm import AsyncLLMIntegration, LLMIntegration
+
+
+class CacheBackend(ABC):
+    """Where a :class:`CachingLLM` stores its completions. Implementations must be
+    thread-safe."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        """Fetch a cached completion.
+
+        :param key: The cache key.
+        :return: The cached completion, or None if it isn't cached.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(self, key: str, completion: str) -> None:
+        """Cache a completion.
+
+        :param key: The cache key.
+        :param completion: The LLM's completion.
+        """
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Caches completions in memory, in a least-recently-used cache.
+
+    :param max_size: The maximum number of completions to hold.
+    :param ttl: The number of seconds a completion stays valid, or None for no expiry.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self._cache: LRUCache[str] = LRUCache(max_size=max_size, ttl=ttl)
+
+    def get(self, key: str) -> Optional[str]:
+        return self._cache.get(key)
+
+    def set(self, key: str, completion: str) -> None:
+        self._cache.set(key, completion)
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """Caches completions in a local sqlite file, so that they survive restarts and can
+    be shared between processes on the same machine.
+
+    :param path: The path to the sqlite file. It will be created if it doesn't exist.
+    :param ttl: The number of seconds a completion stays valid, or None for no expiry.
+        Expired completions are deleted from the file when they're read, and on every
+        write, so the file doesn't grow without bound.
+    """
+
+    def __init__(self, path: Path | str, ttl: Optional[float] = None):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS completions (
+                    key TEXT PRIMARY KEY,
+                    completion TEXT NOT NULL,
+                    created REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS completions_created "
+                "ON completions (created)"
+            )
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT completion, created FROM completions WHERE key=?",
+                (key,),
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        completion, created = row
+        if self.ttl is not None and created + self.ttl < time.time():
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "DELETE FROM completions WHERE key=? AND created=?",
+                    (key, created),
+                )
+            return None
+        return completion
+
+    def set(self, key: str, completion: str) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            if self.ttl is not None:
+                self._conn.execute(
+                    "DELETE FROM completions WHERE created < ?",
+                    (now - self.ttl,),
+                )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions VALUES (?, ?, ?)",
+                (key, completion, now),
+            )
+
+    def close(self) -> None:
+        """Close the underlying sqlite connection."""
+        with self._lock:
+            self._conn.close()
+
+
+class CachingLLM(AsyncLLMIntegration):
+    """Wraps any LLM integration and caches its completions, so that repeated prompts
+    skip the round trip to the LLM entirely. Completions are keyed on a hash of the
+    model name and the fully-wrapped prompt, so a change to the prompt envelope, or to
+    the model, is a cache miss. Failed completions are not cached.
+
+    Keep in mind that this makes the LLM deterministic for a given prompt. If the LLM
+    produces a query that fails validation, the same question will keep failing until
+    the cached completion expires.
+
+    Streaming and candidates are forwarded to the wrapped integration on a cache miss,
+    so a traversal still sees its output as it arrives, and a speculative traversal
+    still gets distinct candidates. Only a whole completion can be cached, so a stream
+    that is closed before it finishes, like when the envelope has found its closing
+    delimiter, is read to the end before it's closed. A cache miss costs the whole
+    completion, but every hit after it costs nothing.
+
+    :param llm: The LLM integration to wrap.
+    :param backend: Where to store the completions. Defaults to an in-memory
+        :class:`MemoryCacheBackend`.
+    :param model: The name of the model, used in the cache key. Defaults to the
+        wrapped integration's ``model`` attribute, if it has one, otherwise its class
+        name.
+    """
+
+    def __init__(
+        self,
+        llm: LLMIntegration,
+        *,
+        backend: Optional[CacheBackend] = None,
+        model: Optional[str] = None,
+    ):
+        self.llm = llm
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        if model is None:
+            model = getattr(llm, "model", None) or type(llm).__qualname__
+        self.model = model
+
+    def cache_key(self, untrusted_input: str, candidate: Optional[int] = None) -> str:
+        """The cache key for a prompt.
+
+        :param untrusted_input: The fully-wrapped prompt.
+        :param candidate: The index of the candidate, for the completions of
+            :meth:`complete_many`, or None for a single completion.
+        :return: The cache key.
+        """
+        h = hashlib.sha256()
+        h.update(self.model.encode("utf8"))
+        h.update(b"\0")
+        if candidate is not None:
+            h.update(f"candidate:{candidate}".encode("utf8"))
+            h.update(b"\0")
+        h.update(untrusted_input.encode("utf8"))
+        return h.hexdigest()
+
+    def complete(self, untrusted_input: str) -> str:
+        key = self.cache_key(untrusted_input)
+        if (completion := self.backend.get(key)) is not None:
+            return completion
+
+        completion = self.llm.complete(untrusted_input)
+        self.backend.set(key, completion)
+        return completion
+
+    def stream(self, untrusted_input: str) -> Iterator[str]:
+        key = self.cache_key(untrusted_input)
+        if (completion := self.backend.get(key)) is not None:
+            yield completion
+            return
+
+        chunks: list[str] = []
+        stream = self.llm.stream(untrusted_input)
+        rest = iter(stream)
+        try:
+            for chunk in rest:
+                chunks.append(chunk)
+                try:
+                    yield chunk
+                except GeneratorExit:
+                    # the caller has stopped reading, but we need the rest of the
+                    # completion to cache it. a failure now is only a cache miss
+                    try:
+                        chunks.extend(rest)
+                    except Exception:
+                        return
+                    self.backend.set(key, "".join(chunks))
+                    return
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+        self.backend.set(key, "".join(chunks))
+
+    def complete_many(self, untrusted_input: str, n: int) -> Iterator[str]:
+        # each candidate is cached on its own, and only the missing ones are asked for
+        missing = []
+        for i in range(n):
+            key = self.cache_key(untrusted_input, candidate=i)
+            if (completion := self.backend.get(key)) is not None:
+                yield completion
+            else:
+                missing.append(key)
+        if not missing:
+            return
+
+        outputs = self.llm.complete_many(untrusted_input, len(missing))
+        try:
+            for key, completion in zip(missing, outputs):
+                self.backend.set(key, completion)
+                yield completion
+        finally:
+            close = getattr(outputs, "close", None)
+            if close is not None:
+                close()
+
+    async def acomplete(self, untrusted_input: str) -> str:
+        key = self.cache_key(untrusted_input)
+        if (completion := self.backend.get(key)) is not None:
+            return completion
+
+        if isinstance(self.llm, AsyncLLMIntegration):
+            completion = await self.llm.acomplete(untrusted_input)
+        else:
+            completion = await asyncio.to_thread(self.llm.complete, untrusted_input)
+        self.backend.set(key, completion)
+        return completion
@@ -1,7 +1,7 @@
 import hashlib
 from typing import Dict
 
-from ..llm import LLMIntegration
+from ..llm import AsyncLLMIntegration, LLMIntegration
 
 
 class LookupMockLLM(LLMIntegration):  # pragma: no cover
@@ -23,3 +23,14 @@ class EchoMockLLM(LLMIntegration):  # pragma: no cover
 
     def complete(self, sql_output: str) -> str:
         return sql_output
+
+
+class AsyncEchoMockLLM(AsyncLLMIntegration):  # pragma: no cover
+    """an asyncio version of :class:`EchoMockLLM`, useful for testing the async
+    traversal path without a real LLM."""
+
+    async def acomplete(self, sql_output: str) -> str:
+        return sql_output
+
+    def complete(self, sql_output: str) -> str:
+        return sql_output
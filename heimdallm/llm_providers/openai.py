@@ -1,10 +1,13 @@
 from enum import Enum
-from typing import Callable
+from typing import Any, Awaitable, Callable, Generator, Iterator, Optional
 
 import openai
+from openai.util import convert_to_openai_object
 
 from heimdallm import llm
 
+from .transport import HTTPTransport, iter_events
+
 
 class OpenAIMethod(Enum):
     """How the OpenAI API should complete the prompt. OpenAI provides two main methods
@@ -23,7 +26,11 @@ class Client(llm.LLMIntegration):
         the prompt envelopes can make the LLM input quite long.
     :param method: The method to use to interact with the OpenAI API. I don't really
         know the difference in terms of quality, but the chat method has worked fine so
-        far."""
+        far.
+    :param transport: An optional :class:`HTTPTransport
+        <heimdallm.llm_providers.transport.HTTPTransport>` to make the blocking requests
+        through, for pooled connections, timeouts, retries and rate limiting. If
+        omitted, requests are made by the ``openai`` library."""
 
     def __init__(
         self,
@@ -31,10 +38,12 @@ class Client(llm.LLMIntegration):
         api_key: str,
         model: str = "gpt-3.5-turbo-16k",
         method: OpenAIMethod = OpenAIMethod.CHAT,
+        transport: Optional[HTTPTransport] = None,
     ):
         self.api_key = api_key
         self.model = model
         self.method = method
+        self.transport = transport
 
     def complete(self, untrusted_user_input: str) -> str:
         """Complete the untrusted user input and return some structured output.
@@ -48,8 +57,104 @@ class Client(llm.LLMIntegration):
         fn = fn_map[self.method]
         return fn(untrusted_user_input)
 
+    def stream(self, untrusted_user_input: str) -> Iterator[str]:
+        """Complete the untrusted user input, yielding the output as it's generated.
+        Closing the iterator closes the response, which cancels the rest of the
+        completion.
+
+        :param untrusted_user_input: The untrusted user input.
+        :return: The chunks of structured output."""
+        if self.method == OpenAIMethod.CHAT:
+            params = self._chat_params(untrusted_user_input)
+        else:
+            params = self._completion_params(untrusted_user_input)
+        response = self._create(params, stream=True)
+
+        try:
+            for chunk in response:
+                choice = chunk.choices[0]
+                if self.method == OpenAIMethod.CHAT:
+                    text = choice.delta.get("content")
+                else:
+                    text = choice.text
+                if text:
+                    yield text
+        finally:
+            close = getattr(response, "close", None)
+            if close is not None:
+                close()
+
+    def complete_many(self, untrusted_user_input: str, n: int) -> Iterator[str]:
+        """Ask for ``n`` completions of the untrusted user input in a single streamed
+        request, and yield each completion as soon as it has finished. Closing the
+        iterator closes the response, which cancels the completions that haven't
+        finished yet.
+
+        :param untrusted_user_input: The untrusted user input.
+        :param n: The number of candidate completions.
+        :return: The candidate outputs, in the order that they finished."""
+        is_chat = self.method == OpenAIMethod.CHAT
+        if is_chat:
+            params = self._chat_params(untrusted_user_input)
+        else:
+            params = self._completion_params(untrusted_user_input)
+        response = self._create({**params, "n": n}, stream=True)
+
+        # the choices are streamed interleaved, so each one is built up by its index
+        outputs: dict[int, list[str]] = {}
+        try:
+            for chunk in response:
+                for choice in chunk.choices:
+                    text = choice.delta.get("content") if is_chat else choice.text
+                    parts = outputs.setdefault(choice.index, [])
+                    if text:
+                        parts.append(text)
+                    if choice.get("finish_reason") is not None:
+                        output = "".join(parts)
+                        yield output if is_chat else output.strip()
+        finally:
+            close = getattr(response, "close", None)
+            if close is not None:
+                close()
+
     def _complete_via_chatgpt(self, untrusted_user_input: str) -> str:
-        chat_completion = openai.ChatCompletion.create(
+        chat_completion = self._create(self._chat_params(untrusted_user_input))
+        untrusted_llm_output = chat_completion.choices[0].message.content
+        return untrusted_llm_output
+
+    def _complete_via_completion(self, prompt):
+        response = self._create(self._completion_params(prompt))
+        return response.choices[0].text.strip()
+
+    def _create(self, params: dict, *, stream: bool = False) -> Any:
+        """Creates a completion with the API of our method, through our transport, if
+        we have one, or through the ``openai`` library otherwise. Either way, the
+        response has the same shape."""
+        is_chat = self.method == OpenAIMethod.CHAT
+        if self.transport is None:
+            api = openai.ChatCompletion if is_chat else openai.Completion
+            if stream:
+                return api.create(stream=True, **params)
+            return api.create(**params)
+
+        body = {k: v for k, v in params.items() if k != "api_key"}
+        if not is_chat:
+            body["model"] = body.pop("engine")
+        if stream:
+            body["stream"] = True
+
+        response = self.transport.post(
+            "/chat/completions" if is_chat else "/completions",
+            body=body,
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            stream=stream,
+        )
+        if stream:
+            return _convert_events(iter_events(response))
+        return convert_to_openai_object(response.json())
+
+    def _chat_params(self, untrusted_user_input: str) -> dict:
+        return dict(
             api_key=self.api_key,
             model=self.model,
             messages=[
@@ -59,11 +164,9 @@ class Client(llm.LLMIntegration):
                 }
             ],
         )
-        untrusted_llm_output = chat_completion.choices[0].message.content
-        return untrusted_llm_output
 
-    def _complete_via_completion(self, prompt):
-        response = openai.Completion.create(
+    def _completion_params(self, prompt: str) -> dict:
+        return dict(
             api_key=self.api_key,
             engine=self.model,
             prompt=prompt,
@@ -72,4 +175,51 @@ class Client(llm.LLMIntegration):
             stop=None,
             temperature=0.7,
         )
+
+
+class AsyncClient(Client, llm.AsyncLLMIntegration):
+    """The LLM integration with OpenAI's ChatGPT and Completion API, with support for
+    asyncio. Use it with :meth:`Bifrost.atraverse
+    <heimdallm.bifrost.Bifrost.atraverse>` so that in-flight completions don't hold a
+    thread. The blocking :meth:`complete` method is still available.
+
+    :param api_key: Your secret OpenAI API key.
+    :param model: The model to use. Prefer a higher model with a high context window, as
+        the prompt envelopes can make the LLM input quite long.
+    :param method: The method to use to interact with the OpenAI API.
+    :param transport: An optional :class:`HTTPTransport
+        <heimdallm.llm_providers.transport.HTTPTransport>` for the blocking requests.
+        Async requests are always made by the ``openai`` library."""
+
+    async def acomplete(self, untrusted_user_input: str) -> str:
+        """Complete the untrusted user input and return some structured output, without
+        blocking the event loop.
+
+        :param untrusted_user_input: The untrusted user input.
+        :return: The structured output."""
+        fn_map: dict[OpenAIMethod, Callable[[str], Awaitable[str]]] = {
+            OpenAIMethod.CHAT: self._acomplete_via_chatgpt,
+            OpenAIMethod.COMPLETION: self._acomplete_via_completion,
+        }
+        fn = fn_map[self.method]
+        return await fn(untrusted_user_input)
+
+    async def _acomplete_via_chatgpt(self, untrusted_user_input: str) -> str:
+        chat_completion = await openai.ChatCompletion.acreate(
+            **self._chat_params(untrusted_user_input)
+        )
+        untrusted_llm_output = chat_completion.choices[0].message.content
+        return untrusted_llm_output
+
+    async def _acomplete_via_completion(self, prompt: str) -> str:
+        response = await openai.Completion.acreate(**self._completion_params(prompt))
         return response.choices[0].text.strip()
+
+
+def _convert_events(events: Generator[Any, None, None]) -> Generator[Any, None, None]:
+    """the streamed events, in the same shape as the ``openai`` library's"""
+    try:
+        for event in events:
+            yield convert_to_openai_object(event)
+    finally:
+        events.close()
@@ -0,0 +1,200 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Iterator, Optional, Sequence
+
+from heimdallm import llm
+
+from .openai import OpenAIMethod
+from .transport import HTTPTransport, iter_events
+
+
+class Client(llm.LLMIntegration):
+    """The LLM integration with any server that implements OpenAI's chat or completion
+    API, for example, a self-hosted llama.cpp or vLLM server on your own network.
+    Requests are made through a pooled, retrying :class:`HTTPTransport
+    <heimdallm.llm_providers.transport.HTTPTransport>`.
+
+    With the completion method, concurrent calls to :meth:`complete`, for example, from
+    :meth:`Bifrost.traverse_many <heimdallm.bifrost.Bifrost.traverse_many>`, can be
+    batched into a single request with a list of prompts, which servers like vLLM
+    generate together. Set ``batch_window`` to the number of seconds to wait for a
+    batch to fill up.
+
+    :param base_url: The base URL of the API, for example,
+        ``http://10.0.0.2:8000/v1``.
+    :param model: The model to use.
+    :param api_key: The API key, if the server requires one.
+    :param method: Whether to use the chat or the completion API.
+    :param max_tokens: The most tokens to generate for each completion.
+    :param temperature: The sampling temperature.
+    :param batch_window: The seconds that a completion waits for others to be batched
+        with it. 0 disables batching. Only used with the completion method.
+    :param max_batch: The most prompts in a single batched request.
+    :param transport: The transport to make requests through. If omitted, one is made
+        for ``base_url`` with the default settings.
+    """
+
+    def __init__(
+        self,
+        *,
+        base_url: str,
+        model: str,
+        api_key: Optional[str] = None,
+        method: OpenAIMethod = OpenAIMethod.CHAT,
+        max_tokens: int = 256,
+        temperature: float = 0.7,
+        batch_window: float = 0.0,
+        max_batch: int = 16,
+        transport: Optional[HTTPTransport] = None,
+    ):
+        if max_batch < 1:
+            raise ValueError("max_batch must be at least 1")
+
+        self.model = model
+        self.api_key = api_key
+        self.method = method
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.transport = transport or HTTPTransport(base_url=base_url)
+        self._batcher: Optional[_Batcher] = None
+        if method == OpenAIMethod.COMPLETION and batch_window > 0:
+            self._batcher = _Batcher(self.complete_batch, batch_window, max_batch)
+
+    def complete(self, untrusted_input: str) -> str:
+        """Complete the untrusted input.
+
+        :param untrusted_input: The untrusted input.
+        :return: The untrusted output."""
+        if self._batcher is not None:
+            return self._batcher.submit(untrusted_input)
+        return self._complete_unbatched(untrusted_input)
+
+    def complete_batch(self, untrusted_inputs: Sequence[str]) -> list[str]:
+        """Complete several untrusted inputs at once. With the completion method, they
+        are sent in a single request, as a list of prompts. With the chat method, which
+        has no batch form, they are sent as concurrent requests over the connection
+        pool.
+
+        :param untrusted_inputs: The untrusted inputs.
+        :raises RuntimeError: If the server didn't return an output for every input.
+        :return: The untrusted output of each input, in the same order."""
+        if not untrusted_inputs:
+            return []
+        if self.method == OpenAIMethod.CHAT:
+            with ThreadPoolExecutor(max_workers=len(untrusted_inputs)) as pool:
+                return list(pool.map(self._complete_unbatched, untrusted_inputs))
+
+        params = self._params("")
+        params["prompt"] = list(untrusted_inputs)
+        choices = self._post(params).json()["choices"]
+        outputs = {choice["index"]: self._text(choice) for choice in choices}
+        missing = [i for i in range(len(untrusted_inputs)) if i not in outputs]
+        if missing:
+            raise RuntimeError(f"The server returned no output for inputs {missing}")
+        return [outputs[i] for i in range(len(untrusted_inputs))]
+
+    def stream(self, untrusted_input: str) -> Iterator[str]:
+        """Complete the untrusted input, yielding the output as it's generated. Closing
+        the iterator closes the response, which cancels the rest of the completion.
+
+        :param untrusted_input: The untrusted input.
+        :return: The chunks of untrusted output."""
+        params = self._params(untrusted_input)
+        params["stream"] = True
+        events = iter_events(self._post(params, stream=True))
+        try:
+            for event in events:
+                for choice in event["choices"]:
+                    text = self._delta(choice)
+                    if text:
+                        yield text
+        finally:
+            events.close()
+
+    def _complete_unbatched(self, untrusted_input: str) -> str:
+        response = self._post(self._params(untrusted_input)).json()
+        return self._text(response["choices"][0])
+
+    def _params(self, untrusted_input: str) -> dict[str, Any]:
+        params: dict[str, Any] = dict(
+            model=self.model,
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+        )
+        if self.method == OpenAIMethod.CHAT:
+            params["messages"] = [{"role": "user", "content": untrusted_input}]
+        else:
+            params["prompt"] = untrusted_input
+        return params
+
+    def _post(self, params: dict[str, Any], stream: bool = False) -> Any:
+        headers = {}
+        if self.api_key is not None:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        path = (
+            "/chat/completions" if self.method == OpenAIMethod.CHAT else "/completions"
+        )
+        return self.transport.post(path, body=params, headers=headers, stream=stream)
+
+    def _text(self, choice: dict) -> str:
+        if self.method == OpenAIMethod.CHAT:
+            return choice["message"]["content"]
+        return choice["text"].strip()
+
+    def _delta(self, choice: dict) -> Optional[str]:
+        if self.method == OpenAIMethod.CHAT:
+            return choice.get("delta", {}).get("content")
+        return choice.get("text")
+
+
+class _Batcher:
+    """Collects the prompts of concurrent completions into batches. The first prompt
+    of a batch waits for the window to pass, or for the batch to fill up, and then the
+    whole batch is sent in a single request."""
+
+    def __init__(
+        self,
+        send: Callable[[list[str]], list[str]],
+        window: float,
+        max_size: int,
+    ):
+        self._send = send
+        self._window = window
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._pending: list[tuple[str, Future]] = []
+
+    def submit(self, prompt: str) -> str:
+        future: Future = Future()
+        with self._lock:
+            self._pending.append((prompt, future))
+            size = len(self._pending)
+
+        if size >= self._max_size:
+            self._flush()
+        elif size == 1:
+            time.sleep(self._window)
+            self._flush()
+        return future.result()
+
+    def _flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, []
+
+        for i in range(0, len(pending), self._max_size):
+            batch = pending[i : i + self._max_size]
+            try:
+                outputs = self._send([prompt for prompt, _ in batch])
+                # every future must be resolved, or its caller waits forever
+                if len(outputs) != len(batch):
+                    raise RuntimeError(
+                        f"Expected {len(batch)} outputs for the batch, got "
+                        f"{len(outputs)}"
+                    )
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), output in zip(batch, outputs):
+                    future.set_result(output)
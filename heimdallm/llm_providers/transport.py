@@ -0,0 +1,228 @@
+import json
+import random
+import threading
+import time
+from typing import Any, Callable, Generator, Optional
+
+import requests
+import structlog
+from requests.adapters import HTTPAdapter
+
+LOG = structlog.get_logger(__name__)
+
+#: The response statuses that are worth retrying: rate limits and server errors.
+RETRY_STATUSES = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+
+class TokenBucket:
+    """A thread-safe, client-side rate limiter. The bucket holds up to ``capacity``
+    tokens, and refills at ``rate`` tokens per second. Each request takes a token,
+    waiting for one if the bucket is empty, so that a burst of requests is smoothed out
+    to the rate, instead of being rejected by the server.
+
+    :param rate: The number of tokens added to the bucket per second.
+    :param capacity: The most tokens that the bucket can hold, which is the largest
+        burst that can be sent at once. Defaults to ``rate``.
+    :param clock: A monotonic clock, in seconds. Only useful for testing.
+    :param sleep: How to wait for a token. Only useful for testing.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: Optional[float] = None,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+
+        self.rate = rate
+        self.capacity = rate if capacity is None else capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Take tokens from the bucket, waiting until there are enough of them.
+
+        :param tokens: The number of tokens to take.
+        :return: The number of seconds that we waited.
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+
+            # the tokens are taken now, even if the bucket goes into debt, so that the
+            # callers waiting on it are served in order
+            self._tokens -= tokens
+            wait = max(0.0, -self._tokens / self.rate)
+
+        if wait:
+            self._sleep(wait)
+        return wait
+
+
+class HTTPTransport:
+    """A pooled, retrying HTTP transport for talking to an LLM provider's API.
+    Connections are kept alive and reused between requests, and between threads, so a
+    busy Bifrost doesn't pay for a new TLS handshake on every completion.
+
+    Requests that fail with a rate limit, a server error, a timeout or a broken
+    connection are retried with jittered exponential backoff, honoring the server's
+    ``Retry-After`` header. No more than ``pool_size`` requests are in flight at once;
+    the rest wait for a free connection.
+
+    :param base_url: The base URL of the API.
+    :param pool_size: The most connections to keep open, which is also the most
+        concurrent requests.
+    :param connect_timeout: The seconds to wait for a connection.
+    :param read_timeout: The seconds to wait between bytes of the response.
+    :param max_retries: The most times to retry a failed request.
+    :param backoff: The base delay, in seconds, before the first retry. The delay
+        doubles with every retry, and a random amount of it is actually waited.
+    :param max_backoff: The longest delay between retries, in seconds, including a
+        delay asked for by the server.
+    :param rate_limiter: An optional :class:`TokenBucket` that every request, including
+        every retry, takes a token from.
+    :param sleep: How to wait between retries. Only useful for testing.
+    """
+
+    def __init__(
+        self,
+        *,
+        base_url: str = "https://api.openai.com/v1",
+        pool_size: int = 10,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 60.0,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 8.0,
+        rate_limiter: Optional[TokenBucket] = None,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.rate_limiter = rate_limiter
+        self._sleep = sleep
+
+        # we do our own retries, so the adapter doesn't
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            pool_block=True,
+            max_retries=0,
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def post(
+        self,
+        path: str,
+        *,
+        body: Any,
+        headers: Optional[dict[str, str]] = None,
+        stream: bool = False,
+    ) -> requests.Response:
+        """POST a JSON body to the API, retrying until it succeeds or we run out of
+        retries.
+
+        :param path: The path of the endpoint, relative to the base URL.
+        :param body: The JSON body of the request.
+        :param headers: Any extra headers, for example, for authentication.
+        :param stream: Whether to stream the response body, instead of reading it all.
+        :raises requests.HTTPError: If the last attempt failed with an error status.
+        :raises requests.RequestException: If the last attempt failed to connect.
+        :return: The successful response.
+        """
+        url = self.base_url + "/" + path.lstrip("/")
+        log = LOG.bind(url=url)
+
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+
+            retry_after: Optional[float] = None
+            try:
+                response = self.session.post(
+                    url,
+                    json=body,
+                    headers=headers,
+                    stream=stream,
+                    timeout=self.timeout,
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise e
+                log.warning("Request failed", error=str(e), attempt=attempt)
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return response
+                if attempt == self.max_retries:
+                    response.raise_for_status()
+
+                log.warning(
+                    "Request failed", status=response.status_code, attempt=attempt
+                )
+                retry_after = _retry_after(response)
+                # release the connection back to the pool before we wait
+                response.close()
+
+            self._sleep(self._delay(attempt, retry_after))
+
+        # unreachable, but mypy doesn't know that
+        raise RuntimeError("Ran out of retries")
+
+    def close(self) -> None:
+        """Close all of the pooled connections."""
+        self.session.close()
+
+    def _delay(self, attempt: int, retry_after: Optional[float]) -> float:
+        """Full jitter: a random delay of up to the exponential backoff, so that many
+        clients that failed at once don't all retry at once too. The server's
+        ``Retry-After`` is honored, but never for longer than ``max_backoff``, so that a
+        misbehaving server can't stall the caller indefinitely."""
+        if retry_after is not None:
+            return min(max(0.0, retry_after), self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+def iter_events(response: requests.Response) -> Generator[Any, None, None]:
+    """Iterates over the JSON data of a response of server-sent events, until the
+    ``[DONE]`` event. The response is closed when the iterator is, which cancels the
+    rest of the response.
+
+    :param response: The streamed response.
+    :return: The data of each event.
+    """
+    try:
+        for line in response.iter_lines():
+            if not line.startswith(b"data:"):
+                continue
+            data = line[len(b"data:") :].strip()
+            if data == b"[DONE]":
+                break
+            yield json.loads(data)
+    finally:
+        response.close()